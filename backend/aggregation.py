@@ -0,0 +1,529 @@
+from __future__ import annotations
+
+import hashlib
+import struct
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date
+from itertools import product
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from .domain import SurveyResponse
+
+
+DATA_VERSION_LANES = 4
+DATA_VERSION_LANE_MASK = (1 << 64) - 1
+EMPTY_DATA_VERSION_HASH = "0" * 16 * DATA_VERSION_LANES
+_LANES_STRUCT = struct.Struct(">4Q")
+HISTOGRAM_QUESTION_TYPES = ("scale", "singlechoice", "multichoice")
+CROSSTAB_DIMENSIONS = (2, 3)
+DEFAULT_SCALE_RANGE = (1, 5)
+MASKED_VALUE = "X"
+TREND_GRANULARITIES = ("day", "week", "month")
+
+
+@dataclass(frozen=True)
+class QuestionLayout:
+    key: str
+    type: str
+    options: Tuple[Any, ...]
+    positions: Dict[Any, int]
+
+
+@dataclass(frozen=True)
+class SurveyLayout:
+    questions: Tuple[QuestionLayout, ...] = ()
+    crosstabs: Tuple[Tuple[QuestionLayout, ...], ...] = ()
+
+    def members(self, question_keys: Sequence[str]) -> Optional[Tuple[QuestionLayout, ...]]:
+        if len(question_keys) not in CROSSTAB_DIMENSIONS or len(set(question_keys)) != len(question_keys):
+            return None
+        by_key = {question.key: question for question in self.questions}
+        if any(key not in by_key for key in question_keys):
+            return None
+        return tuple(by_key[key] for key in question_keys)
+
+
+def question_key(question: Dict[str, Any], index: int) -> str:
+    return str(question.get("id") or f"q{index + 1}")
+
+
+def crosstab_key(question_keys: Sequence[str]) -> str:
+    return "|".join(question_keys)
+
+
+def build_layout(schema: Dict[str, Any]) -> SurveyLayout:
+    questions = []
+    for index, question in enumerate(schema.get("questions", [])):
+        q_type = question.get("type")
+        if q_type not in HISTOGRAM_QUESTION_TYPES:
+            continue
+        options = _question_options(question)
+        positions: Dict[Any, int] = {}
+        for position, option in enumerate(options):
+            positions[option] = position
+            positions.setdefault(str(option), position)
+        questions.append(QuestionLayout(question_key(question, index), q_type, tuple(options), positions))
+    layout = SurveyLayout(questions=tuple(questions))
+    crosstabs = []
+    for question_keys in schema.get("crosstabs", []):
+        members = layout.members(question_keys)
+        if members is not None:
+            crosstabs.append(members)
+    return SurveyLayout(questions=layout.questions, crosstabs=tuple(crosstabs))
+
+
+def _question_options(question: Dict[str, Any]) -> List[Any]:
+    if question.get("options"):
+        return list(question["options"])
+    if question.get("type") == "scale":
+        low = question.get("min", DEFAULT_SCALE_RANGE[0])
+        high = question.get("max", DEFAULT_SCALE_RANGE[1])
+        return list(range(low, high + 1))
+    return []
+
+
+def response_lanes(response_id: int) -> Tuple[int, ...]:
+    return _LANES_STRUCT.unpack(hashlib.sha256(str(response_id).encode("utf-8")).digest())
+
+
+def _parse_lanes(data_version_hash: str) -> List[int]:
+    return [int(data_version_hash[lane * 16 : lane * 16 + 16], 16) for lane in range(DATA_VERSION_LANES)]
+
+
+def data_version_from_lanes(lanes: Sequence[int]) -> str:
+    return "".join(f"{lane & DATA_VERSION_LANE_MASK:016x}" for lane in lanes)
+
+
+def add_to_data_version(data_version_hash: str, response_id: int) -> str:
+    lanes = _parse_lanes(data_version_hash)
+    return data_version_from_lanes([lane + added for lane, added in zip(lanes, response_lanes(response_id))])
+
+
+def combine_data_versions(*data_version_hashes: str) -> str:
+    lanes = [0] * DATA_VERSION_LANES
+    for data_version_hash in data_version_hashes:
+        lanes = [lane + added for lane, added in zip(lanes, _parse_lanes(data_version_hash))]
+    return data_version_from_lanes(lanes)
+
+
+def data_version_for(response_ids: Iterable[int]) -> str:
+    sha256 = hashlib.sha256
+    unpack = _LANES_STRUCT.unpack
+    first = second = third = fourth = 0
+    for response_id in response_ids:
+        a, b, c, d = unpack(sha256(str(response_id).encode("utf-8")).digest())
+        first += a
+        second += b
+        third += c
+        fourth += d
+    return data_version_from_lanes((first, second, third, fourth))
+
+
+def trend_buckets(submitted_on: str) -> Dict[str, str]:
+    day = date.fromisoformat(submitted_on[:10])
+    year, week, _ = day.isocalendar()
+    return {"day": day.isoformat(), "week": f"{year}-W{week:02d}", "month": day.isoformat()[:7]}
+
+
+def _empty_trend() -> Dict[str, Dict[str, int]]:
+    return {granularity: {} for granularity in TREND_GRANULARITIES}
+
+
+def _trend_from_days(day_counts: Iterable[Tuple[Optional[str], int]]) -> Dict[str, Dict[str, int]]:
+    trend = _empty_trend()
+    for submitted_on, count in day_counts:
+        if not submitted_on:
+            continue
+        for granularity, bucket in trend_buckets(submitted_on).items():
+            trend[granularity][bucket] = trend[granularity].get(bucket, 0) + count
+    return {granularity: dict(sorted(buckets.items())) for granularity, buckets in trend.items()}
+
+
+def empty_metrics(layout: SurveyLayout = SurveyLayout()) -> Dict[str, Any]:
+    metrics = _empty_slice(layout)
+    metrics["kommuner"] = {}
+    metrics["crosstabs"] = {
+        crosstab_key([question.key for question in members]): _empty_crosstab(members) for members in layout.crosstabs
+    }
+    metrics["trend"] = _empty_trend()
+    return metrics
+
+
+def _empty_slice(layout: SurveyLayout) -> Dict[str, Any]:
+    return {"total": 0, "questions": {question.key: _empty_question(question) for question in layout.questions}}
+
+
+def _empty_question(question: QuestionLayout) -> Dict[str, Any]:
+    return {"type": question.type, "counts": [0] * len(question.options), "answered": 0}
+
+
+def _empty_crosstab(members: Sequence[QuestionLayout]) -> Dict[str, Any]:
+    return {"questions": [question.key for question in members], "cells": {}}
+
+
+def _answer_positions(question: QuestionLayout, value: Any) -> List[int]:
+    if value is None:
+        return []
+    if question.type == "multichoice":
+        values = value if isinstance(value, (list, tuple)) else [value]
+        positions = {question.positions.get(item) for item in values if isinstance(item, (str, int))}
+        positions.discard(None)
+        return sorted(positions)
+    if not isinstance(value, (str, int)):
+        return []
+    position = question.positions.get(value)
+    return [] if position is None else [position]
+
+
+def _cell_keys(members: Sequence[QuestionLayout], values: Sequence[Any]) -> List[str]:
+    positions = [_answer_positions(question, value) for question, value in zip(members, values)]
+    if not all(positions):
+        return []
+    return [":".join(str(position) for position in cell) for cell in product(*positions)]
+
+
+def fold_response(
+    metrics: Dict[str, Any], response: SurveyResponse, layout: SurveyLayout = SurveyLayout()
+) -> Dict[str, Any]:
+    folded = _fold_slice(metrics, response, layout)
+    if response.kommun:
+        kommuner = folded["kommuner"] = dict(metrics.get("kommuner", {}))
+        kommuner[response.kommun] = _fold_slice(kommuner.get(response.kommun) or _empty_slice(layout), response, layout)
+    crosstabs = folded["crosstabs"] = dict(metrics.get("crosstabs", {}))
+    for members in layout.crosstabs:
+        cell_keys = _cell_keys(members, [response.answers.get(question.key) for question in members])
+        if not cell_keys:
+            continue
+        key = crosstab_key([question.key for question in members])
+        entry = crosstabs.get(key) or _empty_crosstab(members)
+        cells = dict(entry["cells"])
+        for cell_key in cell_keys:
+            cells[cell_key] = cells.get(cell_key, 0) + 1
+        crosstabs[key] = {**entry, "cells": cells}
+    if response.submitted_on:
+        trend = folded["trend"] = {
+            granularity: dict(buckets) for granularity, buckets in (metrics.get("trend") or _empty_trend()).items()
+        }
+        for granularity, bucket in trend_buckets(response.submitted_on).items():
+            buckets = trend.setdefault(granularity, {})
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+    return folded
+
+
+def _fold_slice(metrics_slice: Dict[str, Any], response: SurveyResponse, layout: SurveyLayout) -> Dict[str, Any]:
+    folded = dict(metrics_slice)
+    folded["total"] = metrics_slice.get("total", 0) + 1
+    questions = folded["questions"] = dict(metrics_slice.get("questions", {}))
+    for question in layout.questions:
+        positions = _answer_positions(question, response.answers.get(question.key))
+        if not positions:
+            continue
+        entry = questions.get(question.key) or _empty_question(question)
+        counts = list(entry["counts"])
+        for position in positions:
+            counts[position] += 1
+        questions[question.key] = {**entry, "counts": counts, "answered": entry["answered"] + 1}
+    return folded
+
+
+def aggregate_responses(responses: Sequence[SurveyResponse], layout: SurveyLayout) -> Dict[str, Any]:
+    metrics = _aggregate_slice(responses, layout)
+    by_kommun: Dict[str, List[SurveyResponse]] = {}
+    for response in responses:
+        if response.kommun:
+            by_kommun.setdefault(response.kommun, []).append(response)
+    metrics["kommuner"] = {kommun: _aggregate_slice(by_kommun[kommun], layout) for kommun in sorted(by_kommun)}
+    metrics["crosstabs"] = {}
+    for members in layout.crosstabs:
+        entry = _empty_crosstab(members)
+        entry["cells"] = count_crosstab(responses, members)
+        metrics["crosstabs"][crosstab_key(entry["questions"])] = entry
+    metrics["trend"] = _trend_from_days(Counter(response.submitted_on for response in responses).items())
+    return metrics
+
+
+def count_crosstab(responses: Sequence[SurveyResponse], members: Sequence[QuestionLayout]) -> Dict[str, int]:
+    rows = [[response.answers.get(question.key) for question in members] for response in responses]
+    try:
+        combinations = Counter(tuple(_hashable(value) for value in row) for row in rows)
+    except TypeError:
+        return _cells_from_combinations(members, ((row, 1) for row in rows))
+    return _cells_from_combinations(members, combinations.items())
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _cells_from_combinations(
+    members: Sequence[QuestionLayout], combinations: Iterable[Tuple[Sequence[Any], int]]
+) -> Dict[str, int]:
+    cells: Dict[str, int] = {}
+    for values, count in combinations:
+        for cell_key in _cell_keys(members, values):
+            cells[cell_key] = cells.get(cell_key, 0) + count
+    return cells
+
+
+def aggregate_chunk(responses: Sequence[SurveyResponse], layout: SurveyLayout) -> Tuple[Dict[str, Any], str]:
+    return aggregate_responses(responses, layout), data_version_for(response.id for response in responses)
+
+
+def aggregate_grouped_counts(
+    layout: SurveyLayout,
+    kommun_totals: Dict[Optional[str], int],
+    value_counts: Iterable[Tuple[Optional[str], str, Any, int]],
+    crosstab_counts: Optional[Dict[str, Iterable[Tuple[Sequence[Any], int]]]] = None,
+    day_counts: Iterable[Tuple[Optional[str], int]] = (),
+) -> Dict[str, Any]:
+    questions = {question.key: question for question in layout.questions}
+    metrics = _empty_slice(layout)
+    metrics["total"] = sum(kommun_totals.values())
+    cells = {}
+    for kommun in sorted(kommun for kommun in kommun_totals if kommun):
+        cells[kommun] = _empty_slice(layout)
+        cells[kommun]["total"] = kommun_totals[kommun]
+    for kommun, key, value, count in value_counts:
+        question = questions.get(key)
+        if question is None:
+            continue
+        positions = _answer_positions(question, value)
+        if not positions:
+            continue
+        targets = [metrics, cells[kommun]] if kommun in cells else [metrics]
+        for target in targets:
+            entry = target["questions"][key]
+            for position in positions:
+                entry["counts"][position] += count
+            entry["answered"] += count
+    metrics["kommuner"] = cells
+    metrics["crosstabs"] = {}
+    for members in layout.crosstabs:
+        entry = _empty_crosstab(members)
+        key = crosstab_key(entry["questions"])
+        entry["cells"] = _cells_from_combinations(members, (crosstab_counts or {}).get(key, []))
+        metrics["crosstabs"][key] = entry
+    metrics["trend"] = _trend_from_days(day_counts)
+    return metrics
+
+
+def merge_metrics(partials: Sequence[Dict[str, Any]], layout: SurveyLayout) -> Dict[str, Any]:
+    merged = _merge_slices(partials, layout)
+    kommuner: Dict[str, List[Dict[str, Any]]] = {}
+    for partial in partials:
+        for kommun, cell in partial.get("kommuner", {}).items():
+            kommuner.setdefault(kommun, []).append(cell)
+    merged["kommuner"] = {kommun: _merge_slices(kommuner[kommun], layout) for kommun in sorted(kommuner)}
+    merged["crosstabs"] = {}
+    for members in layout.crosstabs:
+        entry = _empty_crosstab(members)
+        key = crosstab_key(entry["questions"])
+        for partial in partials:
+            for cell_key, count in partial.get("crosstabs", {}).get(key, {}).get("cells", {}).items():
+                entry["cells"][cell_key] = entry["cells"].get(cell_key, 0) + count
+        merged["crosstabs"][key] = entry
+    trend = _empty_trend()
+    for partial in partials:
+        for granularity, buckets in partial.get("trend", {}).items():
+            target = trend.setdefault(granularity, {})
+            for bucket, count in buckets.items():
+                target[bucket] = target.get(bucket, 0) + count
+    merged["trend"] = {granularity: dict(sorted(buckets.items())) for granularity, buckets in trend.items()}
+    return merged
+
+
+def _merge_slices(slices: Sequence[Dict[str, Any]], layout: SurveyLayout) -> Dict[str, Any]:
+    merged = _empty_slice(layout)
+    for metrics_slice in slices:
+        merged["total"] += metrics_slice.get("total", 0)
+        for key, entry in metrics_slice.get("questions", {}).items():
+            target = merged["questions"].get(key)
+            if target is None:
+                merged["questions"][key] = {**entry, "counts": list(entry["counts"])}
+                continue
+            target["counts"] = [left + right for left, right in zip(target["counts"], entry["counts"])]
+            target["answered"] += entry["answered"]
+    return merged
+
+
+def _aggregate_slice(responses: Sequence[SurveyResponse], layout: SurveyLayout) -> Dict[str, Any]:
+    metrics_slice = _empty_slice(layout)
+    metrics_slice["total"] = len(responses)
+    for question in layout.questions:
+        column = [response.answers.get(question.key) for response in responses]
+        counts, answered = _count_column(question, column)
+        metrics_slice["questions"][question.key] = {
+            "type": question.type,
+            "counts": counts.tolist(),
+            "answered": answered,
+        }
+    return metrics_slice
+
+
+def _count_column(question: QuestionLayout, column: List[Any]) -> Tuple[array, int]:
+    counts = array("q", [0]) * len(question.options)
+    if question.type == "multichoice":
+        try:
+            combinations = Counter(
+                tuple(value) if isinstance(value, (list, tuple)) else (value,) for value in column if value is not None
+            )
+        except TypeError:
+            return _count_column_slow(question, column)
+        answered = 0
+        for combination, count in combinations.items():
+            positions = _answer_positions(question, combination)
+            if positions:
+                answered += count
+                for position in positions:
+                    counts[position] += count
+        return counts, answered
+    try:
+        tally = Counter(column)
+    except TypeError:
+        tally = Counter(value for value in column if isinstance(value, (str, int)))
+    for value, count in tally.items():
+        position = question.positions.get(value) if isinstance(value, (str, int)) else None
+        if position is not None:
+            counts[position] += count
+    return counts, sum(counts)
+
+
+def _count_column_slow(question: QuestionLayout, column: List[Any]) -> Tuple[array, int]:
+    counts = array("q", [0]) * len(question.options)
+    answered = 0
+    for value in column:
+        positions = _answer_positions(question, value)
+        if positions:
+            answered += 1
+            for position in positions:
+                counts[position] += 1
+    return counts, answered
+
+
+def mask_count(count: int, min_responses: int) -> Union[int, str]:
+    return MASKED_VALUE if count < min_responses else count
+
+
+def suppressed_keys(
+    values: Dict[Hashable, int], groups: Iterable[Sequence[Hashable]], min_responses: int
+) -> Set[Hashable]:
+    masked = {key for key, value in values.items() if value < min_responses}
+    groups = [group for group in groups if len(group) > 1]
+    changed = bool(masked)
+    while changed:
+        changed = False
+        for group in groups:
+            hidden = [key for key in group if key in masked]
+            visible = [key for key in group if key not in masked]
+            if len(hidden) == 1 and visible:
+                masked.add(min(visible, key=lambda key: (values[key], key)))
+                changed = True
+    return masked
+
+
+def mask_counts(counts: Iterable[int], min_responses: int) -> List[Union[int, str]]:
+    values = dict(enumerate(counts))
+    masked = suppressed_keys(values, [list(values)], min_responses)
+    return [MASKED_VALUE if index in masked else count for index, count in values.items()]
+
+
+def reported_kommuner(metrics: Dict[str, Any], min_responses: int) -> Tuple[str, ...]:
+    kommuner = metrics.get("kommuner", {})
+    return tuple(sorted(kommun for kommun, cell in kommuner.items() if cell["total"] >= min_responses))
+
+
+def kommun_slice(metrics: Dict[str, Any], kommun: str) -> Dict[str, Any]:
+    cell = metrics.get("kommuner", {}).get(kommun)
+    if cell is not None:
+        return cell
+    questions = {
+        key: {"type": entry["type"], "counts": [0] * len(entry["counts"]), "answered": 0}
+        for key, entry in metrics.get("questions", {}).items()
+    }
+    return {"total": 0, "questions": questions}
+
+
+def mask_slice(metrics_slice: Dict[str, Any], min_responses: int) -> Dict[str, Any]:
+    total = metrics_slice.get("total", 0)
+    masked = total < min_responses
+    questions = {}
+    for key, entry in metrics_slice.get("questions", {}).items():
+        if masked:
+            counts: List[Union[int, str]] = [MASKED_VALUE] * len(entry["counts"])
+            answered: Union[int, str] = MASKED_VALUE
+        else:
+            counts = mask_counts(entry["counts"], min_responses)
+            answered = mask_count(entry["answered"], min_responses)
+        questions[key] = {"type": entry["type"], "counts": counts, "answered": answered}
+    return {"total": MASKED_VALUE if masked else total, "masked": masked, "questions": questions}
+
+
+def mask_trend(metrics: Dict[str, Any], granularity: str, min_responses: int) -> List[Dict[str, Any]]:
+    trend = metrics.get("trend", {})
+    values = {bucket: count for buckets in trend.values() for bucket, count in buckets.items()}
+    groups: List[List[str]] = [list(buckets) for buckets in trend.values()]
+    parents: Dict[str, List[str]] = {}
+    for day in trend.get("day", {}):
+        for parent_granularity, parent in trend_buckets(day).items():
+            if parent_granularity != "day" and parent in values:
+                parents.setdefault(parent, [parent]).append(day)
+    masked = suppressed_keys(values, [*groups, *parents.values()], min_responses)
+    buckets = trend.get(granularity, {})
+    return [
+        {"bucket": bucket, "count": MASKED_VALUE if bucket in masked else buckets[bucket]} for bucket in sorted(buckets)
+    ]
+
+
+def question_series(metrics_slice: Dict[str, Any], key: str, min_responses: int) -> Optional[Dict[str, Any]]:
+    entry = metrics_slice.get("questions", {}).get(key)
+    if entry is None:
+        return None
+    if metrics_slice.get("total", 0) < min_responses:
+        return {"counts": [MASKED_VALUE] * len(entry["counts"]), "answered": MASKED_VALUE}
+    return {
+        "counts": mask_counts(entry["counts"], min_responses),
+        "answered": mask_count(entry["answered"], min_responses),
+    }
+
+
+def _masked_grid(
+    entry: Dict[str, Any], members: Sequence[QuestionLayout], min_responses: int
+) -> Tuple[Dict[Tuple[int, ...], int], Set[Tuple[int, ...]]]:
+    values = {
+        position: entry["cells"].get(":".join(str(part) for part in position), 0)
+        for position in product(*(range(len(question.options)) for question in members))
+    }
+    lines: Dict[Tuple[int, Tuple[int, ...]], List[Tuple[int, ...]]] = {}
+    for position in values:
+        for axis in range(len(position)):
+            lines.setdefault((axis, position[:axis] + position[axis + 1 :]), []).append(position)
+    return values, suppressed_keys(values, lines.values(), min_responses)
+
+
+def crosstab_matrix(entry: Dict[str, Any], members: Sequence[QuestionLayout], min_responses: int) -> List[Any]:
+    values, masked = _masked_grid(entry, members, min_responses)
+
+    def build(prefix: Tuple[int, ...]) -> Any:
+        if len(prefix) == len(members):
+            return MASKED_VALUE if prefix in masked else values[prefix]
+        return [build(prefix + (position,)) for position in range(len(members[len(prefix)].options))]
+
+    return build(())
+
+
+def mask_crosstab(
+    entry: Dict[str, Any], members: Sequence[QuestionLayout], min_responses: int
+) -> Dict[str, Any]:
+    values, masked = _masked_grid(entry, members, min_responses)
+    cells = [
+        [*position, MASKED_VALUE if position in masked else count]
+        for position, count in values.items()
+        if count or position in masked
+    ]
+    return {
+        "questions": [question.key for question in members],
+        "options": [list(question.options) for question in members],
+        "cells": cells,
+    }
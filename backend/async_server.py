@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import signal
+import socket
+from concurrent.futures import Executor, ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from http.client import HTTPMessage, parse_headers
+from typing import Optional, Set, Tuple
+
+from .bundles import ReportBundleWriter
+from .routes import SECURITY_HEADERS, Response, Router
+from .storage import InMemoryStores
+
+MAX_HEADER_BYTES = 65536
+MAX_BODY_BYTES = 8192
+KEEP_ALIVE_TIMEOUT = 15.0
+SHUTDOWN_TIMEOUT = 10.0
+MAX_CONCURRENCY = 64
+SERVER_NAME = "npf-hubben"
+
+
+class _BadRequest(Exception):
+    pass
+
+
+class _PayloadTooLarge(Exception):
+    pass
+
+
+class _InvalidHeader(Exception):
+    pass
+
+
+class AsyncReportServer:
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        stores: InMemoryStores | None = None,
+        bundles: ReportBundleWriter | None = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        keep_alive_timeout: float = KEEP_ALIVE_TIMEOUT,
+        executor: Optional[Executor] = None,
+        sock: Optional[socket.socket] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.router = Router(stores if stores is not None else InMemoryStores(), bundles)
+        self.max_concurrency = max_concurrency
+        self.keep_alive_timeout = keep_alive_timeout
+        self._executor = executor
+        self._owns_executor = executor is None
+        self.sock = sock
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.Server] = None
+        self._idle: Set[asyncio.StreamWriter] = set()
+        self._busy = 0
+        self._closing = False
+
+    @property
+    def server_address(self) -> Tuple[str, int]:
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self) -> "AsyncReportServer":
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="report-io")
+        if self.sock is not None:
+            self._server = await asyncio.start_server(self._serve_connection, sock=self.sock, limit=MAX_HEADER_BYTES)
+        else:
+            self._server = await asyncio.start_server(
+                self._serve_connection, self.host, self.port, limit=MAX_HEADER_BYTES
+            )
+        return self
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._idle):
+            writer.close()
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self._busy and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+        await self.close()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            keep_alive = not self._closing
+            while keep_alive:
+                self._idle.add(writer)
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keep_alive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except (_BadRequest, asyncio.LimitOverrunError, ValueError):
+                    await self._write(writer, self._error(400, "bad_request"), keep_alive=False)
+                    break
+                except _PayloadTooLarge:
+                    await self._write(writer, self._error(413, "payload_too_large"), keep_alive=False)
+                    break
+                finally:
+                    self._idle.discard(writer)
+                if request is None:
+                    break
+                self._busy += 1
+                try:
+                    keep_alive = await self._respond(writer, *request)
+                finally:
+                    self._busy -= 1
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _respond(
+        self, writer: asyncio.StreamWriter, method: str, target: str, version: str, headers: HTTPMessage
+    ) -> bool:
+        keep_alive = self._keep_alive(version, headers) and not self._closing
+        if method not in ("GET", "HEAD"):
+            response = self._error(405, "method_not_allowed")
+            response.headers.append(("Allow", "GET, HEAD"))
+        else:
+            async with self._slots:
+                try:
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, self.router.handle, target, headers
+                    )
+                except Exception:
+                    response, keep_alive = self._error(500, "internal_error"), False
+        try:
+            try:
+                await self._write(writer, response, keep_alive, head=method == "HEAD")
+            except _InvalidHeader:
+                keep_alive = False
+                await self._write(writer, self._error(500, "internal_error"), keep_alive, head=method == "HEAD")
+        finally:
+            response.close()
+        return keep_alive
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        while line in (b"\r\n", b"\n"):
+            line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise _BadRequest()
+        block = bytearray()
+        while True:
+            header_line = await reader.readline()
+            if not header_line:
+                return None
+            block += header_line
+            if len(block) > MAX_HEADER_BYTES:
+                raise _BadRequest()
+            if header_line in (b"\r\n", b"\n"):
+                break
+        headers: HTTPMessage = parse_headers(io.BytesIO(bytes(block)))
+        length = headers.get("Content-Length")
+        if headers.get("Transfer-Encoding"):
+            raise _BadRequest()
+        if length:
+            size = int(length)
+            if size < 0:
+                raise _BadRequest()
+            if size > MAX_BODY_BYTES:
+                raise _PayloadTooLarge()
+            await reader.readexactly(size)
+        return parts[0], parts[1], parts[2], headers
+
+    def _keep_alive(self, version: str, headers: HTTPMessage) -> bool:
+        connection = (headers.get("Connection") or "").lower()
+        if version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def _error(self, status: int, error: str) -> Response:
+        body = f'{{"error": "{error}"}}'.encode("utf-8")
+        return Response(status, [("Content-Type", "application/json; charset=utf-8"), *SECURITY_HEADERS], body)
+
+    async def _write(
+        self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool, head: bool = False
+    ) -> None:
+        if any(set(f"{name}{value}") & {"\r", "\n"} for name, value in response.headers):
+            raise _InvalidHeader()
+        phrase = HTTPStatus(response.status).phrase
+        lines = [
+            f"HTTP/1.1 {response.status} {phrase}",
+            f"Server: {SERVER_NAME}",
+            f"Date: {formatdate(usegmt=True)}",
+            *(f"{name}: {value}" for name, value in response.headers),
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if response.status != 304:
+            lines.append(f"Content-Length: {response.content_length}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if head or response.status == 304:
+            await writer.drain()
+            return
+        if response.file is None:
+            writer.write(response.body)
+            await writer.drain()
+            return
+        await writer.drain()
+        await asyncio.get_running_loop().sendfile(writer.transport, response.file, 0, response.file_size)
+
+
+async def serve(
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    stores: InMemoryStores | None = None,
+    bundles: ReportBundleWriter | None = None,
+    max_concurrency: int = MAX_CONCURRENCY,
+    sock: Optional[socket.socket] = None,
+) -> None:
+    server = AsyncReportServer(
+        host, port, stores=stores, bundles=bundles, max_concurrency=max_concurrency, sock=sock
+    )
+    await server.start()
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        await server.shutdown()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+MANIFEST_NAME = "manifest.json"
+
+
+class ReportBundleWriter:
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def bundle_dir(self, canonical_url: str) -> str:
+        return os.path.join(self.root, quote(canonical_url.strip("/"), safe=""))
+
+    def write(
+        self,
+        canonical_url: str,
+        version_id: int,
+        survey_id: int,
+        data_version_hash: str,
+        payloads: Dict[str, Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        staging = tempfile.mkdtemp(prefix=".bundle-", dir=self.root)
+        manifest: Dict[str, Any] = {
+            "canonical_url": canonical_url,
+            "version_id": version_id,
+            "survey_id": survey_id,
+            "data_version_hash": data_version_hash,
+            "kommuner": {},
+        }
+        try:
+            for kommun in sorted(payloads):
+                body = json.dumps({"canonical_url": canonical_url, "payload": payloads[kommun]}).encode("utf-8")
+                filename = f"{quote(kommun, safe='')}.json"
+                with open(os.path.join(staging, filename), "wb") as handle:
+                    handle.write(body)
+                manifest["kommuner"][kommun] = {"file": filename, "bytes": len(body)}
+            with open(os.path.join(staging, MANIFEST_NAME), "w", encoding="utf-8") as handle:
+                json.dump(manifest, handle, ensure_ascii=False, sort_keys=True)
+            with self._lock:
+                target = self.bundle_dir(canonical_url)
+                self._remove(target)
+                os.replace(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return manifest
+
+    def path_for(self, canonical_url: str, kommun: str) -> Optional[str]:
+        path = os.path.join(self.bundle_dir(canonical_url), f"{quote(kommun, safe='')}.json")
+        return path if os.path.isfile(path) else None
+
+    def manifest(self, canonical_url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.bundle_dir(canonical_url), MANIFEST_NAME), encoding="utf-8") as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def discard(self, canonical_url: str) -> None:
+        with self._lock:
+            self._remove(self.bundle_dir(canonical_url))
+
+    def _remove(self, path: str) -> None:
+        if os.path.isdir(path):
+            graveyard = tempfile.mkdtemp(prefix=".discard-", dir=self.root)
+            os.replace(path, os.path.join(graveyard, "bundle"))
+            shutil.rmtree(graveyard, ignore_errors=True)
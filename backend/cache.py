@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .library import ReportLibraryIndex
+from .terms import TermSketch
+
+
+class LruCache:
+    def __init__(self, maxsize: int = 256):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            expired = [key for key in self._entries if predicate(key)]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class StoreCaches:
+    def __init__(self):
+        self.crosstabs = LruCache(maxsize=128)
+        self.templates = LruCache(maxsize=256)
+        self.report_payloads = LruCache(maxsize=1024)
+        self.series = LruCache(maxsize=2048)
+        self.compressed_bodies = LruCache(maxsize=512)
+        self.term_sketches: Dict[int, TermSketch] = {}
+        self.library: Optional[ReportLibraryIndex] = None
+        self.library_revision: Optional[int] = None
+        self.lock = threading.RLock()
+
+    def discard_report_payloads(
+        self, survey_id: Optional[int] = None, keep_hash: Optional[str] = None, keep_min_responses: Optional[int] = None
+    ) -> int:
+        keep = (keep_hash, keep_min_responses)
+        return self.report_payloads.discard_where(
+            lambda key: (survey_id is None or key[0] == survey_id) and (key[3], key[4]) != keep
+        )
+
+
+_STORE_CACHES: "weakref.WeakKeyDictionary[Any, StoreCaches]" = weakref.WeakKeyDictionary()
+_STORE_CACHES_LOCK = threading.Lock()
+
+
+def caches_for(store: Any) -> StoreCaches:
+    with _STORE_CACHES_LOCK:
+        caches: Optional[StoreCaches] = _STORE_CACHES.get(store)
+        if caches is None:
+            caches = StoreCaches()
+            _STORE_CACHES[store] = caches
+        return caches
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import gzip
+import importlib.util
+from typing import Dict, Optional
+
+HAS_BROTLI = importlib.util.find_spec("brotli") is not None
+HAS_ZSTD = importlib.util.find_spec("zstandard") is not None
+if HAS_BROTLI:
+    import brotli
+if HAS_ZSTD:
+    import zstandard
+
+MIN_COMPRESS_BYTES = 1024
+SUPPORTED_ENCODINGS = tuple(
+    encoding for encoding, available in (("zstd", HAS_ZSTD), ("br", HAS_BROTLI), ("gzip", True)) if available
+)
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+def negotiate_encoding(header: Optional[str]) -> Optional[str]:
+    weights = parse_accept_encoding(header)
+    best = None
+    best_weight = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(encoding: str, body: bytes) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    if encoding == "br" and HAS_BROTLI:
+        return brotli.compress(body, quality=9)
+    if encoding == "zstd" and HAS_ZSTD:
+        return zstandard.ZstdCompressor(level=10).compress(body)
+    raise ValueError(f"unsupported encoding: {encoding}")
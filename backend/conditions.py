@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import operator
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .aggregation import MASKED_VALUE, SurveyLayout, mask_counts
+from .domain import AggregationSnapshot, ValidationError
+
+Condition = Callable[[AggregationSnapshot, str], bool]
+Getter = Callable[[AggregationSnapshot, str], Any]
+Entry = Callable[[AggregationSnapshot, str], Tuple[Dict[str, Any], Dict[str, Any]]]
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+        (?P<number>\d+(?:\.\d+)?)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<op><=|>=|==|!=|<|>)
+      | (?P<punct>[(),])
+      | (?P<name>[^\W\d]\w*)
+    )""",
+    re.VERBOSE | re.UNICODE,
+)
+COMPARISONS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+KEYWORDS = {"and", "or", "not", "true", "false"}
+
+
+def always(snapshot: AggregationSnapshot, kommun: str) -> bool:
+    return True
+
+
+def tokenize_condition(source: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    source = source.rstrip()
+    while position < len(source):
+        match = TOKEN_PATTERN.match(source, position)
+        if match is None or match.end() == position:
+            raise ValidationError("invalid_condition")
+        kind = match.lastgroup or ""
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+def _kommun_cell(snapshot: AggregationSnapshot, kommun: str) -> Dict[str, Any]:
+    return snapshot.metrics.get("kommuner", {}).get(kommun) or {}
+
+
+def _slice(scope: str) -> Callable[[AggregationSnapshot, str], Dict[str, Any]]:
+    if scope == "kommun":
+        return _kommun_cell
+    return lambda snapshot, kommun: snapshot.metrics
+
+
+def _visible(value: Any, metrics_slice: Dict[str, Any], snapshot: AggregationSnapshot) -> Any:
+    if metrics_slice.get("total", 0) < snapshot.min_responses or value < snapshot.min_responses:
+        return None
+    return value
+
+
+def _visible_count(
+    found: Dict[str, Any], position: int, metrics_slice: Dict[str, Any], snapshot: AggregationSnapshot
+) -> Optional[int]:
+    if not found:
+        return _visible(0, metrics_slice, snapshot)
+    if metrics_slice.get("total", 0) < snapshot.min_responses:
+        return None
+    value = mask_counts(found["counts"], snapshot.min_responses)[position]
+    return None if value == MASKED_VALUE else value
+
+
+def _total(scope: str) -> Getter:
+    cell = _slice(scope)
+
+    def getter(snapshot: AggregationSnapshot, kommun: str) -> Optional[int]:
+        found = cell(snapshot, kommun)
+        return _visible(found.get("total", 0), found, snapshot)
+
+    return getter
+
+
+def _question_entry(scope: str, key: str) -> Entry:
+    cell = _slice(scope)
+
+    def entry(snapshot: AggregationSnapshot, kommun: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        found = cell(snapshot, kommun)
+        return found, found.get("questions", {}).get(key) or {}
+
+    return entry
+
+
+def _count(entry: Entry, position: int) -> Getter:
+    def getter(snapshot: AggregationSnapshot, kommun: str) -> Optional[int]:
+        metrics_slice, found = entry(snapshot, kommun)
+        return _visible_count(found, position, metrics_slice, snapshot)
+
+    return getter
+
+
+def _answered(entry: Entry) -> Getter:
+    def getter(snapshot: AggregationSnapshot, kommun: str) -> Optional[int]:
+        metrics_slice, found = entry(snapshot, kommun)
+        return _visible(found.get("answered", 0), metrics_slice, snapshot)
+
+    return getter
+
+
+def _share(entry: Entry, position: int) -> Getter:
+    def getter(snapshot: AggregationSnapshot, kommun: str) -> Optional[float]:
+        metrics_slice, found = entry(snapshot, kommun)
+        count = _visible_count(found, position, metrics_slice, snapshot)
+        answered = _visible(found.get("answered", 0), metrics_slice, snapshot)
+        if count is None or answered is None:
+            return None
+        return count / answered if answered else 0.0
+
+    return getter
+
+
+def _kommun_masked(snapshot: AggregationSnapshot, kommun: str) -> bool:
+    return _kommun_cell(snapshot, kommun).get("total", 0) < snapshot.min_responses
+
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, str]], layout: SurveyLayout):
+        self.tokens = tokens
+        self.index = 0
+        self.kommun_scoped = False
+        self.questions = {question.key: question for question in layout.questions}
+
+    def parse(self) -> Getter:
+        node = self._or()
+        if self.index != len(self.tokens):
+            raise ValidationError("invalid_condition")
+        return node
+
+    def _peek(self) -> Tuple[str, str]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else ("", "")
+
+    def _take(self, value: Optional[str] = None) -> Tuple[str, str]:
+        token = self._peek()
+        if not token[0] or (value is not None and token[1] != value):
+            raise ValidationError("invalid_condition")
+        self.index += 1
+        return token
+
+    def _or(self) -> Getter:
+        operands = [self._and()]
+        while self._peek() == ("name", "or"):
+            self._take()
+            operands.append(self._and())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda snapshot, kommun: any(operand(snapshot, kommun) for operand in operands)
+
+    def _and(self) -> Getter:
+        operands = [self._not()]
+        while self._peek() == ("name", "and"):
+            self._take()
+            operands.append(self._not())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda snapshot, kommun: all(operand(snapshot, kommun) for operand in operands)
+
+    def _not(self) -> Getter:
+        if self._peek() == ("name", "not"):
+            self._take()
+            operand = self._not()
+            return lambda snapshot, kommun: not operand(snapshot, kommun)
+        return self._comparison()
+
+    def _comparison(self) -> Getter:
+        left = self._operand()
+        kind, value = self._peek()
+        if kind != "op":
+            return left
+        self._take()
+        right = self._operand()
+        compare = COMPARISONS[value]
+
+        def comparison(snapshot: AggregationSnapshot, kommun: str) -> bool:
+            left_value = left(snapshot, kommun)
+            if left_value is None:
+                return False
+            right_value = right(snapshot, kommun)
+            return right_value is not None and compare(left_value, right_value)
+
+        return comparison
+
+    def _operand(self) -> Getter:
+        kind, value = self._take()
+        if kind == "number":
+            number = float(value) if "." in value else int(value)
+            return lambda snapshot, kommun: number
+        if kind == "punct" and value == "(":
+            node = self._or()
+            self._take(")")
+            return node
+        if kind != "name" or value in ("and", "or", "not"):
+            raise ValidationError("invalid_condition")
+        if value in ("true", "false"):
+            constant = value == "true"
+            return lambda snapshot, kommun: constant
+        if value.startswith("kommun_"):
+            self.kommun_scoped = True
+        if value in ("total", "kommun_total"):
+            return _total("kommun" if value == "kommun_total" else "survey")
+        if value == "kommun_masked":
+            return _kommun_masked
+        return self._call(value)
+
+    def _call(self, name: str) -> Getter:
+        scope, _, function = name.rpartition("_") if name.startswith("kommun_") else ("survey", "", name)
+        if function not in ("count", "share", "answered"):
+            raise ValidationError("invalid_condition")
+        self._take("(")
+        key = self._argument()
+        question = self.questions.get(key)
+        if question is None:
+            raise ValidationError("invalid_condition")
+        entry = _question_entry(scope, key)
+        if function == "answered":
+            self._take(")")
+            return _answered(entry)
+        self._take(",")
+        position = question.positions.get(self._argument())
+        if position is None:
+            raise ValidationError("invalid_condition")
+        self._take(")")
+        return _count(entry, position) if function == "count" else _share(entry, position)
+
+    def _argument(self) -> Any:
+        kind, value = self._take()
+        if kind == "string":
+            return value[1:-1]
+        if kind == "number" and "." not in value:
+            return int(value)
+        if kind == "name" and value not in KEYWORDS:
+            return value
+        raise ValidationError("invalid_condition")
+
+
+def compile_condition(condition: Any, layout: SurveyLayout = SurveyLayout()) -> Condition:
+    return compile_scoped_condition(condition, layout)[0]
+
+
+def compile_scoped_condition(condition: Any, layout: SurveyLayout = SurveyLayout()) -> Tuple[Condition, bool]:
+    if not condition:
+        return always, False
+    if isinstance(condition, str):
+        expression = condition
+    elif isinstance(condition, dict) and condition.get("expr"):
+        expression = condition["expr"]
+    elif isinstance(condition, dict) and condition.get("min_total") is not None:
+        min_total = int(condition["min_total"])
+        total = _total("survey")
+        return (lambda snapshot, kommun: (total(snapshot, kommun) or 0) >= min_total), False
+    elif isinstance(condition, dict):
+        return always, False
+    else:
+        raise ValidationError("invalid_condition")
+    parser = _Parser(tokenize_condition(expression), layout)
+    node = parser.parse()
+    return (lambda snapshot, kommun: bool(node(snapshot, kommun))), parser.kommun_scoped
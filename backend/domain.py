@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 
 class DomainError(Exception):
@@ -60,6 +60,8 @@ class SurveyResponse:
     respondent_pseudonym: str
     answers: Dict[str, Any]
     raw_text_fields: Dict[str, str] = field(default_factory=dict)
+    kommun: Optional[str] = None
+    submitted_on: Optional[str] = None
 
 
 @dataclass(frozen=True)
@@ -85,6 +87,16 @@ class ReportVersion:
     published_state: str = "draft"
     canonical_url: Optional[str] = None
     replaced_by: Optional[int] = None
+    data_version_hash: Optional[str] = None
+    title: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ResolvedReport:
+    version: ReportVersion
+    replacement_url: Optional[str] = None
+    template: Optional[ReportTemplate] = None
+    snapshot: Optional[AggregationSnapshot] = None
 
 
 @dataclass(frozen=True)
@@ -134,6 +146,25 @@ class TextReview:
     reviewed_at: Optional[str] = None
 
 
+HIGHLIGHT_TEXT_STATUS = "highlight"
+
+
+def text_sort_rank(status: str) -> int:
+    return 0 if status == HIGHLIGHT_TEXT_STATUS else 1
+
+
+@dataclass(frozen=True)
+class CuratedText:
+    sort_rank: int
+    response_id: int
+    field_key: str
+    text: str
+
+    @property
+    def position(self) -> Tuple[int, int, str]:
+        return (self.sort_rank, self.response_id, self.field_key)
+
+
 @dataclass(frozen=True)
 class ConsentRecord:
     id: int
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Optional
+
+ENCODED_ETAG_SUFFIXES = ("gzip", "br", "zstd")
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def strip_encoding(etag: str) -> str:
+    for suffix in ENCODED_ETAG_SUFFIXES:
+        if etag.endswith(f'-{suffix}"'):
+            return f'{etag[: -len(suffix) - 2]}"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag or strip_encoding(candidate) == etag:
+            return True
+    return False
@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import argparse
+import os
+import struct
+import tempfile
+import textwrap
+import threading
+import zlib
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from .domain import AggregationSnapshot, ReportTemplate, ReportVersion, ValidationError
+from .services import ReportService
+from .storage import ResponseStore
+
+EXPORT_FORMATS = ("pdf", "png")
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+PAGE_MARGIN = 50
+LINE_HEIGHT = 16
+WRAP_WIDTH = 90
+BAR_HEIGHT = 10
+PREVIEW_WIDTH = 320
+
+
+def _pdf_text(value: str) -> bytes:
+    encoded = value.encode("cp1252", errors="replace")
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _numeric(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def _bar_scale(lines: Sequence[Tuple[str, Any]]) -> int:
+    return max([_numeric(value[1]) for kind, value in lines if kind == "bar"] + [1])
+
+
+def _block_lines(block: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    block_type = block.get("type")
+    if block_type == "trend":
+        lines: List[Tuple[str, Any]] = [("text", f"Trend ({block['granularity']})")]
+        return lines + [("bar", (point["bucket"], point["count"])) for point in block["series"]]
+    if block_type == "chart" and "question" in block:
+        lines = [("text", f"Diagram: {block['question']}")]
+        return lines + [("bar", (str(label), count)) for label, count in zip(block["labels"], block["series"])]
+    if block_type in ("chart", "table"):
+        lines = [("text", " x ".join(block.get("questions", [block.get("question", "")])))]
+        labels = block["labels"][0] if "questions" in block else block["labels"]
+        for label, row in zip(labels, block["series"]):
+            cells = row if isinstance(row, list) else [row]
+            values = " | ".join("…" if isinstance(cell, list) else str(cell) for cell in cells)
+            lines.append(("text", f"{label}: {values}"))
+        return lines
+    lines = []
+    for paragraph in str(block.get("content", "")).splitlines() or [""]:
+        lines.extend(("text", line) for line in textwrap.wrap(paragraph, WRAP_WIDTH) or [""])
+    return lines
+
+
+def payload_lines(payload: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    lines: List[Tuple[str, Any]] = [("title", f"Rapport: {payload['kommun']}")]
+    if payload.get("small_n_banner"):
+        lines.append(("text", "För få svar för att visa alla siffror."))
+    for block in payload.get("blocks", []):
+        lines.extend(_block_lines(block))
+        lines.append(("gap", None))
+    if payload.get("curated_texts_url"):
+        lines.append(("title", "Citat"))
+        link = f"Utvalda fritexter finns på {payload['curated_texts_url']}"
+        lines.extend(("text", line) for line in textwrap.wrap(link, WRAP_WIDTH))
+    return lines
+
+
+def render_pdf(payload: Dict[str, Any]) -> bytes:
+    pages: List[List[bytes]] = [[]]
+    y = PAGE_HEIGHT - PAGE_MARGIN
+    lines = payload_lines(payload)
+    bar_scale = _bar_scale(lines)
+    for kind, value in lines:
+        if y < PAGE_MARGIN + LINE_HEIGHT:
+            pages.append([])
+            y = PAGE_HEIGHT - PAGE_MARGIN
+        operations = pages[-1]
+        if kind == "title":
+            operations.append(b"BT /F1 16 Tf %d %d Td (%s) Tj ET" % (PAGE_MARGIN, y, _pdf_text(value)))
+            y -= LINE_HEIGHT + 8
+        elif kind == "text":
+            operations.append(b"BT /F1 10 Tf %d %d Td (%s) Tj ET" % (PAGE_MARGIN, y, _pdf_text(value)))
+            y -= LINE_HEIGHT
+        elif kind == "bar":
+            label, count = value
+            width = int((PAGE_WIDTH - 2 * PAGE_MARGIN - 160) * _numeric(count) / bar_scale)
+            operations.append(b"BT /F1 9 Tf %d %d Td (%s) Tj ET" % (PAGE_MARGIN, y, _pdf_text(f"{label}: {count}")))
+            operations.append(b"0.35 0.5 0.75 rg %d %d %d %d re f" % (PAGE_MARGIN + 150, y - 1, width, BAR_HEIGHT))
+            y -= LINE_HEIGHT
+        else:
+            y -= LINE_HEIGHT // 2
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for operations in pages:
+        stream = b"\n".join(operations)
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def render_png(payload: Dict[str, Any], width: int = PREVIEW_WIDTH) -> bytes:
+    lines = payload_lines(payload)
+    row_height = 6
+    height = max(row_height * (len(lines) + 2), row_height * 4)
+    background = bytes((255, 255, 255))
+    rows = [bytearray(background * width) for _ in range(height)]
+
+    def fill(x: int, y: int, w: int, h: int, color: Tuple[int, int, int]) -> None:
+        w = max(0, min(w, width - x))
+        pixel = bytes(color)
+        for row in rows[max(y, 0) : min(y + h, height)]:
+            row[x * 3 : (x + w) * 3] = pixel * w
+
+    bar_scale = _bar_scale(lines)
+    inner = width - 2 * row_height
+    for index, (kind, value) in enumerate(lines, start=1):
+        y = index * row_height
+        if kind == "title":
+            fill(row_height, y, min(inner, 6 * len(value)), row_height - 2, (40, 60, 90))
+        elif kind == "text":
+            fill(row_height, y + 1, min(inner, 3 * len(value)), row_height - 3, (170, 170, 170))
+        elif kind == "bar":
+            fill(row_height, y + 1, int(inner * _numeric(value[1]) / bar_scale), row_height - 3, (90, 128, 190))
+    raw = b"".join(b"\x00" + bytes(row) for row in rows)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(raw, 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    handle, temporary = tempfile.mkstemp(prefix=".export-", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, "wb") as output:
+            output.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+def write_export(paths: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, str]:
+    os.makedirs(os.path.dirname(paths["pdf"]), exist_ok=True)
+    _write_atomic(paths["pdf"], render_pdf(payload))
+    _write_atomic(paths["png"], render_png(payload))
+    return paths
+
+
+class ReportExportWorker:
+    def __init__(
+        self,
+        store: ResponseStore,
+        root: str,
+        max_workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.store = store
+        self.root = root
+        self.reports = ReportService(store)
+        self._executor = executor
+        self._owns_executor = executor is None
+        self.max_workers = max_workers
+        self._pending: Dict[Tuple[int, str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ReportExportWorker":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def export_paths(self, version_id: int, data_version_hash: str, kommun: str) -> Dict[str, str]:
+        directory = os.path.join(self.root, str(version_id), data_version_hash)
+        stem = quote(kommun, safe="")
+        return {export_format: os.path.join(directory, f"{stem}.{export_format}") for export_format in EXPORT_FORMATS}
+
+    def submit(self, version_id: int, kommun: str) -> Future:
+        return self.submit_many(version_id, [kommun])[kommun]
+
+    def submit_many(self, version_id: int, kommuner: Sequence[str]) -> Dict[str, Future]:
+        version, template, snapshot = self._resolve(version_id)
+        futures: Dict[str, Future] = {}
+        missing = []
+        with self._lock:
+            for kommun in dict.fromkeys(kommuner):
+                key = (version.id, kommun, snapshot.data_version_hash)
+                paths = self.export_paths(version.id, snapshot.data_version_hash, kommun)
+                if key in self._pending:
+                    futures[kommun] = self._pending[key]
+                elif all(os.path.isfile(path) for path in paths.values()):
+                    futures[kommun] = Future()
+                    futures[kommun].set_result(paths)
+                else:
+                    missing.append(kommun)
+        if not missing:
+            return futures
+        texts_url = f"{version.canonical_url}/texts" if version.canonical_url else None
+        payloads = self.reports.build_report_payloads(template, snapshot, missing, texts_url=texts_url)
+        with self._lock:
+            for kommun in missing:
+                key = (version.id, kommun, snapshot.data_version_hash)
+                if key in self._pending:
+                    futures[kommun] = self._pending[key]
+                    continue
+                paths = self.export_paths(version.id, snapshot.data_version_hash, kommun)
+                future = self._pool().submit(write_export, paths, payloads[kommun])
+                self._pending[key] = future
+                future.add_done_callback(lambda _, key=key: self._finish(key))
+                futures[kommun] = future
+        return futures
+
+    def export_all(self, version_id: int, kommuner: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, str]]:
+        if kommuner is None:
+            _, _, snapshot = self._resolve(version_id)
+            kommuner = list(snapshot.metrics.get("kommuner", {}))
+        futures = self.submit_many(version_id, kommuner)
+        return {kommun: future.result() for kommun, future in futures.items()}
+
+    def _finish(self, key: Tuple[int, str, str]) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _resolve(self, version_id: int) -> Tuple[ReportVersion, ReportTemplate, AggregationSnapshot]:
+        version = self.store.get_report_version(version_id)
+        if version is None:
+            raise ValidationError("report_version_not_found")
+        template = self.store.get_report_template(version.template_id)
+        if template is None:
+            raise ValidationError("report_template_not_found")
+        if version.data_version_hash:
+            snapshot = self.store.get_aggregation_version(template.survey_id, version.data_version_hash)
+        else:
+            snapshot = self.store.get_aggregation(template.survey_id)
+        if snapshot is None:
+            raise ValidationError("aggregation_missing")
+        return version, template, snapshot
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="NPF Hubben report export")
+    parser.add_argument("version_id", type=int)
+    parser.add_argument("--kommun", action="append")
+    parser.add_argument("--output", default=os.environ.get("REPORT_EXPORT_DIR", "exports"))
+    parser.add_argument("--workers", type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from .postgres_store import PostgresStores
+
+    args = parse_args()
+    stores = PostgresStores()
+    with ReportExportWorker(stores.responses, args.output, max_workers=args.workers) as worker:
+        worker.export_all(args.version_id, args.kommun)
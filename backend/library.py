@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .terms import STOPWORDS
+
+SEARCH_TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+SURVEY_METADATA_FIELDS = ("title", "name", "description")
+
+
+def search_tokens(text: str) -> List[str]:
+    return [token for token in SEARCH_TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def survey_metadata_text(schema: Dict[str, Any]) -> str:
+    return " ".join(schema[field] for field in SURVEY_METADATA_FIELDS if isinstance(schema.get(field), str))
+
+
+@dataclass(frozen=True)
+class LibraryEntry:
+    version_id: int
+    template_id: int
+    survey_id: int
+    canonical_url: str
+    title: Optional[str] = None
+    survey_title: Optional[str] = None
+    kommuner: Tuple[str, ...] = ()
+    pinned: bool = False
+
+    def terms(self) -> Set[str]:
+        text = " ".join(filter(None, (self.title, self.survey_title, *self.kommuner)))
+        return set(search_tokens(text))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "version_id": self.version_id,
+            "template_id": self.template_id,
+            "survey_id": self.survey_id,
+            "canonical_url": self.canonical_url,
+            "title": self.title,
+            "kommuner": list(self.kommuner),
+        }
+
+
+class ReportLibraryIndex:
+    def __init__(self):
+        self._entries: Dict[int, LibraryEntry] = {}
+        self._order: List[int] = []
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._by_survey: Dict[int, Set[int]] = {}
+        self._by_kommun: Dict[str, Set[int]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, version_id: int) -> Optional[LibraryEntry]:
+        return self._entries.get(version_id)
+
+    def entries(self) -> List[LibraryEntry]:
+        with self._lock:
+            return [self._entries[version_id] for version_id in self._order]
+
+    def add(self, entry: LibraryEntry) -> None:
+        with self._lock:
+            self.remove(entry.version_id)
+            self._entries[entry.version_id] = entry
+            insort(self._order, entry.version_id)
+            for term in entry.terms():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = set()
+                    insort(self._vocabulary, term)
+                postings.add(entry.version_id)
+            self._by_survey.setdefault(entry.survey_id, set()).add(entry.version_id)
+            for kommun in entry.kommuner:
+                self._by_kommun.setdefault(kommun.casefold(), set()).add(entry.version_id)
+
+    def remove(self, version_id: int) -> None:
+        with self._lock:
+            entry = self._entries.pop(version_id, None)
+            if entry is None:
+                return
+            del self._order[bisect_left(self._order, version_id)]
+            for term in entry.terms():
+                self._discard(self._postings, term, version_id)
+                if term not in self._postings:
+                    del self._vocabulary[bisect_left(self._vocabulary, term)]
+            self._discard(self._by_survey, entry.survey_id, version_id)
+            for kommun in entry.kommuner:
+                self._discard(self._by_kommun, kommun.casefold(), version_id)
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        survey_id: Optional[int] = None,
+        kommun: Optional[str] = None,
+        before: Optional[int] = None,
+        limit: int = 20,
+    ) -> Tuple[List[LibraryEntry], Optional[int]]:
+        with self._lock:
+            filters = self._filters(query, survey_id, kommun)
+            if filters is None:
+                return [], None
+            if filters:
+                filters.sort(key=len)
+                smallest, rest = filters[0], filters[1:]
+                matches = (
+                    version_id
+                    for version_id in smallest
+                    if (before is None or version_id < before) and all(version_id in other for other in rest)
+                )
+                ids = heapq.nlargest(limit + 1, matches)
+            else:
+                end = len(self._order) if before is None else bisect_left(self._order, before)
+                ids = self._order[max(0, end - limit - 1) : end][::-1]
+            page = [self._entries[version_id] for version_id in ids[:limit]]
+            return page, page[-1].version_id if len(ids) > limit else None
+
+    def _filters(
+        self, query: Optional[str], survey_id: Optional[int], kommun: Optional[str]
+    ) -> Optional[List[Set[int]]]:
+        filters: List[Set[int]] = []
+        if survey_id is not None:
+            filters.append(self._by_survey.get(survey_id, set()))
+        if kommun:
+            filters.append(self._by_kommun.get(kommun.casefold(), set()))
+        tokens = search_tokens(query or "")
+        for token in tokens[:-1]:
+            filters.append(self._postings.get(token, set()))
+        if tokens:
+            filters.append(self._prefix_postings(tokens[-1]))
+        if any(not postings for postings in filters):
+            return None
+        return filters
+
+    def _prefix_postings(self, prefix: str) -> Set[int]:
+        start = bisect_left(self._vocabulary, prefix)
+        end = bisect_left(self._vocabulary, prefix + "\U0010ffff", start)
+        terms = self._vocabulary[start:end]
+        if len(terms) == 1:
+            return self._postings[terms[0]]
+        matched: Set[int] = set()
+        for term in terms:
+            matched |= self._postings[term]
+        return matched
+
+    @staticmethod
+    def _discard(index: Dict[Any, Set[int]], key: Any, version_id: int) -> None:
+        postings = index.get(key)
+        if postings is None:
+            return
+        postings.discard(version_id)
+        if not postings:
+            del index[key]
@@ -113,9 +113,13 @@ def _apply_migrations(conn: "psycopg.Connection") -> None:
             respondent_pseudonym TEXT NOT NULL,
             answers JSONB NOT NULL,
             raw_text_fields JSONB NOT NULL DEFAULT '{}'::jsonb,
+            kommun TEXT,
+            submitted_on TEXT,
             UNIQUE (respondent_pseudonym, survey_id)
         )
         """,
+        "ALTER TABLE responses ADD COLUMN IF NOT EXISTS kommun TEXT",
+        "ALTER TABLE responses ADD COLUMN IF NOT EXISTS submitted_on TEXT",
         """
         CREATE TABLE IF NOT EXISTS aggregations (
             survey_id INTEGER PRIMARY KEY,
@@ -125,6 +129,16 @@ def _apply_migrations(conn: "psycopg.Connection") -> None:
         )
         """,
         """
+        CREATE TABLE IF NOT EXISTS aggregation_history (
+            position BIGSERIAL PRIMARY KEY,
+            survey_id INTEGER NOT NULL,
+            data_version_hash TEXT NOT NULL,
+            metrics JSONB NOT NULL,
+            min_responses INTEGER NOT NULL,
+            UNIQUE (survey_id, data_version_hash)
+        )
+        """,
+        """
         CREATE TABLE IF NOT EXISTS report_templates (
             id SERIAL PRIMARY KEY,
             survey_id INTEGER NOT NULL,
@@ -138,9 +152,42 @@ def _apply_migrations(conn: "psycopg.Connection") -> None:
             visibility TEXT NOT NULL,
             published_state TEXT NOT NULL,
             canonical_url TEXT UNIQUE,
-            replaced_by INTEGER
+            replaced_by INTEGER,
+            data_version_hash TEXT
         )
         """,
+        "ALTER TABLE report_versions ADD COLUMN IF NOT EXISTS data_version_hash TEXT",
+        "ALTER TABLE report_versions ADD COLUMN IF NOT EXISTS title TEXT",
+        """
+        CREATE TABLE IF NOT EXISTS report_library_revision (
+            singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+            revision BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT INTO report_library_revision (singleton) VALUES (TRUE) ON CONFLICT DO NOTHING",
+        """
+        CREATE TABLE IF NOT EXISTS report_redirects (
+            source_url TEXT PRIMARY KEY,
+            target_url TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS report_redirects_target_url_idx ON report_redirects (target_url)",
+        """
+        WITH RECURSIVE chain AS (
+            SELECT v.canonical_url AS source_url, r.canonical_url, r.replaced_by, 1 AS depth
+            FROM report_versions v JOIN report_versions r ON r.id = v.replaced_by
+            WHERE v.canonical_url IS NOT NULL
+            UNION ALL
+            SELECT c.source_url, r.canonical_url, r.replaced_by, c.depth + 1
+            FROM chain c JOIN report_versions r ON r.id = c.replaced_by
+            WHERE c.depth < 64
+        )
+        INSERT INTO report_redirects (source_url, target_url)
+        SELECT DISTINCT ON (source_url) source_url, canonical_url FROM chain
+        WHERE canonical_url IS NOT NULL
+        ORDER BY source_url, depth DESC
+        ON CONFLICT (source_url) DO NOTHING
+        """,
         """
         CREATE TABLE IF NOT EXISTS news_items (
             id SERIAL PRIMARY KEY,
@@ -170,9 +217,21 @@ def _apply_migrations(conn: "psycopg.Connection") -> None:
             status TEXT NOT NULL,
             flagged_for_review BOOLEAN NOT NULL DEFAULT FALSE,
             reviewed_by INTEGER,
-            reviewed_at TEXT
+            reviewed_at TEXT,
+            sort_rank SMALLINT NOT NULL DEFAULT 1
+        )
+        """,
+        "ALTER TABLE text_reviews ADD COLUMN IF NOT EXISTS sort_rank SMALLINT NOT NULL DEFAULT 1",
+        "UPDATE text_reviews SET sort_rank = 0 WHERE status = 'highlight' AND sort_rank <> 0",
+        "CREATE INDEX IF NOT EXISTS text_reviews_sort_rank_idx ON text_reviews (sort_rank, response_id)",
+        """
+        CREATE TABLE IF NOT EXISTS text_revisions (
+            survey_id INTEGER PRIMARY KEY,
+            revision BIGINT NOT NULL
         )
         """,
+        "CREATE INDEX IF NOT EXISTS responses_survey_id_idx ON responses (survey_id)",
+        "CREATE INDEX IF NOT EXISTS responses_survey_id_id_idx ON responses (survey_id, id)",
         """
         CREATE TABLE IF NOT EXISTS ai_requests (
             id SERIAL PRIMARY KEY,
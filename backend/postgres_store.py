@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import importlib.util
 import os
-from typing import Any, Dict, List, Optional
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 HAS_PSYCOPG = importlib.util.find_spec("psycopg") is not None
 if HAS_PSYCOPG:
@@ -10,18 +12,27 @@ if HAS_PSYCOPG:
     from psycopg.rows import dict_row
     from psycopg.types.json import Jsonb
 
+from .aggregation import (
+    SurveyLayout,
+    aggregate_grouped_counts,
+    crosstab_key,
+    data_version_from_lanes,
+    reported_kommuner,
+)
 from .domain import (
     AggregationSnapshot,
     AiAnalysisRequest,
     AuditEvent,
     BaseProfile,
     ConsentRecord,
+    CuratedText,
     IntroductionEvent,
     MailOutbox,
     NewsItem,
     NetworkPreference,
     ReportTemplate,
     ReportVersion,
+    ResolvedReport,
     Session,
     Survey,
     SurveyResponse,
@@ -30,8 +41,12 @@ from .domain import (
     TextReview,
     User,
     ConflictError,
+    text_sort_rank,
 )
 
+AGGREGATION_LOCK_CLASS = 1
+BUMP_REPORT_LIBRARY_REVISION = "UPDATE report_library_revision SET revision = revision + 1"
+
 
 def _build_dsn() -> str:
     dsn = os.environ.get("POSTGRES_DSN")
@@ -51,18 +66,24 @@ class PostgresDatabase:
             raise RuntimeError("psycopg not installed")
         self._dsn = dsn or _build_dsn()
         self._conn = psycopg.connect(self._dsn, autocommit=True, row_factory=dict_row)
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self._lock, self._conn.transaction():
+            yield
 
     def execute(self, query: str, params: Optional[tuple[Any, ...]] = None) -> None:
-        with self._conn.cursor() as cursor:
+        with self._lock, self._conn.cursor() as cursor:
             cursor.execute(query, params or ())
 
     def fetchone(self, query: str, params: Optional[tuple[Any, ...]] = None) -> Optional[Dict[str, Any]]:
-        with self._conn.cursor() as cursor:
+        with self._lock, self._conn.cursor() as cursor:
             cursor.execute(query, params or ())
             return cursor.fetchone()
 
     def fetchall(self, query: str, params: Optional[tuple[Any, ...]] = None) -> List[Dict[str, Any]]:
-        with self._conn.cursor() as cursor:
+        with self._lock, self._conn.cursor() as cursor:
             cursor.execute(query, params or ())
             return list(cursor.fetchall())
 
@@ -385,8 +406,10 @@ class PostgresResponseStore:
     def add_response(self, response: SurveyResponse) -> SurveyResponse:
         self.db.execute(
             """
-            INSERT INTO responses (id, survey_id, respondent_pseudonym, answers, raw_text_fields)
-            VALUES (%s, %s, %s, %s, %s)
+            INSERT INTO responses (
+                id, survey_id, respondent_pseudonym, answers, raw_text_fields, kommun, submitted_on
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             """,
             (
                 response.id,
@@ -394,6 +417,8 @@ class PostgresResponseStore:
                 response.respondent_pseudonym,
                 Jsonb(response.answers),
                 Jsonb(response.raw_text_fields),
+                response.kommun,
+                response.submitted_on,
             ),
         )
         return response
@@ -401,7 +426,7 @@ class PostgresResponseStore:
     def get_response_by_pseudonym_survey(self, pseudonym: str, survey_id: int) -> Optional[SurveyResponse]:
         row = self.db.fetchone(
             """
-            SELECT id, survey_id, respondent_pseudonym, answers, raw_text_fields
+            SELECT id, survey_id, respondent_pseudonym, answers, raw_text_fields, kommun, submitted_on
             FROM responses WHERE respondent_pseudonym=%s AND survey_id=%s
             """,
             (pseudonym, survey_id),
@@ -414,12 +439,34 @@ class PostgresResponseStore:
             respondent_pseudonym=row["respondent_pseudonym"],
             answers=row["answers"],
             raw_text_fields=row["raw_text_fields"] or {},
+            kommun=row["kommun"],
+            submitted_on=row["submitted_on"],
+        )
+
+    def get_response(self, response_id: int) -> Optional[SurveyResponse]:
+        row = self.db.fetchone(
+            """
+            SELECT id, survey_id, respondent_pseudonym, answers, raw_text_fields, kommun, submitted_on
+            FROM responses WHERE id=%s
+            """,
+            (response_id,),
+        )
+        if row is None:
+            return None
+        return SurveyResponse(
+            id=row["id"],
+            survey_id=row["survey_id"],
+            respondent_pseudonym=row["respondent_pseudonym"],
+            answers=row["answers"],
+            raw_text_fields=row["raw_text_fields"] or {},
+            kommun=row["kommun"],
+            submitted_on=row["submitted_on"],
         )
 
     def list_responses_for_survey(self, survey_id: int) -> List[SurveyResponse]:
         rows = self.db.fetchall(
             """
-            SELECT id, survey_id, respondent_pseudonym, answers, raw_text_fields
+            SELECT id, survey_id, respondent_pseudonym, answers, raw_text_fields, kommun, submitted_on
             FROM responses WHERE survey_id=%s
             """,
             (survey_id,),
@@ -431,29 +478,211 @@ class PostgresResponseStore:
                 respondent_pseudonym=row["respondent_pseudonym"],
                 answers=row["answers"],
                 raw_text_fields=row["raw_text_fields"] or {},
+                kommun=row["kommun"],
+                submitted_on=row["submitted_on"],
             )
             for row in rows
         ]
 
+    @contextmanager
+    def aggregation_lock(self, survey_id: int) -> Iterator[None]:
+        with self.db.transaction():
+            self.db.execute("SELECT pg_advisory_xact_lock(%s, %s)", (AGGREGATION_LOCK_CLASS, survey_id))
+            yield
+
+    def response_chunk_bounds(self, survey_id: int, chunk_size: int) -> List[int]:
+        rows = self.db.fetchall(
+            """
+            SELECT id FROM (
+                SELECT id, row_number() OVER (ORDER BY id) AS position, count(*) OVER () AS total
+                FROM responses WHERE survey_id=%s
+            ) AS numbered
+            WHERE position %% %s = 0 OR position = total
+            ORDER BY id
+            """,
+            (survey_id, chunk_size),
+        )
+        return [row["id"] for row in rows]
+
+    def aggregate_survey(
+        self,
+        survey_id: int,
+        layout: SurveyLayout,
+        after_id: Optional[int] = None,
+        up_to_id: Optional[int] = None,
+    ) -> Tuple[Dict[str, Any], str]:
+        conditions, scope_params = ["survey_id=%s"], [survey_id]
+        if after_id is not None:
+            conditions.append("id > %s")
+            scope_params.append(after_id)
+        if up_to_id is not None:
+            conditions.append("id <= %s")
+            scope_params.append(up_to_id)
+        scope = " AND ".join(conditions)
+        total_rows = self.db.fetchall(
+            f"""
+            SELECT kommun,
+                   count(*) AS total,
+                   sum(('x' || encode(substring(digest from 1 for 8), 'hex'))::bit(64)::bigint) AS lane_1,
+                   sum(('x' || encode(substring(digest from 9 for 8), 'hex'))::bit(64)::bigint) AS lane_2,
+                   sum(('x' || encode(substring(digest from 17 for 8), 'hex'))::bit(64)::bigint) AS lane_3,
+                   sum(('x' || encode(substring(digest from 25 for 8), 'hex'))::bit(64)::bigint) AS lane_4
+            FROM (
+                SELECT kommun, sha256(convert_to(id::text, 'UTF8')) AS digest
+                FROM responses WHERE {scope}
+            ) AS hashed
+            GROUP BY kommun
+            """,
+            tuple(scope_params),
+        )
+        value_rows = self.db.fetchall(
+            f"""
+            SELECT responses.kommun, answer.key, answer.value, count(*) AS count
+            FROM responses
+            CROSS JOIN LATERAL jsonb_each(responses.answers) AS answer
+            WHERE {scope} AND answer.key = ANY(%s)
+            GROUP BY responses.kommun, answer.key, answer.value
+            """,
+            (*scope_params, [question.key for question in layout.questions]),
+        )
+        day_rows = self.db.fetchall(
+            f"SELECT submitted_on, count(*) AS count FROM responses WHERE {scope} GROUP BY submitted_on",
+            tuple(scope_params),
+        )
+        crosstab_counts = {}
+        for members in layout.crosstabs:
+            columns = ", ".join(f"answers->%s AS value_{index}" for index in range(len(members)))
+            group_by = ", ".join(str(index + 1) for index in range(len(members)))
+            rows = self.db.fetchall(
+                f"SELECT {columns}, count(*) AS count FROM responses WHERE {scope} GROUP BY {group_by}",
+                (*[question.key for question in members], *scope_params),
+            )
+            crosstab_counts[crosstab_key([question.key for question in members])] = [
+                ([row[f"value_{index}"] for index in range(len(members))], row["count"]) for row in rows
+            ]
+        lanes = [0, 0, 0, 0]
+        for row in total_rows:
+            lanes = [lane + int(row[f"lane_{index + 1}"]) for index, lane in enumerate(lanes)]
+        metrics = aggregate_grouped_counts(
+            layout,
+            {row["kommun"]: row["total"] for row in total_rows},
+            ((row["kommun"], row["key"], row["value"], row["count"]) for row in value_rows),
+            crosstab_counts,
+            [(row["submitted_on"], row["count"]) for row in day_rows],
+        )
+        return metrics, data_version_from_lanes(lanes)
+
     def upsert_aggregation(self, snapshot: AggregationSnapshot) -> AggregationSnapshot:
+        coverage = list(reported_kommuner(snapshot.metrics, snapshot.min_responses))
         self.db.execute(
             """
-            INSERT INTO aggregations (survey_id, data_version_hash, metrics, min_responses)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (survey_id) DO UPDATE
-            SET data_version_hash=EXCLUDED.data_version_hash,
-                metrics=EXCLUDED.metrics,
-                min_responses=EXCLUDED.min_responses
+            WITH previous AS (
+                SELECT ARRAY(
+                    SELECT kommun FROM jsonb_each(metrics->'kommuner') AS cell(kommun, value)
+                    WHERE (value->>'total')::int >= min_responses
+                ) AS kommuner
+                FROM aggregations WHERE survey_id=%s
+            ),
+            upserted AS (
+                INSERT INTO aggregations (survey_id, data_version_hash, metrics, min_responses)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (survey_id) DO UPDATE
+                SET data_version_hash=EXCLUDED.data_version_hash,
+                    metrics=EXCLUDED.metrics,
+                    min_responses=EXCLUDED.min_responses
+            )
+            UPDATE report_library_revision SET revision = revision + 1
+            WHERE NOT EXISTS (SELECT 1 FROM previous WHERE kommuner @> %s::text[] AND kommuner <@ %s::text[])
             """,
             (
+                snapshot.survey_id,
                 snapshot.survey_id,
                 snapshot.data_version_hash,
                 Jsonb(snapshot.metrics),
                 snapshot.min_responses,
+                coverage,
+                coverage,
             ),
         )
         return snapshot
 
+    def add_aggregation_version(self, snapshot: AggregationSnapshot) -> AggregationSnapshot:
+        row = self.db.fetchone(
+            """
+            INSERT INTO aggregation_history (survey_id, data_version_hash, metrics, min_responses)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (survey_id, data_version_hash) DO UPDATE
+            SET position=nextval('aggregation_history_position_seq')
+            RETURNING survey_id, data_version_hash, metrics, min_responses
+            """,
+            (
+                snapshot.survey_id,
+                snapshot.data_version_hash,
+                Jsonb(snapshot.metrics),
+                snapshot.min_responses,
+            ),
+        )
+        return AggregationSnapshot(
+            survey_id=row["survey_id"],
+            data_version_hash=row["data_version_hash"],
+            metrics=row["metrics"],
+            min_responses=row["min_responses"],
+        )
+
+    def get_aggregation_version(self, survey_id: int, data_version_hash: str) -> Optional[AggregationSnapshot]:
+        row = self.db.fetchone(
+            """
+            SELECT survey_id, data_version_hash, metrics, min_responses
+            FROM aggregation_history WHERE survey_id=%s AND data_version_hash=%s
+            """,
+            (survey_id, data_version_hash),
+        )
+        if row is None:
+            return None
+        return AggregationSnapshot(
+            survey_id=row["survey_id"],
+            data_version_hash=row["data_version_hash"],
+            metrics=row["metrics"],
+            min_responses=row["min_responses"],
+        )
+
+    def list_aggregation_history(self, survey_id: int) -> List[AggregationSnapshot]:
+        rows = self.db.fetchall(
+            """
+            SELECT survey_id, data_version_hash, metrics, min_responses
+            FROM aggregation_history WHERE survey_id=%s ORDER BY position
+            """,
+            (survey_id,),
+        )
+        return [
+            AggregationSnapshot(
+                survey_id=row["survey_id"],
+                data_version_hash=row["data_version_hash"],
+                metrics=row["metrics"],
+                min_responses=row["min_responses"],
+            )
+            for row in rows
+        ]
+
+    def prune_aggregation_history(self, survey_id: int, keep: int) -> None:
+        self.db.execute(
+            """
+            DELETE FROM aggregation_history
+            WHERE survey_id=%s
+              AND position NOT IN (
+                  SELECT position FROM aggregation_history
+                  WHERE survey_id=%s ORDER BY position DESC LIMIT %s
+              )
+              AND data_version_hash NOT IN (
+                  SELECT report_versions.data_version_hash
+                  FROM report_versions
+                  JOIN report_templates ON report_templates.id = report_versions.template_id
+                  WHERE report_templates.survey_id=%s AND report_versions.data_version_hash IS NOT NULL
+              )
+            """,
+            (survey_id, survey_id, keep, survey_id),
+        )
+
     def get_aggregation(self, survey_id: int) -> Optional[AggregationSnapshot]:
         row = self.db.fetchone(
             "SELECT survey_id, data_version_hash, metrics, min_responses FROM aggregations WHERE survey_id=%s",
@@ -485,20 +714,26 @@ class PostgresResponseStore:
         return ReportTemplate(id=row["id"], survey_id=row["survey_id"], blocks=row["blocks"])
 
     def add_report_version(self, version: ReportVersion) -> ReportVersion:
-        self.db.execute(
-            """
-            INSERT INTO report_versions (id, template_id, visibility, published_state, canonical_url, replaced_by)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """,
-            (
-                version.id,
-                version.template_id,
-                version.visibility,
-                version.published_state,
-                version.canonical_url,
-                version.replaced_by,
-            ),
-        )
+        with self.db.transaction():
+            self.db.execute(
+                """
+                INSERT INTO report_versions (
+                    id, template_id, visibility, published_state, canonical_url, replaced_by, data_version_hash, title
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    version.id,
+                    version.template_id,
+                    version.visibility,
+                    version.published_state,
+                    version.canonical_url,
+                    version.replaced_by,
+                    version.data_version_hash,
+                    version.title,
+                ),
+            )
+            self.db.execute(BUMP_REPORT_LIBRARY_REVISION)
         return version
 
     def update_report_version(self, version_id: int, **updates) -> ReportVersion:
@@ -516,32 +751,40 @@ class PostgresResponseStore:
             published_state=updates.get("published_state", version.published_state),
             canonical_url=updates.get("canonical_url", version.canonical_url),
             replaced_by=updates.get("replaced_by", version.replaced_by),
+            data_version_hash=updates.get("data_version_hash", version.data_version_hash),
+            title=updates.get("title", version.title),
         )
-        self.db.execute(
-            """
-            UPDATE report_versions
-            SET template_id=%s,
-                visibility=%s,
-                published_state=%s,
-                canonical_url=%s,
-                replaced_by=%s
-            WHERE id=%s
-            """,
-            (
-                updated.template_id,
-                updated.visibility,
-                updated.published_state,
-                updated.canonical_url,
-                updated.replaced_by,
-                updated.id,
-            ),
-        )
+        with self.db.transaction():
+            self.db.execute(
+                """
+                UPDATE report_versions
+                SET template_id=%s,
+                    visibility=%s,
+                    published_state=%s,
+                    canonical_url=%s,
+                    replaced_by=%s,
+                    data_version_hash=%s,
+                    title=%s
+                WHERE id=%s
+                """,
+                (
+                    updated.template_id,
+                    updated.visibility,
+                    updated.published_state,
+                    updated.canonical_url,
+                    updated.replaced_by,
+                    updated.data_version_hash,
+                    updated.title,
+                    updated.id,
+                ),
+            )
+            self.db.execute(BUMP_REPORT_LIBRARY_REVISION)
         return updated
 
     def get_report_version(self, version_id: int) -> Optional[ReportVersion]:
         row = self.db.fetchone(
             """
-            SELECT id, template_id, visibility, published_state, canonical_url, replaced_by
+            SELECT id, template_id, visibility, published_state, canonical_url, replaced_by, data_version_hash, title
             FROM report_versions WHERE id=%s
             """,
             (version_id,),
@@ -555,12 +798,14 @@ class PostgresResponseStore:
             published_state=row["published_state"],
             canonical_url=row["canonical_url"],
             replaced_by=row["replaced_by"],
+            data_version_hash=row["data_version_hash"],
+            title=row["title"],
         )
 
     def get_report_version_by_url(self, url: str) -> Optional[ReportVersion]:
         row = self.db.fetchone(
             """
-            SELECT id, template_id, visibility, published_state, canonical_url, replaced_by
+            SELECT id, template_id, visibility, published_state, canonical_url, replaced_by, data_version_hash, title
             FROM report_versions WHERE canonical_url=%s
             """,
             (url,),
@@ -574,11 +819,79 @@ class PostgresResponseStore:
             published_state=row["published_state"],
             canonical_url=row["canonical_url"],
             replaced_by=row["replaced_by"],
+            data_version_hash=row["data_version_hash"],
+            title=row["title"],
         )
 
+    def get_report_redirect(self, url: str) -> Optional[str]:
+        row = self.db.fetchone("SELECT target_url FROM report_redirects WHERE source_url=%s", (url,))
+        return row["target_url"] if row else None
+
+    def redirect_report_url(self, source_url: str, target_url: str) -> None:
+        self.db.execute(
+            """
+            WITH compressed AS (
+                UPDATE report_redirects SET target_url=%s WHERE target_url=%s
+            )
+            INSERT INTO report_redirects (source_url, target_url) VALUES (%s, %s)
+            ON CONFLICT (source_url) DO UPDATE SET target_url=EXCLUDED.target_url
+            """,
+            (target_url, source_url, source_url, target_url),
+        )
+
+    def resolve_report(self, url: str, with_snapshot: bool = True) -> Optional[ResolvedReport]:
+        row = self.db.fetchone(
+            """
+            SELECT v.id, v.template_id, v.visibility, v.published_state, v.canonical_url, v.replaced_by,
+                   v.data_version_hash, v.title, d.target_url AS replacement_url, t.id AS resolved_template_id,
+                   t.survey_id, t.blocks, COALESCE(h.data_version_hash, a.data_version_hash) AS snapshot_hash,
+                   COALESCE(h.metrics, a.metrics) AS metrics,
+                   COALESCE(h.min_responses, a.min_responses) AS min_responses
+            FROM report_versions v
+            LEFT JOIN report_redirects d ON d.source_url = v.canonical_url
+            LEFT JOIN report_templates t ON t.id = v.template_id AND d.target_url IS NULL
+            LEFT JOIN aggregation_history h
+              ON %s AND v.data_version_hash IS NOT NULL
+             AND h.survey_id = t.survey_id AND h.data_version_hash = v.data_version_hash
+            LEFT JOIN aggregations a
+              ON %s AND v.data_version_hash IS NULL AND a.survey_id = t.survey_id
+            WHERE v.canonical_url=%s
+            """,
+            (with_snapshot, with_snapshot, url),
+        )
+        if row is None:
+            return None
+        version = ReportVersion(
+            id=row["id"],
+            template_id=row["template_id"],
+            visibility=row["visibility"],
+            published_state=row["published_state"],
+            canonical_url=row["canonical_url"],
+            replaced_by=row["replaced_by"],
+            data_version_hash=row["data_version_hash"],
+            title=row["title"],
+        )
+        if row["replacement_url"]:
+            return ResolvedReport(version=version, replacement_url=row["replacement_url"])
+        template = None
+        if row["resolved_template_id"] is not None:
+            template = ReportTemplate(id=row["resolved_template_id"], survey_id=row["survey_id"], blocks=row["blocks"])
+        snapshot = None
+        if row["snapshot_hash"] is not None:
+            snapshot = AggregationSnapshot(
+                survey_id=row["survey_id"],
+                data_version_hash=row["snapshot_hash"],
+                metrics=row["metrics"],
+                min_responses=row["min_responses"],
+            )
+        return ResolvedReport(version=version, template=template, snapshot=snapshot)
+
     def list_report_versions(self) -> List[ReportVersion]:
         rows = self.db.fetchall(
-            "SELECT id, template_id, visibility, published_state, canonical_url, replaced_by FROM report_versions"
+            """
+            SELECT id, template_id, visibility, published_state, canonical_url, replaced_by, data_version_hash, title
+            FROM report_versions
+            """
         )
         return [
             ReportVersion(
@@ -588,10 +901,16 @@ class PostgresResponseStore:
                 published_state=row["published_state"],
                 canonical_url=row["canonical_url"],
                 replaced_by=row["replaced_by"],
+                data_version_hash=row["data_version_hash"],
+                title=row["title"],
             )
             for row in rows
         ]
 
+    def report_library_revision(self) -> int:
+        row = self.db.fetchone("SELECT revision FROM report_library_revision")
+        return int(row["revision"]) if row else 0
+
     def add_news_item(self, item: NewsItem) -> NewsItem:
         self.db.execute("INSERT INTO news_items (id, title, body) VALUES (%s, %s, %s)", (item.id, item.title, item.body))
         return item
@@ -614,6 +933,12 @@ class PostgresResponseStore:
         )
         return event
 
+    def get_text_flag(self, flag_id: int) -> Optional[TextFlag]:
+        row = self.db.fetchone("SELECT id, response_id, reason FROM text_flags WHERE id=%s", (flag_id,))
+        if row is None:
+            return None
+        return TextFlag(id=row["id"], response_id=row["response_id"], reason=row["reason"])
+
     def list_text_flags(self) -> List[TextFlag]:
         rows = self.db.fetchall("SELECT id, response_id, reason FROM text_flags")
         return [TextFlag(id=row["id"], response_id=row["response_id"], reason=row["reason"]) for row in rows]
@@ -628,8 +953,10 @@ class PostgresResponseStore:
     def add_text_review(self, review: TextReview) -> TextReview:
         self.db.execute(
             """
-            INSERT INTO text_reviews (id, response_id, status, flagged_for_review, reviewed_by, reviewed_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO text_reviews (
+                id, response_id, status, flagged_for_review, reviewed_by, reviewed_at, sort_rank
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             """,
             (
                 review.id,
@@ -638,6 +965,7 @@ class PostgresResponseStore:
                 review.flagged_for_review,
                 review.reviewed_by,
                 review.reviewed_at,
+                text_sort_rank(review.status),
             ),
         )
         return review
@@ -657,7 +985,7 @@ class PostgresResponseStore:
         self.db.execute(
             """
             UPDATE text_reviews
-            SET status=%s, flagged_for_review=%s, reviewed_by=%s, reviewed_at=%s
+            SET status=%s, flagged_for_review=%s, reviewed_by=%s, reviewed_at=%s, sort_rank=%s
             WHERE id=%s
             """,
             (
@@ -665,6 +993,7 @@ class PostgresResponseStore:
                 updated.flagged_for_review,
                 updated.reviewed_by,
                 updated.reviewed_at,
+                text_sort_rank(updated.status),
                 updated.id,
             ),
         )
@@ -724,6 +1053,21 @@ class PostgresResponseStore:
             for row in rows
         ]
 
+    def text_revision(self, survey_id: int) -> int:
+        row = self.db.fetchone("SELECT revision FROM text_revisions WHERE survey_id=%s", (survey_id,))
+        return int(row["revision"]) if row else 0
+
+    def bump_text_revision(self, survey_id: int) -> int:
+        row = self.db.fetchone(
+            """
+            INSERT INTO text_revisions (survey_id, revision) VALUES (%s, 1)
+            ON CONFLICT (survey_id) DO UPDATE SET revision = text_revisions.revision + 1
+            RETURNING revision
+            """,
+            (survey_id,),
+        )
+        return int(row["revision"])
+
     def list_public_texts(self, allowed_statuses: List[str]) -> List[str]:
         rows = self.db.fetchall(
             """
@@ -740,6 +1084,46 @@ class PostgresResponseStore:
             texts.extend(list(raw_fields.values()))
         return texts
 
+    def list_curated_texts(
+        self,
+        survey_id: int,
+        allowed_statuses: List[str],
+        after: Optional[Tuple[int, int, str]] = None,
+        limit: int = 20,
+    ) -> List[CuratedText]:
+        sort_rank, response_id, field_key = after or (-1, 0, "")
+        rows = self.db.fetchall(
+            """
+            SELECT text_reviews.sort_rank, responses.id AS response_id, field.key, field.value
+            FROM text_reviews
+            JOIN responses ON responses.id = text_reviews.response_id
+            CROSS JOIN LATERAL jsonb_each_text(responses.raw_text_fields) AS field
+            WHERE responses.survey_id = %s
+              AND text_reviews.status = ANY(%s)
+              AND (text_reviews.sort_rank, responses.id, field.key COLLATE "C") > (%s, %s, %s)
+            ORDER BY text_reviews.sort_rank, responses.id, field.key COLLATE "C"
+            LIMIT %s
+            """,
+            (survey_id, allowed_statuses, sort_rank, response_id, field_key, limit),
+        )
+        return [CuratedText(row["sort_rank"], row["response_id"], row["key"], row["value"]) for row in rows]
+
+    def list_public_texts_for_survey(self, survey_id: int, allowed_statuses: List[str]) -> List[str]:
+        rows = self.db.fetchall(
+            """
+            SELECT responses.raw_text_fields
+            FROM text_reviews
+            JOIN responses ON responses.id = text_reviews.response_id
+            WHERE responses.survey_id = %s AND text_reviews.status = ANY(%s)
+            """,
+            (survey_id, allowed_statuses),
+        )
+        texts: List[str] = []
+        for row in rows:
+            raw_fields = row["raw_text_fields"] or {}
+            texts.extend(list(raw_fields.values()))
+        return texts
+
     def add_ai_request(self, request: AiAnalysisRequest) -> AiAnalysisRequest:
         self.db.execute(
             "INSERT INTO ai_requests (id, prompt) VALUES (%s, %s)",
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+HAS_REUSEPORT = hasattr(socket, "SO_REUSEPORT")
+LISTEN_BACKLOG = 1024
+SHUTDOWN_TIMEOUT = 10.0
+RESTART_BACKOFF_MAX = 5.0
+POLL_INTERVAL = 0.1
+
+
+def listening_socket(host: str, port: int, reuse_port: bool = HAS_REUSEPORT, listen: bool = True) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        if listen:
+            sock.listen(LISTEN_BACKLOG)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+class PreforkSupervisor:
+    def __init__(
+        self,
+        serve: Callable[[socket.socket], None],
+        workers: int,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        shutdown_timeout: float = SHUTDOWN_TIMEOUT,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be positive")
+        self.serve = serve
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.shutdown_timeout = shutdown_timeout
+        self.children: Dict[int, int] = {}
+        self._started: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self._stopping = False
+        self._socket: Optional[socket.socket] = None
+
+    def run(self) -> int:
+        self._socket = listening_socket(self.host, self.port, listen=not HAS_REUSEPORT)
+        self.port = self._socket.getsockname()[1]
+        previous = {sig: signal.signal(sig, self._request_stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for slot in range(self.workers):
+                self._spawn(slot)
+            while not self._stopping:
+                self._reap(restart=True)
+                time.sleep(POLL_INTERVAL)
+            return self._shutdown()
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            self._socket.close()
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            self._run_child()
+        self.children[pid] = slot
+        self._started[slot] = time.monotonic()
+
+    def _run_child(self) -> None:
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            if HAS_REUSEPORT:
+                self._socket.close()
+                sock = listening_socket(self.host, self.port)
+            else:
+                sock = self._socket
+            self.serve(sock)
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _reap(self, restart: bool) -> None:
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            slot = self.children.pop(pid, None)
+            if slot is None or not restart or self._stopping:
+                continue
+            lifetime = time.monotonic() - self._started.get(slot, 0.0)
+            delay = 0.0
+            if lifetime < 1.0:
+                delay = min(max(self._backoff.get(slot, 0.0) * 2, POLL_INTERVAL), RESTART_BACKOFF_MAX)
+            self._backoff[slot] = delay
+            if delay:
+                time.sleep(delay)
+            if not self._stopping:
+                self._spawn(slot)
+
+    def _shutdown(self) -> int:
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.children and time.monotonic() < deadline:
+            self._reap(restart=False)
+            time.sleep(POLL_INTERVAL)
+        clean = not self.children
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+        return 0 if clean else 1
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from .bundles import ReportBundleWriter
+from .cache import caches_for
+from .compression import MIN_COMPRESS_BYTES, compress, negotiate_encoding
+from .domain import UnauthorizedError, ValidationError
+from .etags import encoded_etag, etag_matches, make_etag
+from .services import CURATED_TEXT_PAGE_SIZE, LIBRARY_PAGE_SIZE, PublicSiteService
+from .storage import InMemoryStores
+
+APP_VERSION = "0.1.0"
+SECURITY_HEADERS = (("Content-Security-Policy", "default-src 'none'"), ("X-Frame-Options", "DENY"))
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+
+
+@dataclass
+class Response:
+    status: int
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    body: bytes = b""
+    file: Optional[BinaryIO] = None
+    file_size: int = 0
+
+    @property
+    def content_length(self) -> int:
+        return self.file_size if self.file is not None else len(self.body)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Router:
+    def __init__(self, stores: InMemoryStores, bundles: Optional[ReportBundleWriter] = None):
+        self.stores = stores
+        self.bundles = bundles
+
+    def handle(self, target: str, headers: Mapping[str, Any]) -> Response:
+        return _Request(self, target, headers).dispatch()
+
+
+class _Request:
+    def __init__(self, router: Router, target: str, headers: Mapping[str, Any]):
+        self.stores = router.stores
+        self.bundles = router.bundles
+        self.target = target
+        self.if_none_match = headers.get("If-None-Match")
+        self.accept_encoding = headers.get("Accept-Encoding")
+
+    def dispatch(self) -> Response:
+        if self.target == "/health":
+            return self._json(200, {"status": "ok"})
+
+        if self.target == "/version":
+            return self._json(200, {"version": APP_VERSION})
+
+        parsed = urlparse(self.target)
+        if parsed.path == "/public/news":
+            service = PublicSiteService(self.stores.responses, self.stores.pii)
+            news = service.list_news()
+            etag = make_etag("news", *(f"{item.id}:{item.title}:{item.body}" for item in news))
+            if etag_matches(self.if_none_match, etag):
+                return self._not_modified(etag)
+            items = [{"title": item.title, "body": item.body} for item in news]
+            return self._json(200, {"news": items}, etag=etag)
+
+        if parsed.path == "/public/reports":
+            service = PublicSiteService(self.stores.responses, self.stores.pii)
+            query = parse_qs(parsed.query)
+            try:
+                limit = int(query.get("limit", [LIBRARY_PAGE_SIZE])[0])
+            except ValueError:
+                return self._json(400, {"error": "invalid_page_size"})
+            try:
+                survey_id = int(query["survey"][0]) if "survey" in query else None
+            except ValueError:
+                return self._json(400, {"error": "invalid_survey_filter"})
+            try:
+                result = service.search_public_reports(
+                    query.get("q", [None])[0],
+                    survey_id=survey_id,
+                    kommun=query.get("kommun", [None])[0],
+                    cursor=query.get("cursor", [None])[0],
+                    limit=limit,
+                )
+            except ValidationError as exc:
+                return self._json(400, {"error": str(exc)})
+            etag = make_etag(
+                "reports",
+                parsed.query,
+                result["next_cursor"],
+                *(
+                    f"{entry['version_id']}:{entry['canonical_url']}:{entry['title']}:{','.join(entry['kommuner'])}"
+                    for entry in result["reports"]
+                ),
+            )
+            if etag_matches(self.if_none_match, etag):
+                return self._not_modified(etag)
+            return self._json(200, result, etag=etag)
+
+        if parsed.path.startswith("/reports/") and parsed.path.endswith("/texts"):
+            slug = parsed.path[len("/reports/") : -len("/texts")]
+            service = PublicSiteService(self.stores.responses, self.stores.pii)
+            query = parse_qs(parsed.query)
+            cursor = query.get("cursor", [None])[0]
+            try:
+                limit = int(query.get("limit", [CURATED_TEXT_PAGE_SIZE])[0])
+            except ValueError:
+                return self._json(400, {"error": "invalid_page_size"})
+            try:
+                result = service.read_report_texts(
+                    f"/reports/{slug}", cursor=cursor, limit=limit, if_none_match=self.if_none_match
+                )
+            except ValidationError as exc:
+                return self._json(400, {"error": str(exc)})
+            except UnauthorizedError:
+                return self._json(403, {"error": "forbidden"})
+            if "redirect" in result:
+                return self._redirect(result["redirect"])
+            etag = result.pop("etag")
+            if result.get("not_modified"):
+                return self._not_modified(etag)
+            return self._json(200, result, etag=etag)
+
+        if parsed.path.startswith("/reports/"):
+            slug = parsed.path.split("/reports/", 1)[1]
+            service = PublicSiteService(self.stores.responses, self.stores.pii)
+            kommun = parse_qs(parsed.query).get("kommun", [None])[0]
+            bundle_path = self.bundles.path_for(f"/reports/{slug}", kommun) if self.bundles and kommun else None
+            if bundle_path and not self.stores.responses.get_report_redirect(f"/reports/{slug}"):
+                try:
+                    return self._file(200, bundle_path)
+                except FileNotFoundError:
+                    pass
+            try:
+                result = service.read_report(f"/reports/{slug}", kommun=kommun, if_none_match=self.if_none_match)
+            except ValidationError as exc:
+                return self._json(400, {"error": str(exc)})
+            except UnauthorizedError:
+                return self._json(403, {"error": "forbidden"})
+            if "redirect" in result:
+                return self._redirect(result["redirect"])
+            etag = result.pop("etag")
+            if result.get("not_modified"):
+                return self._not_modified(etag)
+            return self._json(200, result, etag=etag)
+
+        return self._json(404, {"error": "not_found"})
+
+    def _redirect(self, location: str) -> Response:
+        return Response(302, [("Location", location), *SECURITY_HEADERS])
+
+    def _not_modified(self, etag: str) -> Response:
+        encoding = negotiate_encoding(self.accept_encoding)
+        if encoding and encoded_etag(etag, encoding) in (self.if_none_match or ""):
+            etag = encoded_etag(etag, encoding)
+        return Response(304, [*self._etag_headers(etag), ("Vary", "Accept-Encoding"), *SECURITY_HEADERS])
+
+    def _etag_headers(self, etag: str) -> List[Tuple[str, str]]:
+        return [("ETag", etag), ("Cache-Control", "no-cache")]
+
+    def _negotiate(self, size: int) -> Optional[str]:
+        if size < MIN_COMPRESS_BYTES:
+            return None
+        return negotiate_encoding(self.accept_encoding)
+
+    def _compressed(self, encoding: str, etag: Optional[str], load: Callable[[], bytes]) -> bytes:
+        if not etag:
+            return compress(encoding, load())
+        cache = caches_for(self.stores.responses).compressed_bodies
+        key = (etag, encoding)
+        body = cache.get(key)
+        if body is None:
+            body = cache.put(key, compress(encoding, load()))
+        return body
+
+    def _json(self, status: int, payload: Dict[str, Any], etag: Optional[str] = None) -> Response:
+        body = json.dumps(payload).encode("utf-8")
+        negotiable = len(body) >= MIN_COMPRESS_BYTES
+        encoding = self._negotiate(len(body))
+        if encoding:
+            raw = body
+            body = self._compressed(encoding, etag, lambda: raw)
+        return Response(status, self._body_headers(etag, encoding, negotiable), body)
+
+    def _body_headers(self, etag: Optional[str], encoding: Optional[str], negotiable: bool) -> List[Tuple[str, str]]:
+        headers = [("Content-Type", JSON_CONTENT_TYPE), *SECURITY_HEADERS]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        if negotiable:
+            headers.append(("Vary", "Accept-Encoding"))
+        if etag:
+            headers.extend(self._etag_headers(encoded_etag(etag, encoding) if encoding else etag))
+        return headers
+
+    def _file(self, status: int, path: str) -> Response:
+        handle = open(path, "rb")
+        try:
+            stat = os.fstat(handle.fileno())
+            size = stat.st_size
+            etag = f'"b-{stat.st_ino:x}-{stat.st_mtime_ns:x}-{size:x}"'
+            if etag_matches(self.if_none_match, etag):
+                handle.close()
+                return self._not_modified(etag)
+            encoding = self._negotiate(size)
+            if encoding:
+                body = self._compressed(encoding, etag, handle.read)
+                handle.close()
+                return Response(status, self._body_headers(etag, encoding, True), body)
+            return Response(
+                status, self._body_headers(etag, None, size >= MIN_COMPRESS_BYTES), file=handle, file_size=size
+            )
+        except BaseException:
+            handle.close()
+            raise
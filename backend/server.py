@@ -1,99 +1,158 @@
 import argparse
-import json
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import sys
+import threading
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import parse_qs, urlparse
+from typing import Callable
 
-from .domain import UnauthorizedError, ValidationError
-from .services import PublicSiteService
+from .async_server import serve
+from .bundles import ReportBundleWriter
+from .prefork import PreforkSupervisor
+from .routes import APP_VERSION, Response, Router
 from .storage import InMemoryStores
 
-APP_VERSION = "0.1.0"
-
 
 class HealthHandler(BaseHTTPRequestHandler):
     stores: InMemoryStores = InMemoryStores()
+    bundles: ReportBundleWriter | None = None
 
     def do_GET(self):
-        if self.path == "/health":
-            self._send_json(200, {"status": "ok"})
-            return
-
-        if self.path == "/version":
-            self._send_json(200, {"version": APP_VERSION})
-            return
-
-        parsed = urlparse(self.path)
-        if parsed.path == "/public/news":
-            service = PublicSiteService(self.stores.responses, self.stores.pii)
-            items = [{"title": item.title, "body": item.body} for item in service.list_news()]
-            self._send_json(200, {"news": items})
-            return
-
-        if parsed.path == "/public/reports":
-            service = PublicSiteService(self.stores.responses, self.stores.pii)
-            self._send_json(200, {"reports": service.list_public_reports()})
-            return
-
-        if parsed.path.startswith("/reports/"):
-            slug = parsed.path.split("/reports/", 1)[1]
-            service = PublicSiteService(self.stores.responses, self.stores.pii)
-            kommun = parse_qs(parsed.query).get("kommun", [None])[0]
-            try:
-                result = service.read_report(f"/reports/{slug}", kommun=kommun)
-            except ValidationError as exc:
-                self._send_json(400, {"error": str(exc)})
-                return
-            except UnauthorizedError:
-                self._send_json(403, {"error": "forbidden"})
-                return
-            if "redirect" in result:
-                self.send_response(302)
-                self.send_header("Location", result["redirect"])
-                self.send_header("Content-Security-Policy", "default-src 'none'")
-                self.send_header("X-Frame-Options", "DENY")
-                self.end_headers()
-                return
-            self._send_json(200, result)
-            return
-
-        self._send_json(404, {"error": "not_found"})
+        response = Router(self.stores, self.bundles).handle(self.path, self.headers)
+        try:
+            self._send(response)
+        finally:
+            response.close()
 
     def log_message(self, format, *args):
         return
 
-    def _send_json(self, status, payload):
-        body = json.dumps(payload).encode("utf-8")
-        self.send_response(status)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Security-Policy", "default-src 'none'")
-        self.send_header("X-Frame-Options", "DENY")
-        self.send_header("Content-Length", str(len(body)))
+    def _send(self, response: Response):
+        self.send_response(response.status)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        if response.status != 304:
+            self.send_header("Content-Length", str(response.content_length))
         self.end_headers()
-        self.wfile.write(body)
-
-
-def create_server(host="0.0.0.0", port=8000, stores: InMemoryStores | None = None):
+        if response.file is None:
+            self.wfile.write(response.body)
+            return
+        self.wfile.flush()
+        try:
+            offset = 0
+            while offset < response.file_size:
+                sent = os.sendfile(
+                    self.connection.fileno(), response.file.fileno(), offset, response.file_size - offset
+                )
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, OSError):
+            response.file.seek(0)
+            shutil.copyfileobj(response.file, self.wfile)
+
+
+def create_server(
+    host="0.0.0.0",
+    port=8000,
+    stores: InMemoryStores | None = None,
+    bundles: ReportBundleWriter | None = None,
+    sock: socket.socket | None = None,
+):
     handler = HealthHandler
-    if stores is not None:
-        handler = type("AppHandler", (HealthHandler,), {"stores": stores})
-    return ThreadingHTTPServer((host, port), handler)
-
-
-def run(host="0.0.0.0", port=8000, stores: InMemoryStores | None = None):
-    server = create_server(host, port, stores=stores)
+    if stores is not None or bundles is not None:
+        attributes = {}
+        if stores is not None:
+            attributes["stores"] = stores
+        if bundles is not None:
+            attributes["bundles"] = bundles
+        handler = type("AppHandler", (HealthHandler,), attributes)
+    if sock is None:
+        return ThreadingHTTPServer((host, port), handler)
+    httpd = ThreadingHTTPServer(sock.getsockname()[:2], handler, bind_and_activate=False)
+    httpd.socket.close()
+    httpd.socket = sock
+    httpd.server_address = sock.getsockname()[:2]
+    httpd.server_name, httpd.server_port = httpd.server_address
+    return httpd
+
+
+def serve_socket(
+    sock: socket.socket,
+    stores: InMemoryStores | None = None,
+    bundles: ReportBundleWriter | None = None,
+    server: str = "threading",
+):
+    if server == "asyncio":
+        asyncio.run(serve(stores=stores, bundles=bundles, sock=sock))
+        return
+    httpd = create_server(stores=stores, bundles=bundles, sock=sock)
+    httpd.daemon_threads = False
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=httpd.shutdown).start())
     try:
-        server.serve_forever()
+        httpd.serve_forever()
     finally:
-        server.server_close()
+        httpd.server_close()
+
+
+def run(
+    host="0.0.0.0",
+    port=8000,
+    stores: InMemoryStores | None = None,
+    bundles: ReportBundleWriter | None = None,
+    server: str = "threading",
+    workers: int = 1,
+    stores_factory: Callable[[], InMemoryStores] | None = None,
+):
+    if workers > 1:
+
+        def serve_worker(sock):
+            worker_stores = stores_factory() if stores_factory is not None else stores
+            serve_socket(sock, stores=worker_stores, bundles=bundles, server=server)
+
+        return PreforkSupervisor(serve_worker, workers, host=host, port=port).run()
+    if stores is None and stores_factory is not None:
+        stores = stores_factory()
+    if server == "asyncio":
+        asyncio.run(serve(host, port, stores=stores, bundles=bundles))
+        return 0
+    httpd = create_server(host, port, stores=stores, bundles=bundles)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+    return 0
+
+
+def postgres_stores():
+    from .postgres_store import PostgresStores
+
+    return PostgresStores()
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="NPF Hubben backend server")
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--bundle-dir", default=os.environ.get("REPORT_BUNDLE_DIR"))
+    parser.add_argument("--server", choices=["threading", "asyncio"], default="threading")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVER_WORKERS", "1")))
+    parser.add_argument("--store", choices=["memory", "postgres"], default=os.environ.get("STORE_BACKEND", "memory"))
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    run(host=args.host, port=args.port)
+    sys.exit(
+        run(
+            host=args.host,
+            port=args.port,
+            bundles=ReportBundleWriter(args.bundle_dir) if args.bundle_dir else None,
+            server=args.server,
+            workers=args.workers,
+            stores_factory=postgres_stores if args.store == "postgres" else None,
+        )
+    )
@@ -1,12 +1,40 @@
 from __future__ import annotations
 
-import hashlib
+import base64
+import binascii
 import json
 import secrets
+from concurrent.futures import Executor
 from datetime import datetime, timezone
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
-
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from .aggregation import (
+    MASKED_VALUE,
+    TREND_GRANULARITIES,
+    QuestionLayout,
+    SurveyLayout,
+    add_to_data_version,
+    build_layout,
+    count_crosstab,
+    crosstab_key,
+    crosstab_matrix,
+    data_version_for,
+    fold_response,
+    kommun_slice,
+    mask_crosstab,
+    mask_slice,
+    mask_trend,
+    question_series,
+    reported_kommuner,
+)
+from .bundles import ReportBundleWriter
+from .cache import caches_for
+from .etags import etag_matches, make_etag
+from .library import LibraryEntry, ReportLibraryIndex, survey_metadata_text
+from .templates import SERIES_BLOCK_TYPES, CompiledBlock, CompiledTemplate, compile_template, render_segments
+from .terms import TermSketch
 from .domain import (
     AggregationSnapshot,
     BaseProfile,
@@ -18,6 +46,7 @@ from .domain import (
     NetworkPreference,
     ReportTemplate,
     ReportVersion,
+    ResolvedReport,
     Session,
     Survey,
     SurveyResponse,
@@ -26,8 +55,10 @@ from .domain import (
     TextRedactionEvent,
     AiAnalysisRequest,
     AuditEvent,
+    UnauthorizedError,
     User,
     ValidationError,
+    text_sort_rank,
 )
 from .security import RateLimiter, require_role
 from .storage import PiiStore, ResponseStore
@@ -37,6 +68,11 @@ ALLOWED_QUESTION_TYPES = {"scale", "multichoice", "singlechoice", "short_text",
 ALLOWED_PUBLIC_TEXT_STATUSES = {"unreviewed", "reviewed", "highlight"}
 ALLOWED_REVIEW_STATUSES = {"unreviewed", "reviewed", "highlight", "hide", "reviewed_after_flagging"}
 BASE_CONSENT_VERSION = "v1"
+SNAPSHOT_HISTORY_LIMIT = 50
+CURATED_TEXT_PAGE_SIZE = 20
+CURATED_TEXT_PAGE_LIMIT = 100
+LIBRARY_PAGE_SIZE = 20
+LIBRARY_PAGE_LIMIT = 100
 
 
 @dataclass
@@ -147,6 +183,9 @@ class SurveyService:
             q_type = question.get("type")
             if q_type not in ALLOWED_QUESTION_TYPES:
                 raise ValidationError("unsupported_question_type")
+        crosstabs = schema.get("crosstabs", [])
+        if len(build_layout(schema).crosstabs) != len(crosstabs):
+            raise ValidationError("invalid_crosstab")
 
     def create_survey(self, schema: Dict[str, Any], base_block_policy: str = "enabled") -> Survey:
         self.validate_schema(schema)
@@ -180,6 +219,8 @@ class ResponseService:
     def __init__(self, store: ResponseStore, pii_store: PiiStore):
         self.store = store
         self.pii_store = pii_store
+        self.aggregations = AggregationService(store)
+        self.terms = TextTermService(store)
 
     def submit_response(
         self,
@@ -193,14 +234,19 @@ class ResponseService:
         if self.pii_store.has_submitted_response(user.id, survey_id):
             raise ConflictError("duplicate_response")
         pseudonym = self.pii_store.get_or_create_pseudonym(user.id)
-        response = SurveyResponse(
-            id=self.store.next_id("response"),
-            survey_id=survey_id,
-            respondent_pseudonym=pseudonym,
-            answers=answers,
-            raw_text_fields=raw_text_fields or {},
-        )
-        self.store.add_response(response)
+        profile = self.pii_store.get_base_profile(user.id)
+        with self.store.aggregation_lock(survey_id):
+            response = SurveyResponse(
+                id=self.store.next_id("response"),
+                survey_id=survey_id,
+                respondent_pseudonym=pseudonym,
+                answers=answers,
+                raw_text_fields=raw_text_fields or {},
+                kommun=profile.kommun if profile else None,
+                submitted_on=datetime.now(timezone.utc).date().isoformat(),
+            )
+            self.store.add_response(response)
+            self.aggregations.apply_response(response)
         if response.raw_text_fields:
             review = TextReview(
                 id=self.store.next_id("text_review"),
@@ -208,6 +254,9 @@ class ResponseService:
                 status="unreviewed",
             )
             self.store.add_text_review(review)
+            self.terms.record_status_change(response, previous_status=None, status=review.status)
+            if review.status in ALLOWED_PUBLIC_TEXT_STATUSES:
+                self.store.bump_text_revision(survey_id)
         self.pii_store.mark_response_submitted(user.id, survey_id)
         return response
 
@@ -222,27 +271,249 @@ class ResponseService:
 
 
 class AggregationService:
-    def __init__(self, store: ResponseStore):
+    def __init__(self, store: ResponseStore, history_limit: int = SNAPSHOT_HISTORY_LIMIT):
         self.store = store
+        self.history_limit = history_limit
 
     def build_snapshot_for_survey(self, survey: Survey) -> AggregationSnapshot:
         return self.build_snapshot(survey.id, min_responses=survey.min_responses_default)
 
     def build_snapshot(self, survey_id: int, min_responses: int) -> AggregationSnapshot:
-        responses = self.store.list_responses_for_survey(survey_id)
-        total = len(responses)
-        response_ids = sorted(r.id for r in responses)
-        data_version_hash = hashlib.sha256(json.dumps(response_ids).encode("utf-8")).hexdigest()
-        metrics = {"total": total}
-        snapshot = AggregationSnapshot(
+        with self.store.aggregation_lock(survey_id):
+            return self.store_snapshot(self.compute_snapshot(survey_id, min_responses), record_history=True)
+
+    def compute_snapshot(self, survey_id: int, min_responses: int) -> AggregationSnapshot:
+        metrics, data_version_hash = self.store.aggregate_survey(survey_id, self._layout(survey_id))
+        return AggregationSnapshot(
             survey_id=survey_id,
             data_version_hash=data_version_hash,
             metrics=metrics,
             min_responses=min_responses,
         )
+
+    def apply_response(self, response: SurveyResponse) -> Optional[AggregationSnapshot]:
+        survey = self.store.get_survey(response.survey_id)
+        if survey is None:
+            return None
+        with self.store.aggregation_lock(response.survey_id):
+            snapshot = self.store.get_aggregation(response.survey_id)
+            if snapshot is None:
+                return self.build_snapshot_for_survey(survey)
+            updated = AggregationSnapshot(
+                survey_id=snapshot.survey_id,
+                data_version_hash=add_to_data_version(snapshot.data_version_hash, response.id),
+                metrics=fold_response(snapshot.metrics, response, build_layout(survey.schema)),
+                min_responses=snapshot.min_responses,
+            )
+            return self.store_snapshot(updated)
+
+    def verify_snapshot(self, survey_id: int) -> bool:
+        with self.store.aggregation_lock(survey_id):
+            live = self.store.get_aggregation(survey_id)
+            if live is None:
+                return False
+            recomputed = self.compute_snapshot(survey_id, live.min_responses)
+            consistent = (
+                recomputed.data_version_hash == live.data_version_hash and recomputed.metrics == live.metrics
+            )
+            if not consistent:
+                self.store_snapshot(recomputed, record_history=True)
+            return consistent
+
+    def store_snapshot(self, snapshot: AggregationSnapshot, record_history: bool = False) -> AggregationSnapshot:
         self.store.upsert_aggregation(snapshot)
+        if record_history:
+            self.store.add_aggregation_version(snapshot)
+        caches_for(self.store).discard_report_payloads(
+            snapshot.survey_id, keep_hash=snapshot.data_version_hash, keep_min_responses=snapshot.min_responses
+        )
         return snapshot
 
+    def pin_snapshot(self, survey_id: int) -> Optional[AggregationSnapshot]:
+        with self.store.aggregation_lock(survey_id):
+            snapshot = self.store.get_aggregation(survey_id)
+            if snapshot is None:
+                return None
+            return self.store.add_aggregation_version(snapshot)
+
+    def list_history(self, survey_id: int) -> List[AggregationSnapshot]:
+        return self.store.list_aggregation_history(survey_id)
+
+    def prune_history(self, survey_ids: Optional[List[int]] = None) -> None:
+        if survey_ids is None:
+            survey_ids = [survey.id for survey in self.store.list_surveys()]
+        for survey_id in survey_ids:
+            self.store.prune_aggregation_history(survey_id, keep=self.history_limit)
+
+    def cross_tab(
+        self, survey_id: int, question_keys: List[str], snapshot: Optional[AggregationSnapshot] = None
+    ) -> Dict[str, Any]:
+        members = self._layout(survey_id).members(question_keys)
+        if members is None:
+            raise ValidationError("invalid_crosstab")
+        snapshot = snapshot or self.store.get_aggregation(survey_id)
+        if snapshot is None:
+            raise ValidationError("aggregation_missing")
+        entry = snapshot.metrics.get("crosstabs", {}).get(crosstab_key(question_keys))
+        if entry is None:
+            entry = self._adhoc_cross_tab(snapshot, members)
+        table = mask_crosstab(entry, members, snapshot.min_responses)
+        table["data_version_hash"] = snapshot.data_version_hash
+        return table
+
+    def _adhoc_cross_tab(self, snapshot: AggregationSnapshot, members: Tuple[QuestionLayout, ...]) -> Dict[str, Any]:
+        question_keys = [question.key for question in members]
+        cache = caches_for(self.store).crosstabs
+        cache_key = (snapshot.survey_id, snapshot.data_version_hash, crosstab_key(question_keys))
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry
+        responses = self.store.list_responses_for_survey(snapshot.survey_id)
+        if data_version_for(response.id for response in responses) != snapshot.data_version_hash:
+            raise ValidationError("crosstab_data_version_unavailable")
+        entry = {"questions": question_keys, "cells": count_crosstab(responses, members)}
+        return cache.put(cache_key, entry)
+
+    def _layout(self, survey_id: int) -> SurveyLayout:
+        survey = self.store.get_survey(survey_id)
+        if survey is None:
+            return SurveyLayout()
+        return build_layout(survey.schema)
+
+
+class TextTermService:
+    def __init__(self, store: ResponseStore):
+        self.store = store
+
+    def top_terms(self, survey_id: int, k: int = 10) -> List[Dict[str, Any]]:
+        caches = caches_for(self.store)
+        with caches.lock:
+            return self._sketch(survey_id).top(k)
+
+    def record_status_change(self, response: SurveyResponse, previous_status: Optional[str], status: str) -> None:
+        was_public = previous_status in ALLOWED_PUBLIC_TEXT_STATUSES
+        is_public = status in ALLOWED_PUBLIC_TEXT_STATUSES
+        if was_public == is_public or not response.raw_text_fields:
+            return
+        caches = caches_for(self.store)
+        with caches.lock:
+            sketch = caches.term_sketches.get(response.survey_id)
+            if sketch is None:
+                return
+            if is_public:
+                sketch.add_texts(response.raw_text_fields.values())
+            else:
+                sketch.remove_texts(response.raw_text_fields.values())
+
+    def _sketch(self, survey_id: int) -> TermSketch:
+        caches = caches_for(self.store)
+        sketch = caches.term_sketches.get(survey_id)
+        if sketch is None:
+            sketch = TermSketch()
+            sketch.add_texts(self.store.list_public_texts_for_survey(survey_id, sorted(ALLOWED_PUBLIC_TEXT_STATUSES)))
+            caches.term_sketches[survey_id] = sketch
+        return sketch
+
+
+class CuratedTextService:
+    def __init__(self, store: ResponseStore):
+        self.store = store
+
+    def page(
+        self, survey_id: int, cursor: Optional[str] = None, limit: int = CURATED_TEXT_PAGE_SIZE
+    ) -> Dict[str, Any]:
+        if limit < 1 or limit > CURATED_TEXT_PAGE_LIMIT:
+            raise ValidationError("invalid_page_size")
+        after = self._decode_cursor(cursor) if cursor else None
+        texts = self.store.list_curated_texts(
+            survey_id, sorted(ALLOWED_PUBLIC_TEXT_STATUSES), after=after, limit=limit + 1
+        )
+        next_cursor = self._encode_cursor(texts[limit - 1].position) if len(texts) > limit else None
+        return {"texts": [entry.text for entry in texts[:limit]], "next_cursor": next_cursor}
+
+    def _encode_cursor(self, position: Tuple[int, int, str]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(list(position)).encode("utf-8")).decode("ascii").rstrip("=")
+
+    def _decode_cursor(self, cursor: str) -> Tuple[int, int, str]:
+        try:
+            decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            sort_rank, response_id, field_key = decoded
+        except (binascii.Error, ValueError, TypeError):
+            raise ValidationError("invalid_cursor")
+        if not isinstance(sort_rank, int) or not isinstance(response_id, int) or not isinstance(field_key, str):
+            raise ValidationError("invalid_cursor")
+        return sort_rank, response_id, field_key
+
+
+class ReportLibraryService:
+    def __init__(self, store: ResponseStore):
+        self.store = store
+
+    def index(self) -> ReportLibraryIndex:
+        caches = caches_for(self.store)
+        revision = self.store.report_library_revision()
+        with caches.lock:
+            if caches.library is None or caches.library_revision != revision:
+                library = ReportLibraryIndex()
+                for version in self.store.list_report_versions():
+                    entry = self._entry(version)
+                    if entry is not None:
+                        library.add(entry)
+                caches.library = library
+                caches.library_revision = revision
+            return caches.library
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        survey_id: Optional[int] = None,
+        kommun: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = LIBRARY_PAGE_SIZE,
+    ) -> Dict[str, Any]:
+        if limit < 1 or limit > LIBRARY_PAGE_LIMIT:
+            raise ValidationError("invalid_page_size")
+        before = self._decode_cursor(cursor) if cursor else None
+        entries, last = self.index().search(query, survey_id=survey_id, kommun=kommun, before=before, limit=limit)
+        next_cursor = self._encode_cursor(last) if last is not None else None
+        return {"reports": [entry.as_dict() for entry in entries], "next_cursor": next_cursor}
+
+    def _entry(self, version: ReportVersion) -> Optional[LibraryEntry]:
+        if version.visibility != "public" or version.published_state != "published" or not version.canonical_url:
+            return None
+        if version.replaced_by is not None:
+            return None
+        template = self.store.get_report_template(version.template_id)
+        if template is None:
+            return None
+        survey = self.store.get_survey(template.survey_id)
+        if version.data_version_hash:
+            snapshot = self.store.get_aggregation_version(template.survey_id, version.data_version_hash)
+        else:
+            snapshot = self.store.get_aggregation(template.survey_id)
+        return LibraryEntry(
+            version_id=version.id,
+            template_id=version.template_id,
+            survey_id=template.survey_id,
+            canonical_url=version.canonical_url,
+            title=version.title,
+            survey_title=survey_metadata_text(survey.schema) if survey else None,
+            kommuner=reported_kommuner(snapshot.metrics, snapshot.min_responses) if snapshot else (),
+            pinned=bool(version.data_version_hash),
+        )
+
+    def _encode_cursor(self, version_id: int) -> str:
+        return base64.urlsafe_b64encode(json.dumps([version_id]).encode("utf-8")).decode("ascii").rstrip("=")
+
+    def _decode_cursor(self, cursor: str) -> int:
+        try:
+            (version_id,) = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (binascii.Error, ValueError, TypeError):
+            raise ValidationError("invalid_cursor")
+        if not isinstance(version_id, int):
+            raise ValidationError("invalid_cursor")
+        return version_id
+
 
 class ReportService:
     def __init__(self, store: ResponseStore):
@@ -251,24 +522,114 @@ class ReportService:
     def create_template(self, survey_id: int, blocks: List[Dict[str, Any]]) -> ReportTemplate:
         if survey_id is None:
             raise ValidationError("survey_id_required")
+        for block in blocks:
+            if block.get("type") == "trend" and block.get("granularity", "week") not in TREND_GRANULARITIES:
+                raise ValidationError("invalid_trend_granularity")
         template = ReportTemplate(id=self.store.next_id("template"), survey_id=survey_id, blocks=blocks)
+        compile_template(template, self._layout(survey_id))
         self.store.add_report_template(template)
         return template
 
+    def compiled(self, template: ReportTemplate) -> CompiledTemplate:
+        cache = caches_for(self.store).templates
+        compiled = cache.get(template.id)
+        if compiled is None:
+            compiled = cache.put(template.id, compile_template(template, self._layout(template.survey_id)))
+        return compiled
+
+    def _layout(self, survey_id: int) -> SurveyLayout:
+        survey = self.store.get_survey(survey_id)
+        return build_layout(survey.schema) if survey else SurveyLayout()
+
     def render(self, template: ReportTemplate, snapshot: AggregationSnapshot, kommun: str) -> Dict[str, Any]:
-        placeholders = {
-            "$kommun": kommun,
-            "$antal_respondenter": str(snapshot.metrics.get("total", 0)),
-        }
-        rendered_blocks = []
-        for block in template.blocks:
-            if not self._condition_allowed(block, snapshot):
+        return self.render_many(template, snapshot, [kommun])[kommun]
+
+    def render_many(
+        self,
+        template: ReportTemplate,
+        snapshot: AggregationSnapshot,
+        kommuner: List[str],
+        executor: Optional[Executor] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        compiled = self.compiled(template)
+        shared = compiled.resolve_shared(snapshot)
+        plan = []
+        for block in compiled.blocks:
+            if not block.kommun_condition and not block.condition(snapshot, ""):
                 continue
-            content = block.get("content", "")
-            for key, value in placeholders.items():
-                content = content.replace(key, value)
-            rendered_blocks.append({"type": block.get("type", "text"), "content": content})
-        return {"blocks": rendered_blocks, "data_version_hash": snapshot.data_version_hash}
+            rendered = None
+            if block.type == "trend":
+                granularity = block.options.get("granularity", "week")
+                rendered = {"type": "trend", "granularity": granularity, "series": self.trend(snapshot, granularity)}
+            elif block.type in SERIES_BLOCK_TYPES and not block.kommun_content:
+                rendered = self._series_block(block, snapshot, None)
+            elif not block.kommun_content:
+                rendered = {"type": block.type, "content": render_segments(block.segments, shared)}
+            plan.append((block, rendered))
+
+        def render_kommun(kommun: str) -> Dict[str, Any]:
+            values = None
+            rendered_blocks = []
+            for block, rendered in plan:
+                if block.kommun_condition and not block.condition(snapshot, kommun):
+                    continue
+                if rendered is None and block.type in SERIES_BLOCK_TYPES:
+                    rendered = self._series_block(block, snapshot, kommun)
+                elif rendered is None:
+                    if values is None:
+                        values = {**shared, **compiled.resolve_kommun(snapshot, kommun)}
+                    rendered = {"type": block.type, "content": render_segments(block.segments, values)}
+                rendered_blocks.append(rendered)
+            return {"blocks": rendered_blocks, "data_version_hash": snapshot.data_version_hash}
+
+        unique = list(dict.fromkeys(kommuner))
+        results = executor.map(render_kommun, unique) if executor is not None else map(render_kommun, unique)
+        return dict(zip(unique, results))
+
+    def series(
+        self, snapshot: AggregationSnapshot, binding: Tuple[str, str], kommun: Optional[str] = None
+    ) -> Dict[str, Any]:
+        cache = caches_for(self.store).series
+        cache_key = (snapshot.survey_id, snapshot.data_version_hash, snapshot.min_responses, binding, kommun)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        kind, key = binding
+        layout = self._layout(snapshot.survey_id)
+        if kind == "question":
+            question = next(question for question in layout.questions if question.key == key)
+            metrics_slice = snapshot.metrics if kommun is None else kommun_slice(snapshot.metrics, kommun)
+            data = question_series(metrics_slice, key, snapshot.min_responses) or {
+                "counts": [MASKED_VALUE] * len(question.options),
+                "answered": MASKED_VALUE,
+            }
+            series = {
+                "question": key,
+                "labels": list(question.options),
+                "series": data["counts"],
+                "answered": data["answered"],
+            }
+        else:
+            members = layout.members(key.split("|"))
+            if members is None:
+                raise ValidationError("invalid_chart_binding")
+            entry = snapshot.metrics.get("crosstabs", {}).get(key) or {"cells": {}}
+            series = {
+                "questions": [question.key for question in members],
+                "labels": [list(question.options) for question in members],
+                "series": crosstab_matrix(entry, members, snapshot.min_responses),
+            }
+        return cache.put(cache_key, series)
+
+    def _series_block(
+        self, block: CompiledBlock, snapshot: AggregationSnapshot, kommun: Optional[str]
+    ) -> Dict[str, Any]:
+        scoped_kommun = kommun if block.options.get("scope") == "kommun" else None
+        rendered = {"type": block.type, "scope": block.options.get("scope", "survey")}
+        if block.type == "chart":
+            rendered["chart"] = block.options.get("chart", "bar")
+        rendered.update(self.series(snapshot, block.options["binding"], scoped_kommun))
+        return rendered
 
     def preview(self, template: ReportTemplate, snapshot: AggregationSnapshot, kommun: str) -> Dict[str, Any]:
         return self.render(template, snapshot, kommun)
@@ -276,46 +637,86 @@ class ReportService:
     def publish_render(self, template: ReportTemplate, snapshot: AggregationSnapshot, kommun: str) -> Dict[str, Any]:
         return self.render(template, snapshot, kommun)
 
-    def _condition_allowed(self, block: Dict[str, Any], snapshot: AggregationSnapshot) -> bool:
-        condition = block.get("condition")
-        if not condition:
-            return True
-        min_total = condition.get("min_total")
-        if min_total is None:
-            return True
-        return snapshot.metrics.get("total", 0) >= min_total
-
     def apply_small_n(self, snapshot: AggregationSnapshot) -> Dict[str, Any]:
-        total = snapshot.metrics.get("total", 0)
-        masked = total < snapshot.min_responses
-        return {"total": "X" if masked else total, "masked": masked}
+        return mask_slice(snapshot.metrics, snapshot.min_responses)
+
+    def trend(self, snapshot: AggregationSnapshot, granularity: str = "week") -> List[Dict[str, Any]]:
+        if granularity not in TREND_GRANULARITIES:
+            raise ValidationError("invalid_trend_granularity")
+        return mask_trend(snapshot.metrics, granularity, snapshot.min_responses)
+
+    def kommun_metrics(self, snapshot: AggregationSnapshot, kommun: str) -> Dict[str, Any]:
+        return mask_slice(kommun_slice(snapshot.metrics, kommun), snapshot.min_responses)
 
     def build_report_payload(
         self,
         template: ReportTemplate,
         snapshot: AggregationSnapshot,
         kommun: str,
-        text_entries: Optional[List[str]] = None,
+        texts_url: Optional[str] = None,
     ) -> Dict[str, Any]:
-        rendered = self.render(template, snapshot, kommun)
+        return self.build_report_payloads(template, snapshot, [kommun], texts_url=texts_url)[kommun]
+
+    def build_report_payloads(
+        self,
+        template: ReportTemplate,
+        snapshot: AggregationSnapshot,
+        kommuner: List[str],
+        executor: Optional[Executor] = None,
+        texts_url: Optional[str] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        rendered = self.render_many(template, snapshot, kommuner, executor=executor)
         small_n = self.apply_small_n(snapshot)
-        return {
-            "kommun": kommun,
-            "blocks": rendered["blocks"],
-            "data_version_hash": rendered["data_version_hash"],
-            "metrics": {"total": small_n["total"]},
-            "small_n_banner": small_n["masked"],
-            "curated_texts": list(text_entries or []),
-        }
+        metrics = {"total": small_n["total"], "questions": small_n["questions"]}
+        payloads = {}
+        for kommun, variant in rendered.items():
+            kommun_small_n = self.kommun_metrics(snapshot, kommun)
+            payloads[kommun] = {
+                "kommun": kommun,
+                "blocks": variant["blocks"],
+                "data_version_hash": variant["data_version_hash"],
+                "metrics": metrics,
+                "kommun_metrics": {
+                    "total": kommun_small_n["total"],
+                    "questions": kommun_small_n["questions"],
+                    "masked": kommun_small_n["masked"],
+                },
+                "small_n_banner": small_n["masked"],
+                "curated_texts_url": texts_url,
+            }
+        return payloads
 
 
 class PublishingService:
-    def __init__(self, store: ResponseStore):
+    def __init__(self, store: ResponseStore, bundles: Optional[ReportBundleWriter] = None):
         self.store = store
+        self.bundles = bundles
 
-    def publish(self, actor: User, template_id: int, visibility: str = "internal") -> ReportVersion:
+    def publish(
+        self,
+        actor: User,
+        template_id: int,
+        visibility: str = "internal",
+        pin_snapshot: bool = False,
+        title: Optional[str] = None,
+    ) -> ReportVersion:
         require_role(actor, ["analyst", "admin"])
-        version = ReportVersion(id=self.store.next_id("report_version"), template_id=template_id, visibility=visibility)
+        data_version_hash = None
+        if pin_snapshot:
+            template = self.store.get_report_template(template_id)
+            if template is None:
+                raise ValidationError("report_template_not_found")
+            snapshot = AggregationService(self.store).pin_snapshot(template.survey_id)
+            if snapshot is None:
+                raise ValidationError("aggregation_missing")
+            data_version_hash = snapshot.data_version_hash
+        version = ReportVersion(
+            id=self.store.next_id("report_version"),
+            template_id=template_id,
+            visibility=visibility,
+            data_version_hash=data_version_hash,
+            title=(title.strip() or None) if title else None,
+        )
         return self.store.add_report_version(version)
 
     def set_public_url(self, actor: User, version_id: int, slug: str) -> ReportVersion:
@@ -329,7 +730,46 @@ class PublishingService:
         published_state = version.published_state
         if version.visibility == "public":
             published_state = "published"
-        return self.store.update_report_version(version_id, canonical_url=url, published_state=published_state)
+        updates: Dict[str, Any] = {"canonical_url": url, "published_state": published_state}
+        snapshot = None
+        if published_state == "published" and self.bundles is not None:
+            snapshot = self._bundle_snapshot(version)
+            updates["data_version_hash"] = snapshot.data_version_hash
+        updated = self.store.update_report_version(version_id, **updates)
+        for replaced in self.store.list_report_versions():
+            if replaced.replaced_by == version_id and replaced.canonical_url:
+                self._redirect(replaced.canonical_url, url)
+        if snapshot is not None:
+            self.write_bundle(updated, snapshot)
+        return updated
+
+    def write_bundle(self, version: ReportVersion, snapshot: AggregationSnapshot) -> Dict[str, Any]:
+        if self.bundles is None or not version.canonical_url:
+            raise ValidationError("report_bundles_unavailable")
+        template = self.store.get_report_template(version.template_id)
+        if template is None:
+            raise ValidationError("report_template_not_found")
+        payloads = ReportService(self.store).build_report_payloads(
+            template,
+            snapshot,
+            list(snapshot.metrics.get("kommuner", {})),
+            texts_url=f"{version.canonical_url}/texts",
+        )
+        return self.bundles.write(
+            version.canonical_url, version.id, template.survey_id, snapshot.data_version_hash, payloads
+        )
+
+    def _bundle_snapshot(self, version: ReportVersion) -> AggregationSnapshot:
+        template = self.store.get_report_template(version.template_id)
+        if template is None:
+            raise ValidationError("report_template_not_found")
+        if version.data_version_hash:
+            snapshot = self.store.get_aggregation_version(template.survey_id, version.data_version_hash)
+        else:
+            snapshot = AggregationService(self.store).pin_snapshot(template.survey_id)
+        if snapshot is None:
+            raise ValidationError("aggregation_missing")
+        return snapshot
 
     def replace(self, actor: User, old_version_id: int, new_version_id: int) -> None:
         require_role(actor, ["analyst", "admin"])
@@ -338,7 +778,20 @@ class PublishingService:
             raise ValidationError("report_version_not_found")
         if version.replaced_by is not None:
             raise ConflictError("report_version_already_replaced")
+        replacement = self.store.get_report_version(new_version_id)
+        if replacement is None:
+            raise ValidationError("report_version_not_found")
+        if version.canonical_url and replacement.canonical_url:
+            self._redirect(version.canonical_url, replacement.canonical_url)
         self.store.update_report_version(old_version_id, replaced_by=new_version_id)
+        if self.bundles is not None and version.canonical_url:
+            self.bundles.discard(version.canonical_url)
+
+    def _redirect(self, source_url: str, target_url: str) -> None:
+        final_url = self.store.get_report_redirect(target_url) or target_url
+        if final_url == source_url:
+            raise ConflictError("report_redirect_cycle")
+        self.store.redirect_report_url(source_url, final_url)
 
     def unpublish(self, actor: User, version_id: int) -> ReportVersion:
         require_role(actor, ["admin"])
@@ -358,13 +811,13 @@ class PublishingService:
         version = self.store.get_report_version(version_id)
         if version is None:
             raise ValidationError("report_version_not_found")
-        if version.replaced_by:
+        url = version.canonical_url
+        if not url and version.replaced_by:
             replacement = self.store.get_report_version(version.replaced_by)
-            if replacement and replacement.canonical_url:
-                return replacement.canonical_url
-        if not version.canonical_url:
+            url = replacement.canonical_url if replacement else None
+        if not url:
             raise ValidationError("canonical_url_missing")
-        return version.canonical_url
+        return self.store.get_report_redirect(url) or url
 
 
 class PublicSiteService:
@@ -383,41 +836,45 @@ class PublicSiteService:
         return self.response_store.list_news()
 
     def list_public_reports(self) -> List[Dict[str, Any]]:
-        entries = []
-        for version in self.response_store.list_report_versions():
-            if version.visibility != "public" or version.published_state != "published" or not version.canonical_url:
-                continue
-            entries.append(
-                {
-                    "version_id": version.id,
-                    "template_id": version.template_id,
-                    "canonical_url": version.canonical_url,
-                }
-            )
-        return entries
+        return [entry.as_dict() for entry in ReportLibraryService(self.response_store).index().entries()]
 
-    def read_report(
+    def search_public_reports(
         self,
-        canonical_url: str,
+        query: Optional[str] = None,
+        survey_id: Optional[int] = None,
         kommun: Optional[str] = None,
-        viewer: Optional[User] = None,
+        cursor: Optional[str] = None,
+        limit: int = LIBRARY_PAGE_SIZE,
     ) -> Dict[str, Any]:
-        version = self.response_store.get_report_version_by_url(canonical_url)
-        if version is None:
+        return ReportLibraryService(self.response_store).search(query, survey_id, kommun, cursor, limit)
+
+    def _resolve_public(self, canonical_url: str, with_snapshot: bool = True) -> ResolvedReport:
+        resolved = self.response_store.resolve_report(canonical_url, with_snapshot=with_snapshot)
+        if resolved is None:
             raise ValidationError("report_not_found")
-        if version.replaced_by:
-            replacement = self.response_store.get_report_version(version.replaced_by)
-            if replacement and replacement.canonical_url:
-                redirect_url = replacement.canonical_url
-                if kommun:
-                    redirect_url = f"{redirect_url}?kommun={kommun}"
-                return {"redirect": redirect_url}
+        if resolved.replacement_url:
+            return resolved
+        version = resolved.version
         if version.visibility != "public" or version.published_state != "published":
             raise UnauthorizedError("report_not_public")
-        template = self.response_store.get_report_template(version.template_id)
-        if template is None:
+        if resolved.template is None:
             raise ValidationError("report_template_not_found")
-        snapshot = self.response_store.get_aggregation(template.survey_id)
+        return resolved
+
+    def read_report(
+        self,
+        canonical_url: str,
+        kommun: Optional[str] = None,
+        viewer: Optional[User] = None,
+        if_none_match: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        resolved = self._resolve_public(canonical_url)
+        if resolved.replacement_url:
+            redirect_url = resolved.replacement_url
+            if kommun:
+                redirect_url = f"{redirect_url}?{urlencode({'kommun': kommun})}"
+            return {"redirect": redirect_url}
+        template, snapshot = resolved.template, resolved.snapshot
         if snapshot is None:
             raise ValidationError("aggregation_missing")
         if kommun is None and viewer is not None:
@@ -426,10 +883,40 @@ class PublicSiteService:
                 kommun = profile.kommun
         if not kommun:
             raise ValidationError("kommun_required")
-        curated_texts = self.response_store.list_public_texts(sorted(ALLOWED_PUBLIC_TEXT_STATUSES))
-        report_service = ReportService(self.response_store)
-        payload = report_service.build_report_payload(template, snapshot, kommun=kommun, text_entries=curated_texts)
-        return {"canonical_url": canonical_url, "payload": payload}
+        etag = make_etag(resolved.version.id, kommun, snapshot.data_version_hash, snapshot.min_responses)
+        if etag_matches(if_none_match, etag):
+            return {"canonical_url": canonical_url, "etag": etag, "not_modified": True}
+        cache = caches_for(self.response_store).report_payloads
+        key = (template.survey_id, resolved.version.id, kommun, snapshot.data_version_hash, snapshot.min_responses)
+        payload = cache.get(key)
+        if payload is None:
+            payload = cache.put(
+                key,
+                ReportService(self.response_store).build_report_payload(
+                    template, snapshot, kommun=kommun, texts_url=f"{canonical_url}/texts"
+                ),
+            )
+        return {"canonical_url": canonical_url, "payload": payload, "etag": etag}
+
+    def read_report_texts(
+        self,
+        canonical_url: str,
+        cursor: Optional[str] = None,
+        limit: int = CURATED_TEXT_PAGE_SIZE,
+        if_none_match: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        resolved = self._resolve_public(canonical_url, with_snapshot=False)
+        if resolved.replacement_url:
+            return {"redirect": f"{resolved.replacement_url}/texts"}
+        survey_id = resolved.template.survey_id
+        etag = make_etag("texts", resolved.version.id, cursor, limit, self.response_store.text_revision(survey_id))
+        if etag_matches(if_none_match, etag):
+            return {"canonical_url": canonical_url, "etag": etag, "not_modified": True}
+        page = CuratedTextService(self.response_store).page(survey_id, cursor=cursor, limit=limit)
+        return {"canonical_url": canonical_url, **page, "etag": etag}
+
+    def report_cache_stats(self) -> Dict[str, int]:
+        return caches_for(self.response_store).report_payloads.stats()
 
 
 class ModerationService:
@@ -454,6 +941,10 @@ class ModerationService:
             id=self.store.next_id("redaction_event"), flag_id=flag_id, curator_id=curator.id, note=note
         )
         self.store.add_redaction_event(event)
+        flag = self.store.get_text_flag(flag_id)
+        response = self.store.get_response(flag.response_id) if flag else None
+        if response is not None:
+            self.store.bump_text_revision(response.survey_id)
         self._log_audit(curator.id, action=f"text_redaction:{flag_id}")
         return event
 
@@ -473,6 +964,14 @@ class ModerationService:
             reviewed_by=curator.id,
             reviewed_at=datetime.now(timezone.utc).isoformat(),
         )
+        response = self.store.get_response(response_id)
+        if response is not None:
+            TextTermService(self.store).record_status_change(response, review.status, resolved_status)
+        public_change = (review.status in ALLOWED_PUBLIC_TEXT_STATUSES) != (
+            resolved_status in ALLOWED_PUBLIC_TEXT_STATUSES
+        )
+        if response is not None and (public_change or text_sort_rank(review.status) != text_sort_rank(resolved_status)):
+            self.store.bump_text_revision(response.survey_id)
         self._log_audit(curator.id, action=f"text_review:{response_id}:{resolved_status}")
         return updated
 
@@ -1,21 +1,28 @@
 from __future__ import annotations
 
 import secrets
+import threading
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from copy import deepcopy
 from dataclasses import replace
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+from .aggregation import SurveyLayout, aggregate_chunk, reported_kommuner
 from .domain import (
     AggregationSnapshot,
     AiAnalysisRequest,
     AuditEvent,
     BaseProfile,
     ConsentRecord,
+    CuratedText,
     IntroductionEvent,
     MailOutbox,
     NewsItem,
     NetworkPreference,
     ReportTemplate,
     ReportVersion,
+    ResolvedReport,
     Session,
     Survey,
     SurveyResponse,
@@ -24,6 +31,7 @@ from .domain import (
     TextRedactionEvent,
     User,
     ConflictError,
+    text_sort_rank,
 )
 
 
@@ -148,14 +156,23 @@ class ResponseStore:
         self._responses: Dict[int, SurveyResponse] = {}
         self._responses_by_pseudonym_survey: Dict[tuple[str, int], int] = {}
         self._aggregations: Dict[int, AggregationSnapshot] = {}
+        self._aggregation_history: Dict[int, Dict[str, AggregationSnapshot]] = {}
+        self._aggregation_coverage: Dict[int, frozenset[str]] = {}
+        self._aggregation_locks: Dict[int, threading.RLock] = {}
+        self._aggregation_locks_guard = threading.Lock()
         self._templates: Dict[int, ReportTemplate] = {}
         self._report_versions: Dict[int, ReportVersion] = {}
         self._report_versions_by_url: Dict[str, int] = {}
+        self._report_library_revision = 0
+        self._report_redirects: Dict[str, str] = {}
+        self._report_redirect_sources: Dict[str, set[str]] = {}
         self._news: Dict[int, NewsItem] = {}
         self._text_flags: Dict[int, TextFlag] = {}
         self._redaction_events: Dict[int, TextRedactionEvent] = {}
         self._text_reviews: Dict[int, TextReview] = {}
         self._text_reviews_by_response: Dict[int, int] = {}
+        self._text_revisions: Dict[int, int] = {}
+        self._curated_order: Dict[int, List[Tuple[int, int]]] = {}
         self._ai_requests: Dict[int, AiAnalysisRequest] = {}
         self._id_counters: Dict[str, int] = {}
 
@@ -188,17 +205,80 @@ class ResponseStore:
             return None
         return self._responses.get(response_id)
 
+    def get_response(self, response_id: int) -> Optional[SurveyResponse]:
+        return self._responses.get(response_id)
+
     def list_responses_for_survey(self, survey_id: int) -> List[SurveyResponse]:
         return [response for response in self._responses.values() if response.survey_id == survey_id]
 
     # Aggregations
+    @contextmanager
+    def aggregation_lock(self, survey_id: int) -> Iterator[None]:
+        with self._aggregation_locks_guard:
+            lock = self._aggregation_locks.setdefault(survey_id, threading.RLock())
+        with lock:
+            yield
+
+    def response_chunk_bounds(self, survey_id: int, chunk_size: int) -> List[int]:
+        ids = sorted(response.id for response in self._responses.values() if response.survey_id == survey_id)
+        bounds = ids[chunk_size - 1 :: chunk_size]
+        if ids and (not bounds or bounds[-1] != ids[-1]):
+            bounds.append(ids[-1])
+        return bounds
+
+    def aggregate_survey(
+        self,
+        survey_id: int,
+        layout: SurveyLayout,
+        after_id: Optional[int] = None,
+        up_to_id: Optional[int] = None,
+    ) -> Tuple[Dict[str, Any], str]:
+        responses = [
+            response
+            for response in self._responses.values()
+            if response.survey_id == survey_id
+            and (after_id is None or response.id > after_id)
+            and (up_to_id is None or response.id <= up_to_id)
+        ]
+        return aggregate_chunk(responses, layout)
+
     def upsert_aggregation(self, snapshot: AggregationSnapshot) -> AggregationSnapshot:
+        coverage = frozenset(reported_kommuner(snapshot.metrics, snapshot.min_responses))
+        if self._aggregation_coverage.get(snapshot.survey_id) != coverage:
+            self._aggregation_coverage[snapshot.survey_id] = coverage
+            self._report_library_revision += 1
         self._aggregations[snapshot.survey_id] = snapshot
         return snapshot
 
+    def add_aggregation_version(self, snapshot: AggregationSnapshot) -> AggregationSnapshot:
+        history = self._aggregation_history.setdefault(snapshot.survey_id, {})
+        archived = history.pop(snapshot.data_version_hash, None)
+        if archived is None:
+            archived = replace(snapshot, metrics=deepcopy(snapshot.metrics))
+        history[snapshot.data_version_hash] = archived
+        return archived
+
     def get_aggregation(self, survey_id: int) -> Optional[AggregationSnapshot]:
         return self._aggregations.get(survey_id)
 
+    def get_aggregation_version(self, survey_id: int, data_version_hash: str) -> Optional[AggregationSnapshot]:
+        return self._aggregation_history.get(survey_id, {}).get(data_version_hash)
+
+    def list_aggregation_history(self, survey_id: int) -> List[AggregationSnapshot]:
+        return list(self._aggregation_history.get(survey_id, {}).values())
+
+    def prune_aggregation_history(self, survey_id: int, keep: int) -> None:
+        history = self._aggregation_history.get(survey_id, {})
+        pinned = set()
+        for version in self._report_versions.values():
+            template = self._templates.get(version.template_id)
+            if version.data_version_hash and template and template.survey_id == survey_id:
+                pinned.add(version.data_version_hash)
+        expired = list(history)[: max(len(history) - keep, 0)]
+        for data_version_hash in expired:
+            if data_version_hash not in pinned:
+                del history[data_version_hash]
+
     # Reports
     def add_report_template(self, template: ReportTemplate) -> ReportTemplate:
         self._templates[template.id] = template
@@ -211,6 +291,7 @@ class ResponseStore:
         self._report_versions[version.id] = version
         if version.canonical_url:
             self._report_versions_by_url[version.canonical_url] = version.id
+        self._report_library_revision += 1
         return version
 
     def update_report_version(self, version_id: int, **updates) -> ReportVersion:
@@ -223,6 +304,7 @@ class ResponseStore:
         self._report_versions[version_id] = updated
         if updated.canonical_url:
             self._report_versions_by_url[updated.canonical_url] = updated.id
+        self._report_library_revision += 1
         return updated
 
     def get_report_version(self, version_id: int) -> Optional[ReportVersion]:
@@ -237,6 +319,38 @@ class ResponseStore:
     def list_report_versions(self) -> List[ReportVersion]:
         return list(self._report_versions.values())
 
+    def report_library_revision(self) -> int:
+        return self._report_library_revision
+
+    def get_report_redirect(self, url: str) -> Optional[str]:
+        return self._report_redirects.get(url)
+
+    def redirect_report_url(self, source_url: str, target_url: str) -> None:
+        sources = self._report_redirect_sources.pop(source_url, set())
+        sources.add(source_url)
+        previous = self._report_redirects.get(source_url)
+        if previous is not None:
+            self._report_redirect_sources.get(previous, set()).discard(source_url)
+        for source in sources:
+            self._report_redirects[source] = target_url
+        self._report_redirect_sources.setdefault(target_url, set()).update(sources)
+
+    def resolve_report(self, url: str, with_snapshot: bool = True) -> Optional[ResolvedReport]:
+        version = self._report_versions.get(self._report_versions_by_url.get(url))
+        if version is None:
+            return None
+        redirect_url = self._report_redirects.get(url)
+        if redirect_url:
+            return ResolvedReport(version=version, replacement_url=redirect_url)
+        template = self._templates.get(version.template_id)
+        snapshot = None
+        if template and with_snapshot:
+            if version.data_version_hash:
+                snapshot = self._aggregation_history.get(template.survey_id, {}).get(version.data_version_hash)
+            else:
+                snapshot = self._aggregations.get(template.survey_id)
+        return ResolvedReport(version=version, template=template, snapshot=snapshot)
+
     # News
     def add_news_item(self, item: NewsItem) -> NewsItem:
         self._news[item.id] = item
@@ -254,6 +368,9 @@ class ResponseStore:
         self._redaction_events[event.id] = event
         return event
 
+    def get_text_flag(self, flag_id: int) -> Optional[TextFlag]:
+        return self._text_flags.get(flag_id)
+
     def list_text_flags(self) -> List[TextFlag]:
         return list(self._text_flags.values())
 
@@ -265,14 +382,28 @@ class ResponseStore:
             raise ConflictError("text_review_exists")
         self._text_reviews[review.id] = review
         self._text_reviews_by_response[review.response_id] = review.id
+        self._index_curated_text(None, review)
         return review
 
     def update_text_review(self, review_id: int, **updates) -> TextReview:
         review = self._text_reviews[review_id]
         updated = replace(review, **updates)
         self._text_reviews[review_id] = updated
+        self._index_curated_text(review, updated)
         return updated
 
+    def _index_curated_text(self, previous: Optional[TextReview], review: TextReview) -> None:
+        response = self._responses.get(review.response_id)
+        if response is None:
+            return
+        order = self._curated_order.setdefault(response.survey_id, [])
+        if previous is not None:
+            key = (text_sort_rank(previous.status), previous.response_id)
+            index = bisect_left(order, key)
+            if index < len(order) and order[index] == key:
+                del order[index]
+        insort(order, (text_sort_rank(review.status), review.response_id))
+
     def get_text_review_for_response(self, response_id: int) -> Optional[TextReview]:
         review_id = self._text_reviews_by_response.get(response_id)
         if review_id is None:
@@ -282,6 +413,13 @@ class ResponseStore:
     def list_text_reviews(self) -> List[TextReview]:
         return list(self._text_reviews.values())
 
+    def text_revision(self, survey_id: int) -> int:
+        return self._text_revisions.get(survey_id, 0)
+
+    def bump_text_revision(self, survey_id: int) -> int:
+        self._text_revisions[survey_id] = self.text_revision(survey_id) + 1
+        return self._text_revisions[survey_id]
+
     def list_public_texts(self, allowed_statuses: List[str]) -> List[str]:
         texts: List[str] = []
         allowed = set(allowed_statuses)
@@ -294,6 +432,43 @@ class ResponseStore:
             texts.extend(list(response.raw_text_fields.values()))
         return texts
 
+    def list_curated_texts(
+        self,
+        survey_id: int,
+        allowed_statuses: List[str],
+        after: Optional[Tuple[int, int, str]] = None,
+        limit: int = 20,
+    ) -> List[CuratedText]:
+        allowed = set(allowed_statuses)
+        order = self._curated_order.get(survey_id, [])
+        start = bisect_left(order, after[:2]) if after else 0
+        texts: List[CuratedText] = []
+        for sort_rank, response_id in order[start:]:
+            review = self.get_text_review_for_response(response_id)
+            response = self._responses.get(response_id)
+            if review is None or response is None or review.status not in allowed:
+                continue
+            for field_key in sorted(response.raw_text_fields):
+                text = CuratedText(sort_rank, response_id, field_key, response.raw_text_fields[field_key])
+                if after and text.position <= after:
+                    continue
+                texts.append(text)
+                if len(texts) >= limit:
+                    return texts
+        return texts
+
+    def list_public_texts_for_survey(self, survey_id: int, allowed_statuses: List[str]) -> List[str]:
+        texts: List[str] = []
+        allowed = set(allowed_statuses)
+        for review in self._text_reviews.values():
+            if review.status not in allowed:
+                continue
+            response = self._responses.get(review.response_id)
+            if not response or response.survey_id != survey_id:
+                continue
+            texts.extend(list(response.raw_text_fields.values()))
+        return texts
+
     # AI requests
     def add_ai_request(self, request: AiAnalysisRequest) -> AiAnalysisRequest:
         self._ai_requests[request.id] = request
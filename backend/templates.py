@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Pattern, Sequence, Tuple, Union
+
+from .aggregation import SurveyLayout, crosstab_key
+from .conditions import Condition, compile_scoped_condition
+from .domain import AggregationSnapshot, ReportTemplate, ValidationError
+
+PlaceholderResolver = Callable[[AggregationSnapshot, str], str]
+
+PLACEHOLDERS: Dict[str, PlaceholderResolver] = {
+    "$kommun": lambda snapshot, kommun: kommun,
+    "$antal_respondenter": lambda snapshot, kommun: str(snapshot.metrics.get("total", 0)),
+}
+SHARED_PLACEHOLDERS = frozenset({"$antal_respondenter"})
+SERIES_BLOCK_TYPES = ("chart", "table")
+SERIES_SCOPES = ("survey", "kommun")
+
+
+@dataclass(frozen=True)
+class Placeholder:
+    name: str
+
+
+Segment = Union[str, Placeholder]
+
+
+@dataclass(frozen=True)
+class CompiledBlock:
+    type: str
+    segments: Tuple[Segment, ...]
+    condition: Condition
+    options: Dict[str, Any]
+    kommun_condition: bool = False
+    kommun_content: bool = False
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    template_id: int
+    blocks: Tuple[CompiledBlock, ...]
+    placeholders: Tuple[str, ...]
+
+    def resolve(self, snapshot: AggregationSnapshot, kommun: str) -> Dict[str, str]:
+        return {name: PLACEHOLDERS[name](snapshot, kommun) for name in self.placeholders}
+
+    def resolve_shared(self, snapshot: AggregationSnapshot) -> Dict[str, str]:
+        return {name: PLACEHOLDERS[name](snapshot, "") for name in self.placeholders if name in SHARED_PLACEHOLDERS}
+
+    def resolve_kommun(self, snapshot: AggregationSnapshot, kommun: str) -> Dict[str, str]:
+        return {
+            name: PLACEHOLDERS[name](snapshot, kommun) for name in self.placeholders if name not in SHARED_PLACEHOLDERS
+        }
+
+
+@lru_cache(maxsize=8)
+def placeholder_pattern(names: Tuple[str, ...]) -> Pattern[str]:
+    alternatives = "|".join(re.escape(name) for name in sorted(names, key=lambda name: (-len(name), name)))
+    return re.compile(alternatives)
+
+
+def _pattern() -> Pattern[str]:
+    return placeholder_pattern(tuple(sorted(PLACEHOLDERS)))
+
+
+def parse_segments(content: str, pattern: Optional[Pattern[str]] = None) -> Tuple[Segment, ...]:
+    pattern = pattern or _pattern()
+    segments: List[Segment] = []
+    position = 0
+    for match in pattern.finditer(content):
+        if match.start() > position:
+            segments.append(content[position : match.start()])
+        segments.append(Placeholder(match.group(0)))
+        position = match.end()
+    if position < len(content):
+        segments.append(content[position:])
+    return tuple(segments)
+
+
+def series_binding(block: Dict[str, Any], layout: SurveyLayout) -> Tuple[str, str]:
+    scope = block.get("scope", "survey")
+    if scope not in SERIES_SCOPES:
+        raise ValidationError("invalid_chart_binding")
+    if block.get("question") and not block.get("crosstab"):
+        if block["question"] not in {question.key for question in layout.questions}:
+            raise ValidationError("invalid_chart_binding")
+        return "question", str(block["question"])
+    declared = {crosstab_key([question.key for question in members]) for members in layout.crosstabs}
+    if (
+        block.get("crosstab")
+        and not block.get("question")
+        and scope == "survey"
+        and crosstab_key(block["crosstab"]) in declared
+    ):
+        return "crosstab", crosstab_key(block["crosstab"])
+    raise ValidationError("invalid_chart_binding")
+
+
+def compile_template(template: ReportTemplate, layout: SurveyLayout = SurveyLayout()) -> CompiledTemplate:
+    pattern = _pattern()
+    blocks = []
+    placeholders: Dict[str, None] = {}
+    for block in template.blocks:
+        segments = parse_segments(block.get("content", ""), pattern)
+        for segment in segments:
+            if isinstance(segment, Placeholder):
+                placeholders[segment.name] = None
+        options = {key: value for key, value in block.items() if key not in ("type", "content", "condition")}
+        condition, kommun_condition = compile_scoped_condition(block.get("condition"), layout)
+        if block.get("type") in SERIES_BLOCK_TYPES:
+            options["binding"] = series_binding(block, layout)
+            options["scope"] = block.get("scope", "survey")
+        blocks.append(
+            CompiledBlock(
+                type=block.get("type", "text"),
+                segments=segments,
+                condition=condition,
+                options=options,
+                kommun_condition=kommun_condition,
+                kommun_content=options.get("scope") == "kommun"
+                or any(
+                    isinstance(segment, Placeholder) and segment.name not in SHARED_PLACEHOLDERS for segment in segments
+                ),
+            )
+        )
+    return CompiledTemplate(template_id=template.id, blocks=tuple(blocks), placeholders=tuple(placeholders))
+
+
+def render_segments(segments: Sequence[Segment], values: Dict[str, str]) -> str:
+    return "".join(segment if isinstance(segment, str) else values[segment.name] for segment in segments)
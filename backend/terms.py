@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+", re.UNICODE)
+MIN_TERM_LENGTH = 3
+STOPWORDS = frozenset(
+    """
+    alla att av blev blir bara dem den denna deras det dig din dina ditt dom där efter eftersom eller ett fick
+    från får fått för hade han hans har hela henne hennes hon honom hur här inga inget inte jag kan kommer man
+    med men mig min mina mitt mot mycket många något några när och också oss ska skulle som till under upp
+    utan var vad vara varit vilka vilken vilket vid vår våra vårt än även
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token
+        for token in (match.group(0).lower() for match in TOKEN_PATTERN.finditer(text))
+        if len(token) >= MIN_TERM_LENGTH and token not in STOPWORDS
+    ]
+
+
+class TermSketch:
+    def __init__(self, width: int = 2048, depth: int = 4, capacity: int = 64):
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self._rows = [array("q", [0]) * width for _ in range(depth)]
+        self._candidates: Dict[str, int] = {}
+        self._floor: Optional[int] = None
+
+    def _buckets(self, term: str) -> List[int]:
+        digest = hashlib.blake2b(term.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[row * 4 : row * 4 + 4], "big") % self.width for row in range(self.depth)]
+
+    def estimate(self, term: str) -> int:
+        return max(0, min(self._rows[row][bucket] for row, bucket in enumerate(self._buckets(term))))
+
+    def add_texts(self, texts: Iterable[str], weight: int = 1) -> None:
+        for text in texts:
+            for term in tokenize(text):
+                self._update(term, weight)
+
+    def remove_texts(self, texts: Iterable[str]) -> None:
+        self.add_texts(texts, weight=-1)
+
+    def _update(self, term: str, weight: int) -> None:
+        buckets = self._buckets(term)
+        for row, bucket in enumerate(buckets):
+            self._rows[row][bucket] += weight
+        estimate = max(0, min(self._rows[row][bucket] for row, bucket in enumerate(buckets)))
+        if term in self._candidates:
+            self._candidates[term] = estimate
+            if weight < 0:
+                self._floor = None
+            return
+        if weight < 0 or estimate == 0:
+            return
+        if len(self._candidates) < self.capacity:
+            self._candidates[term] = estimate
+            self._floor = None
+            return
+        if self._floor is None:
+            self._floor = min(self._candidates.values())
+        if estimate <= self._floor:
+            return
+        weakest = min(self._candidates, key=lambda candidate: (self._candidates[candidate], candidate))
+        del self._candidates[weakest]
+        self._candidates[term] = estimate
+        self._floor = None
+
+    def top(self, k: int = 10) -> List[Dict[str, object]]:
+        ranked = sorted(
+            ((term, count) for term, count in self._candidates.items() if count > 0),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return [{"term": term, "count": count} for term, count in ranked[:k]]
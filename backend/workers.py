@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .aggregation import SurveyLayout, build_layout, combine_data_versions, merge_metrics
+from .domain import AggregationSnapshot, Survey
+from .services import AggregationService
+from .storage import ResponseStore
+
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+_worker_store: Optional[ResponseStore] = None
+
+
+def _use_store(store: ResponseStore) -> None:
+    global _worker_store
+    _worker_store = store
+
+
+def _open_store(store_factory: Callable[[], ResponseStore]) -> None:
+    _use_store(store_factory())
+
+
+def aggregate_range(
+    survey_id: int, layout: SurveyLayout, after_id: Optional[int], up_to_id: int
+) -> Tuple[Dict[str, Any], str]:
+    return _worker_store.aggregate_survey(survey_id, layout, after_id=after_id, up_to_id=up_to_id)
+
+
+def postgres_response_store() -> ResponseStore:
+    from .postgres_store import PostgresStores
+
+    return PostgresStores().responses
+
+
+class AggregationRecomputeWorker:
+    def __init__(
+        self,
+        store: ResponseStore,
+        max_workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        store_factory: Optional[Callable[[], ResponseStore]] = None,
+    ):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        self.store = store
+        self.aggregations = AggregationService(store)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.store_factory = store_factory
+
+    def pool_options(self) -> Dict[str, Any]:
+        if self.store_factory is not None:
+            return {"initializer": _open_store, "initargs": (self.store_factory,)}
+        return {"initializer": _use_store, "initargs": (self.store,)}
+
+    def recompute_all(self) -> List[AggregationSnapshot]:
+        return self.recompute(self.store.list_surveys())
+
+    def recompute(self, surveys: Sequence[Survey]) -> List[AggregationSnapshot]:
+        with ProcessPoolExecutor(max_workers=self.max_workers, **self.pool_options()) as pool:
+            return self.recompute_with(pool, surveys)
+
+    def recompute_with(self, pool: Executor, surveys: Sequence[Survey]) -> List[AggregationSnapshot]:
+        pending: List[Tuple[Survey, SurveyLayout, Optional[int], List[Future]]] = []
+        for survey in surveys:
+            layout = build_layout(survey.schema)
+            bounds = self.store.response_chunk_bounds(survey.id, self.chunk_size)
+            futures = [
+                pool.submit(aggregate_range, survey.id, layout, after_id, up_to_id)
+                for after_id, up_to_id in zip([None, *bounds], bounds)
+            ]
+            pending.append((survey, layout, bounds[-1] if bounds else None, futures))
+        snapshots = []
+        for survey, layout, high_water, futures in pending:
+            partials = [future.result() for future in futures]
+            snapshots.append(self._store(survey, layout, high_water, partials))
+        self.aggregations.prune_history([survey.id for survey in surveys])
+        return snapshots
+
+    def _store(
+        self,
+        survey: Survey,
+        layout: SurveyLayout,
+        high_water: Optional[int],
+        partials: List[Tuple[Dict[str, Any], str]],
+    ) -> AggregationSnapshot:
+        with self.store.aggregation_lock(survey.id):
+            partials.append(self.store.aggregate_survey(survey.id, layout, after_id=high_water))
+            current = self.store.get_aggregation(survey.id)
+            snapshot = AggregationSnapshot(
+                survey_id=survey.id,
+                data_version_hash=combine_data_versions(*(data_version for _, data_version in partials)),
+                metrics=merge_metrics([metrics for metrics, _ in partials], layout),
+                min_responses=current.min_responses if current else survey.min_responses_default,
+            )
+            return self.aggregations.store_snapshot(snapshot, record_history=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="NPF Hubben full aggregation recompute")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    AggregationRecomputeWorker(
+        postgres_response_store(),
+        max_workers=args.workers,
+        chunk_size=args.chunk_size,
+        store_factory=postgres_response_store,
+    ).recompute_all()
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import socket
+import threading
+import unittest
+from http.client import HTTPConnection
+
+from backend.async_server import AsyncReportServer
+from backend.routes import Response
+from backend.security import RateLimiter
+from backend.services import AuthService, PublishingService, ReportService, ResponseService, SurveyService
+from backend.storage import InMemoryStores
+
+
+class AsyncServerTests(unittest.TestCase):
+    def setUp(self):
+        self.stores = InMemoryStores()
+        self.loop = asyncio.new_event_loop()
+        self.server = AsyncReportServer(host="127.0.0.1", port=0, stores=self.stores, max_concurrency=4)
+        self.loop.run_until_complete(self.server.start())
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.host, self.port = self.server.server_address
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+
+    def test_connection_is_reused_across_routes(self):
+        auth = AuthService(self.stores.pii, RateLimiter())
+        analyst = auth.verify_email(auth.register("async-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        survey = SurveyService(self.stores.responses).create_survey({"questions": [{"type": "scale"}]})
+        ResponseService(self.stores.responses, self.stores.pii).submit_response(analyst, survey.id, {"q1": 4})
+        template = ReportService(self.stores.responses).create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        publishing = PublishingService(self.stores.responses)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, version.id, "asynk")
+        connection = HTTPConnection(self.host, self.port)
+        results = []
+        for path in ("/health", "/version", "/public/reports", "/reports/asynk?kommun=Lund", "/missing"):
+            connection.request("GET", path)
+            response = connection.getresponse()
+            results.append((response.status, json.loads(response.read())))
+            if path == "/health":
+                sock = connection.sock
+            self.assertIs(connection.sock, sock)
+        self.assertEqual([status for status, _ in results], [200, 200, 200, 200, 404])
+        self.assertEqual(results[0][1], {"status": "ok"})
+        self.assertEqual(results[3][1]["payload"]["blocks"], [{"type": "text", "content": "Hej"}])
+        connection.request("GET", "/public/reports")
+        etag = connection.getresponse()
+        etag.read()
+        connection.request("GET", "/public/reports", headers={"If-None-Match": etag.getheader("ETag")})
+        cached = connection.getresponse()
+        self.assertEqual((cached.status, cached.read()), (304, b""))
+
+    def test_http10_and_connection_close_end_the_connection(self):
+        with socket.create_connection((self.host, self.port)) as raw:
+            raw.sendall(b"GET /health HTTP/1.0\r\n\r\n")
+            reply = b""
+            while chunk := raw.recv(4096):
+                reply += chunk
+        self.assertTrue(reply.startswith(b"HTTP/1.1 200 OK"))
+        self.assertIn(b"Connection: close", reply)
+        self.assertTrue(reply.endswith(b'{"status": "ok"}'))
+        with socket.create_connection((self.host, self.port)) as raw:
+            raw.sendall(b"POST /health HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}")
+            reply = b""
+            while chunk := raw.recv(4096):
+                reply += chunk
+        self.assertTrue(reply.startswith(b"HTTP/1.1 405"))
+        with socket.create_connection((self.host, self.port)) as raw:
+            raw.sendall(b"GET /health HTTP/1.1\r\nContent-Length: 1000000000\r\n\r\n")
+            reply = b""
+            while chunk := raw.recv(4096):
+                reply += chunk
+        self.assertTrue(reply.startswith(b"HTTP/1.1 413"))
+        self.assertIn(b"Connection: close", reply)
+
+    def test_header_values_cannot_inject_lines(self):
+        auth = AuthService(self.stores.pii, RateLimiter())
+        analyst = auth.verify_email(auth.register("crlf-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        survey = SurveyService(self.stores.responses).create_survey({"questions": [{"type": "scale"}]})
+        ResponseService(self.stores.responses, self.stores.pii).submit_response(analyst, survey.id, {"q1": 4})
+        template = ReportService(self.stores.responses).create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        publishing = PublishingService(self.stores.responses)
+        old = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, old.id, "crlf-gammal")
+        new = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, new.id, "crlf-ny")
+        publishing.replace(analyst, old.id, new.id)
+        connection = HTTPConnection(self.host, self.port)
+        connection.request("GET", "/reports/crlf-gammal?kommun=Lund%0D%0ASet-Cookie:%20x=1")
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 302)
+        self.assertEqual(response.getheader("Location"), "/reports/crlf-ny?kommun=Lund%0D%0ASet-Cookie%3A+x%3D1")
+        self.assertIsNone(response.getheader("Set-Cookie"))
+        self.server.router.handle = lambda target, headers: Response(302, [("Location", "/\r\nSet-Cookie: x=1")])
+        connection.request("GET", "/health")
+        response = connection.getresponse()
+        self.assertEqual((response.status, json.loads(response.read())), (500, {"error": "internal_error"}))
+        self.assertIsNone(response.getheader("Set-Cookie"))
+        self.assertEqual(response.getheader("Connection"), "close")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import gzip
+import unittest
+
+from backend.compression import SUPPORTED_ENCODINGS, compress, negotiate_encoding, parse_accept_encoding
+from backend.etags import encoded_etag, etag_matches, make_etag
+
+
+class CompressionTests(unittest.TestCase):
+    def test_accept_encoding_weights(self):
+        self.assertEqual(parse_accept_encoding("gzip;q=0.5, br, *;q=0"), {"gzip": 0.5, "br": 1.0, "*": 0.0})
+        self.assertEqual(negotiate_encoding("deflate, gzip;q=0.8"), "gzip")
+        self.assertIsNone(negotiate_encoding("gzip;q=0, identity"))
+        self.assertIsNone(negotiate_encoding(None))
+        self.assertEqual(negotiate_encoding("*"), SUPPORTED_ENCODINGS[0])
+
+    def test_gzip_is_deterministic(self):
+        body = b'{"payload": "' + b"x" * 4096 + b'"}'
+        self.assertEqual(compress("gzip", body), compress("gzip", body))
+        self.assertEqual(gzip.decompress(compress("gzip", body)), body)
+        with self.assertRaises(ValueError):
+            compress("deflate", body)
+
+    def test_encoded_etag_matches_base_representation(self):
+        etag = make_etag(1, "Lund", "abc")
+        self.assertTrue(etag_matches(encoded_etag(etag, "gzip"), etag))
+        self.assertTrue(etag_matches(f'"other", W/{etag}', etag))
+        self.assertFalse(etag_matches(encoded_etag(make_etag(2), "gzip"), etag))
+
+
+if __name__ == "__main__":
+    unittest.main()
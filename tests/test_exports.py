@@ -0,0 +1,99 @@
+import os
+import re
+import struct
+import tempfile
+import threading
+import unittest
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.exports import ReportExportWorker, render_pdf, render_png
+from backend.security import RateLimiter
+from backend.services import (
+    AuthService,
+    BaseProfileService,
+    PublishingService,
+    ReportService,
+    ResponseService,
+    SurveyService,
+)
+from backend.storage import InMemoryStores
+
+
+class ReportExportWorkerTests(unittest.TestCase):
+    def setUp(self):
+        self.stores = InMemoryStores()
+        self.auth = AuthService(self.stores.pii, RateLimiter())
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        analyst = self.auth.verify_email(self.auth.register("export-analyst@example.com").verification_token)
+        self.analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        survey = SurveyService(self.stores.responses).create_survey(
+            {"questions": [{"type": "singlechoice", "options": ["ja", "nej"]}]}
+        )
+        base_service = BaseProfileService(self.stores.pii)
+        responses = ResponseService(self.stores.responses, self.stores.pii)
+        for index, kommun in enumerate(["Lund", "Lund", "Umeå"]):
+            user = self.auth.verify_email(self.auth.register(f"export{index}@example.com").verification_token)
+            base_service.ensure_base_profile(user, kommun)
+            responses.submit_response(user, survey.id, {"q1": "ja"}, {"free": "Läxor (igen)"})
+        template = ReportService(self.stores.responses).create_template(
+            survey.id,
+            [{"type": "text", "content": "Rapport för $kommun"}, {"type": "chart", "question": "q1"}],
+        )
+        self.version = PublishingService(self.stores.responses).publish(self.analyst, template.id, pin_snapshot=True)
+
+    def test_renderers_produce_valid_pdf_and_png(self):
+        template = self.stores.responses.get_report_template(self.version.template_id)
+        payload = ReportService(self.stores.responses).build_report_payload(
+            template,
+            self.stores.responses.get_aggregation_version(template.survey_id, self.version.data_version_hash),
+            "Umeå",
+            texts_url="/reports/export(1)/texts",
+        )
+        pdf = render_pdf(payload)
+        self.assertTrue(pdf.startswith(b"%PDF-1.4"))
+        self.assertIn("Rapport för Umeå".encode("cp1252"), pdf)
+        self.assertIn(b"/reports/export\\(1\\)/texts", pdf)
+        xref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+        self.assertTrue(pdf[xref:].startswith(b"xref"))
+        for offset in re.findall(rb"(\d{10}) 00000 n", pdf):
+            self.assertRegex(pdf[int(offset) :][:12].decode("latin-1"), r"^\d+ 0 obj")
+        png = render_png(payload)
+        self.assertTrue(png.startswith(b"\x89PNG\r\n\x1a\n"))
+        width, height = struct.unpack(">II", png[16:24])
+        idat_length = struct.unpack(">I", png[33:37])[0]
+        raw = zlib.decompress(png[41 : 41 + idat_length])
+        self.assertEqual(len(raw), height * (1 + width * 3))
+
+    def test_jobs_are_deduped_and_cached_on_disk(self):
+        release = threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            worker = ReportExportWorker(self.stores.responses, self.root.name, executor=pool)
+            pool.submit(release.wait)
+            pool.submit(release.wait)
+            first = worker.submit(self.version.id, "Lund")
+            second = worker.submit(self.version.id, "Lund")
+            self.assertIs(first, second)
+            release.set()
+            paths = first.result()
+        self.assertEqual(sorted(paths), ["pdf", "png"])
+        self.assertIn(os.path.join(str(self.version.id), self.version.data_version_hash), paths["pdf"])
+        with open(paths["pdf"], "rb") as handle:
+            pdf = handle.read()
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        self.assertNotIn(b"L\xe4xor", pdf)
+        cached = ReportExportWorker(self.stores.responses, self.root.name).submit(self.version.id, "Lund")
+        self.assertTrue(cached.done())
+        self.assertEqual(cached.result(), paths)
+
+    def test_process_pool_exports_every_kommun(self):
+        with ReportExportWorker(self.stores.responses, self.root.name, max_workers=2) as worker:
+            exported = worker.export_all(self.version.id)
+        self.assertEqual(sorted(exported), ["Lund", "Umeå"])
+        for paths in exported.values():
+            self.assertTrue(all(os.path.getsize(path) > 0 for path in paths.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,25 @@
+import gzip
 import json
+import tempfile
 import threading
 import unittest
 from http.client import HTTPConnection
 
+from backend.bundles import ReportBundleWriter
+from backend.cache import caches_for
+from backend.security import RateLimiter
 from backend.server import create_server
+from backend.services import (
+    AuthService,
+    BaseProfileService,
+    ModerationService,
+    PublicSiteService,
+    PublishingService,
+    ReportService,
+    ResponseService,
+    SurveyService,
+)
+from backend.storage import InMemoryStores
 
 
 class HealthEndpointTests(unittest.TestCase):
@@ -49,5 +65,181 @@ class HealthEndpointTests(unittest.TestCase):
         self.assertEqual(json.loads(body), {"error": "not_found"})
 
 
+class ReportBundleTests(unittest.TestCase):
+    def setUp(self):
+        self.stores = InMemoryStores()
+        self.bundle_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.bundle_root.cleanup)
+        self.bundles = ReportBundleWriter(self.bundle_root.name)
+        self.server = create_server(host="127.0.0.1", port=0, stores=self.stores, bundles=self.bundles)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.host, self.port = self.server.server_address
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(timeout=1)
+
+    def _get(self, path, headers=None):
+        connection = HTTPConnection(self.host, self.port)
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        body = response.read()
+        return response, json.loads(body.decode("utf-8")) if body else None
+
+    def _publish(self, slug, bundles=None, content="Hej $kommun", kommun=None):
+        auth = AuthService(self.stores.pii, RateLimiter())
+        analyst = auth.verify_email(auth.register(f"{slug}-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        if kommun:
+            BaseProfileService(self.stores.pii).ensure_base_profile(analyst, kommun)
+        survey = SurveyService(self.stores.responses).create_survey({"questions": [{"type": "scale"}]})
+        response = ResponseService(self.stores.responses, self.stores.pii).submit_response(
+            analyst, survey.id, {"q1": 4}, {"free": "Bra stöd"}
+        )
+        reports = ReportService(self.stores.responses)
+        template = reports.create_template(survey.id, [{"type": "text", "content": content}])
+        publishing = PublishingService(self.stores.responses, bundles=bundles)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public")
+        return analyst, response, publishing.set_public_url(analyst, version.id, slug)
+
+    def test_published_report_served_from_bundle(self):
+        auth = AuthService(self.stores.pii, RateLimiter())
+        analyst = auth.verify_email(auth.register("bundle-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        BaseProfileService(self.stores.pii).ensure_base_profile(analyst, "Lund")
+        survey = SurveyService(self.stores.responses).create_survey({"questions": [{"type": "scale"}]})
+        response = ResponseService(self.stores.responses, self.stores.pii).submit_response(
+            analyst, survey.id, {"q1": 4}, {"free": "Bra stöd"}
+        )
+        template = ReportService(self.stores.responses).create_template(
+            survey.id, [{"type": "text", "content": "Hej $kommun"}]
+        )
+        publishing = PublishingService(self.stores.responses, bundles=self.bundles)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public")
+        version = publishing.set_public_url(analyst, version.id, "bundlad")
+        manifest = self.bundles.manifest("/reports/bundlad")
+        self.assertEqual(manifest["data_version_hash"], version.data_version_hash)
+        self.assertEqual(list(manifest["kommuner"]), ["Lund"])
+        self.stores.responses._templates.clear()
+        http_response, body = self._get("/reports/bundlad?kommun=Lund")
+        self.stores.responses.add_report_template(template)
+        self.assertEqual(http_response.status, 200)
+        self.assertEqual(int(http_response.getheader("Content-Length")), manifest["kommuner"]["Lund"]["bytes"])
+        self.assertEqual(body["payload"]["blocks"], [{"type": "text", "content": "Hej Lund"}])
+        self.assertNotIn("curated_texts", body["payload"])
+        self.assertEqual(body["payload"]["curated_texts_url"], "/reports/bundlad/texts")
+        dynamic = PublicSiteService(self.stores.responses, self.stores.pii).read_report("/reports/bundlad", "Lund")
+        self.assertEqual(sorted(dynamic["payload"]), sorted(body["payload"]))
+        self.assertEqual(dynamic["payload"], body["payload"])
+        ModerationService(self.stores.responses, self.stores.pii).review_text(response.id, analyst, "hide")
+        http_response, body = self._get("/reports/bundlad/texts")
+        self.assertEqual((http_response.status, body["texts"]), (200, []))
+        with open(self.bundles.path_for("/reports/bundlad", "Lund"), encoding="utf-8") as handle:
+            self.assertNotIn("Bra stöd", handle.read())
+
+    def test_replaced_bundle_redirects_without_the_bundle_writer(self):
+        analyst, _, old = self._publish("bundle-gammal", bundles=self.bundles, kommun="Lund")
+        _, _, new = self._publish("bundle-ny")
+        PublishingService(self.stores.responses).replace(analyst, old.id, new.id)
+        self.assertIsNotNone(self.bundles.path_for("/reports/bundle-gammal", "Lund"))
+        connection = HTTPConnection(self.host, self.port)
+        connection.request("GET", "/reports/bundle-gammal?kommun=Lund")
+        response = connection.getresponse()
+        self.assertEqual((response.status, response.getheader("Location")), (302, "/reports/bundle-ny?kommun=Lund"))
+
+
+    def test_report_texts_endpoint_pages_with_cursor(self):
+        auth = AuthService(self.stores.pii, RateLimiter())
+        analyst = auth.verify_email(auth.register("texts-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        survey = SurveyService(self.stores.responses).create_survey({"questions": [{"type": "scale"}]})
+        ResponseService(self.stores.responses, self.stores.pii).submit_response(
+            analyst, survey.id, {"q1": 4}, {"a": "Första", "b": "Andra"}
+        )
+        template = ReportService(self.stores.responses).create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        publishing = PublishingService(self.stores.responses)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, version.id, "texter")
+        http_response, first = self._get("/reports/texter/texts?limit=1")
+        self.assertEqual(http_response.status, 200)
+        self.assertEqual(first["texts"], ["Första"])
+        _, second = self._get(f"/reports/texter/texts?limit=1&cursor={first['next_cursor']}")
+        self.assertEqual(second, {"canonical_url": "/reports/texter", "texts": ["Andra"], "next_cursor": None})
+        http_response, _ = self._get("/reports/texter/texts?limit=x")
+        self.assertEqual(http_response.status, 400)
+
+    def test_report_and_library_answer_conditional_requests(self):
+        analyst, response, _ = self._publish("etag")
+        first, body = self._get("/reports/etag?kommun=Lund")
+        etag = first.getheader("ETag")
+        self.assertEqual(body["payload"]["curated_texts_url"], "/reports/etag/texts")
+        self.assertEqual(first.getheader("Cache-Control"), "no-cache")
+        public_site = PublicSiteService(self.stores.responses, self.stores.pii)
+        stats = public_site.report_cache_stats()
+        cached, body = self._get("/reports/etag?kommun=Lund", {"If-None-Match": etag})
+        self.assertEqual((cached.status, body, cached.getheader("ETag")), (304, None, etag))
+        self.assertEqual(public_site.report_cache_stats(), stats)
+        other, _ = self._get("/reports/etag?kommun=Malmo", {"If-None-Match": etag})
+        self.assertEqual(other.status, 200)
+        self.assertNotEqual(other.getheader("ETag"), etag)
+        texts, body = self._get("/reports/etag/texts")
+        self.assertEqual(body["texts"], ["Bra stöd"])
+        ModerationService(self.stores.responses, self.stores.pii).review_text(response.id, analyst, "hide")
+        changed, body = self._get("/reports/etag/texts", {"If-None-Match": texts.getheader("ETag")})
+        self.assertEqual((changed.status, body["texts"]), (200, []))
+        unchanged, _ = self._get("/reports/etag/texts", {"If-None-Match": changed.getheader("ETag")})
+        self.assertEqual(unchanged.status, 304)
+        library, _ = self._get("/public/reports")
+        unchanged, _ = self._get("/public/reports", {"If-None-Match": f'W/{library.getheader("ETag")}'})
+        self.assertEqual(unchanged.status, 304)
+
+    def test_library_endpoint_searches_and_pages(self):
+        self._publish("sok-1")
+        self._publish("sok-2")
+        http_response, first = self._get("/public/reports?limit=1")
+        self.assertEqual(http_response.status, 200)
+        self.assertEqual([entry["canonical_url"] for entry in first["reports"]], ["/reports/sok-2"])
+        _, second = self._get(f"/public/reports?limit=1&cursor={first['next_cursor']}")
+        self.assertEqual([entry["canonical_url"] for entry in second["reports"]], ["/reports/sok-1"])
+        self.assertIsNone(second["next_cursor"])
+        _, missing = self._get("/public/reports?q=saknas")
+        self.assertEqual(missing, {"reports": [], "next_cursor": None})
+        for query in ("limit=x", "survey=x", "cursor=x", "limit=0"):
+            http_response, _ = self._get(f"/public/reports?{query}")
+            self.assertEqual(http_response.status, 400)
+
+    def test_bundled_report_answers_conditional_requests(self):
+        self._publish("bundle-etag", bundles=self.bundles)
+        first, _ = self._get("/reports/bundle-etag?kommun=Lund")
+        cached, body = self._get("/reports/bundle-etag?kommun=Lund", {"If-None-Match": first.getheader("ETag")})
+        self.assertEqual((cached.status, body), (304, None))
+
+    def test_large_reports_are_gzipped_once_per_etag(self):
+        self._publish("komprimerad", content="Hej $kommun. " + "Lång rapporttext. " * 100)
+        connection = HTTPConnection(self.host, self.port)
+        connection.request("GET", "/reports/komprimerad?kommun=Lund", headers={"Accept-Encoding": "gzip"})
+        response = connection.getresponse()
+        body = json.loads(gzip.decompress(response.read()).decode("utf-8"))
+        etag = response.getheader("ETag")
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+        self.assertEqual(response.getheader("Vary"), "Accept-Encoding")
+        self.assertTrue(etag.endswith('-gzip"'))
+        self.assertTrue(body["payload"]["blocks"][0]["content"].startswith("Hej Lund."))
+        compressed = caches_for(self.stores.responses).compressed_bodies
+        self.assertEqual(compressed.stats()["misses"], 1)
+        connection.request("GET", "/reports/komprimerad?kommun=Lund", headers={"Accept-Encoding": "gzip"})
+        connection.getresponse().read()
+        self.assertEqual(compressed.stats()["hits"], 1)
+        cached, _ = self._get("/reports/komprimerad?kommun=Lund", {"Accept-Encoding": "gzip", "If-None-Match": etag})
+        self.assertEqual((cached.status, cached.getheader("ETag")), (304, etag))
+        plain, body = self._get("/reports/komprimerad?kommun=Lund")
+        self.assertIsNone(plain.getheader("Content-Encoding"))
+        self.assertEqual(plain.getheader("ETag"), etag.replace("-gzip", ""))
+        health, _ = self._get("/health", {"Accept-Encoding": "gzip"})
+        self.assertIsNone(health.getheader("Content-Encoding"))
+
 if __name__ == "__main__":
     unittest.main()
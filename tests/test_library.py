@@ -0,0 +1,57 @@
+import unittest
+
+from backend.library import LibraryEntry, ReportLibraryIndex, search_tokens
+
+
+def _entry(version_id, title, survey_id=1, kommuner=(), pinned=False):
+    return LibraryEntry(
+        version_id=version_id,
+        template_id=version_id,
+        survey_id=survey_id,
+        canonical_url=f"/reports/r{version_id}",
+        title=title,
+        survey_title="Skolenkät 2024",
+        kommuner=tuple(kommuner),
+        pinned=pinned,
+    )
+
+
+class ReportLibraryIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = ReportLibraryIndex()
+        self.index.add(_entry(1, "Skolfrånvaro i Lund", kommuner=["Lund"]))
+        self.index.add(_entry(2, "Stöd i skolan", survey_id=2, kommuner=["Lund", "Umeå"], pinned=True))
+        self.index.add(_entry(3, "Sömn och skola", kommuner=["Umeå"]))
+
+    def _ids(self, **kwargs):
+        return [entry.version_id for entry in self.index.search(**kwargs)[0]]
+
+    def test_terms_prefixes_and_filters_intersect(self):
+        self.assertEqual(search_tokens("Sömn och SKOLA 2024"), ["sömn", "skola", "2024"])
+        self.assertEqual(self._ids(query="skol"), [3, 2, 1])
+        self.assertEqual(self._ids(query="sömn skol"), [3])
+        self.assertEqual(self._ids(query="2024", kommun="umeå"), [3, 2])
+        self.assertEqual(self._ids(query="stöd", survey_id=1), [])
+        self.assertEqual(self._ids(survey_id=2), [2])
+        self.assertEqual(self._ids(query="okänt"), [])
+
+    def test_keyset_pages_newest_first(self):
+        page, last = self.index.search(limit=2)
+        self.assertEqual(([entry.version_id for entry in page], last), ([3, 2], 2))
+        page, last = self.index.search(before=last, limit=2)
+        self.assertEqual(([entry.version_id for entry in page], last), ([1], None))
+        page, last = self.index.search(query="skol", before=3, limit=1)
+        self.assertEqual(([entry.version_id for entry in page], last), ([2], 2))
+
+    def test_remove_and_replace_keep_postings_in_sync(self):
+        self.index.remove(3)
+        self.assertEqual(self._ids(query="sömn"), [])
+        self.assertEqual(len(self.index), 2)
+        self.index.add(_entry(1, "Skolfrånvaro i Lund", kommuner=["Malmö"]))
+        self.assertEqual(self._ids(kommun="Malmö"), [1])
+        self.assertEqual(self._ids(kommun="Lund"), [2])
+        self.assertNotIn("sömn", self.index._vocabulary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,7 +6,15 @@ from backend.migrations import run_migrations
 from backend.postgres_store import PostgresStores, _build_dsn
 from backend.domain import ConflictError
 from backend.security import RateLimiter
-from backend.services import AuthService, PublishingService, ResponseService, SurveyService
+from backend.aggregation import aggregate_chunk, build_layout
+from backend.services import (
+    AuthService,
+    BaseProfileService,
+    PublishingService,
+    ReportService,
+    ResponseService,
+    SurveyService,
+)
 
 HAS_PSYCOPG = importlib.util.find_spec("psycopg") is not None
 if HAS_PSYCOPG:
@@ -29,7 +37,8 @@ class PostgresStoreTests(unittest.TestCase):
                     """
                     TRUNCATE users, sessions, base_profiles, network_preferences, introduction_events, mail_outbox,
                     audit_events, consent_records, pseudonyms, survey_submissions, surveys, responses, aggregations,
-                    report_templates, report_versions, news_items, text_flags, redaction_events, text_reviews, ai_requests
+                    aggregation_history, report_templates, report_versions, news_items, text_flags, redaction_events,
+                    text_reviews, ai_requests, report_redirects
                     RESTART IDENTITY CASCADE
                     """
                 )
@@ -54,6 +63,56 @@ class PostgresStoreTests(unittest.TestCase):
         with self.assertRaises(ConflictError):
             publishing.set_public_url(analyst, version.id, "pg-report-2")
 
+    def test_postgres_aggregation_matches_in_process_path(self):
+        survey = self.surveys.create_survey(
+            {
+                "questions": [
+                    {"type": "scale"},
+                    {"type": "singlechoice", "options": ["ja", "nej"]},
+                    {"type": "multichoice", "options": ["sömn", "skola", "mat"]},
+                    {"type": "short_text"},
+                ],
+                "crosstabs": [["q1", "q3"], ["q2", "q1", "q3"]],
+            }
+        )
+        answers = [
+            ("Lund", {"q1": 5, "q2": "ja", "q3": ["sömn", "skola"], "q4": "fri"}),
+            ("Lund", {"q1": 2, "q2": "nej", "q3": ["skola", "sömn", "sömn"]}),
+            ("Umeå", {"q1": 9, "q2": "kanske", "q3": ["okänd"]}),
+            (None, {"q1": 3, "q3": "mat"}),
+        ]
+        base_service = BaseProfileService(self.stores.pii)
+        for index, (kommun, answer) in enumerate(answers):
+            user = self.auth.verify_email(self.auth.register(f"parity{index}@example.com").verification_token)
+            if kommun:
+                base_service.ensure_base_profile(user, kommun)
+            self.responses.submit_response(user, survey.id, answer)
+        layout = build_layout(survey.schema)
+        expected = aggregate_chunk(self.stores.responses.list_responses_for_survey(survey.id), layout)
+        self.assertEqual(self.stores.responses.aggregate_survey(survey.id, layout), expected)
+        live = self.stores.responses.get_aggregation(survey.id)
+        self.assertEqual((live.metrics, live.data_version_hash), expected)
+
+
+    def test_postgres_resolve_report_joins_version_template_and_snapshot(self):
+        user = self.auth.verify_email(self.auth.register("resolve@example.com").verification_token)
+        analyst = self.stores.pii.update_user(user.id, role="analyst")
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        self.responses.submit_response(analyst, survey.id, {"q1": 4})
+        template = ReportService(self.stores.responses).create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        publishing = PublishingService(self.stores.responses)
+        old = publishing.publish(analyst, template_id=template.id, visibility="public", pin_snapshot=True)
+        publishing.set_public_url(analyst, old.id, "pg-gammal")
+        new = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, new.id, "pg-ny")
+        resolved = self.stores.responses.resolve_report("/reports/pg-gammal")
+        self.assertEqual(resolved.template, template)
+        self.assertEqual(resolved.snapshot.data_version_hash, old.data_version_hash)
+        publishing.replace(analyst, old.id, new.id)
+        self.assertEqual(self.stores.responses.resolve_report("/reports/pg-gammal").replacement_url, "/reports/pg-ny")
+        live = self.stores.responses.resolve_report("/reports/pg-ny")
+        self.assertEqual(live.snapshot, self.stores.responses.get_aggregation(survey.id))
+        self.assertIsNone(self.stores.responses.resolve_report("/reports/pg-ny", with_snapshot=False).snapshot)
 
 if __name__ == "__main__":
     unittest.main()
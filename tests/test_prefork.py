@@ -0,0 +1,82 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import unittest
+from http.client import HTTPConnection
+
+from backend.prefork import HAS_REUSEPORT, listening_socket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHILDREN_PATH = "/proc/{pid}/task/{pid}/children"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid):
+    with open(CHILDREN_PATH.format(pid=pid)) as handle:
+        return {int(child) for child in handle.read().split()}
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            result = predicate()
+        except OSError:
+            result = None
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError("condition not met before timeout")
+
+
+@unittest.skipUnless(hasattr(os, "fork") and HAS_REUSEPORT, "pre-fork mode needs fork and SO_REUSEPORT")
+class PreforkSupervisorTests(unittest.TestCase):
+    def _start(self, server):
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "backend.server", "--host", "127.0.0.1", "--port", str(port)]
+            + ["--workers", "2", "--server", server],
+            cwd=ROOT,
+        )
+        self.addCleanup(lambda: process.poll() is None and process.kill())
+        _wait_for(lambda: os.path.exists(CHILDREN_PATH.format(pid=process.pid)) and len(_children(process.pid)) == 2)
+        _wait_for(lambda: self._health(port))
+        return process, port
+
+    def _health(self, port):
+        connection = HTTPConnection("127.0.0.1", port, timeout=2)
+        connection.request("GET", "/health")
+        response = connection.getresponse()
+        return response.status == 200 and json.loads(response.read()) == {"status": "ok"}
+
+    def test_supervisor_restarts_crashed_workers_and_stops_cleanly(self):
+        for server in ("threading", "asyncio"):
+            with self.subTest(server=server):
+                process, port = self._start(server)
+                crashed = sorted(_children(process.pid))[0]
+                os.kill(crashed, signal.SIGKILL)
+                _wait_for(lambda: len(_children(process.pid) - {crashed}) == 2)
+                for _ in range(20):
+                    self.assertTrue(self._health(port))
+                process.send_signal(signal.SIGTERM)
+                self.assertEqual(process.wait(timeout=15), 0)
+
+    def test_reuseport_sockets_share_a_port(self):
+        first = listening_socket("127.0.0.1", 0)
+        self.addCleanup(first.close)
+        second = listening_socket("127.0.0.1", first.getsockname()[1])
+        self.addCleanup(second.close)
+        self.assertEqual(first.getsockname(), second.getsockname())
+
+
+if __name__ == "__main__":
+    unittest.main()
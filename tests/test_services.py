@@ -1,7 +1,28 @@
 import json
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
 
-from backend.domain import ConflictError, RateLimitError, UnauthorizedError, ValidationError
+from backend.aggregation import (
+    EMPTY_DATA_VERSION_HASH,
+    MASKED_VALUE,
+    QuestionLayout,
+    add_to_data_version,
+    crosstab_matrix,
+    mask_counts,
+    mask_crosstab,
+)
+from backend.domain import (
+    AggregationSnapshot,
+    ConflictError,
+    RateLimitError,
+    ReportTemplate,
+    ReportVersion,
+    SurveyResponse,
+    UnauthorizedError,
+    ValidationError,
+)
+from backend.cache import caches_for
 from backend.logging import sanitize_log
 from backend.security import RateLimiter, require_role
 from backend.services import (
@@ -12,16 +33,20 @@ from backend.services import (
     BackupService,
     BaseProfileService,
     ConsentService,
+    CuratedTextService,
     NetworkService,
     PublishingService,
     PublicSiteService,
+    ReportLibraryService,
     ReportService,
     ResponseService,
     SurveyService,
     ModerationService,
     SurveyFlowService,
+    TextTermService,
 )
 from backend.storage import InMemoryStores
+from backend.templates import PLACEHOLDERS, Placeholder, compile_template
 
 
 class ServiceTests(unittest.TestCase):
@@ -121,6 +146,336 @@ class ServiceTests(unittest.TestCase):
         snapshot_default = self.aggregations.build_snapshot_for_survey(survey)
         self.assertEqual(snapshot_default.min_responses, survey.min_responses_default)
 
+    def test_us06_submission_folds_into_live_snapshot(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        self.aggregations.build_snapshot(survey.id, min_responses=1)
+        for index in range(3):
+            user = self.auth.verify_email(self.auth.register(f"live{index}@example.com").verification_token)
+            self.responses.submit_response(user, survey.id, {"q1": index + 1})
+        live = self.stores.responses.get_aggregation(survey.id)
+        self.assertEqual(live.metrics["total"], 3)
+        self.assertEqual(live.min_responses, 1)
+        recomputed = self.aggregations.compute_snapshot(survey.id, min_responses=1)
+        self.assertEqual(live, recomputed)
+        self.assertTrue(self.aggregations.verify_snapshot(survey.id))
+        self.stores.responses.upsert_aggregation(
+            AggregationSnapshot(survey_id=survey.id, data_version_hash="stale", metrics={"total": 1}, min_responses=1)
+        )
+        self.assertFalse(self.aggregations.verify_snapshot(survey.id))
+        self.assertEqual(self.stores.responses.get_aggregation(survey.id), recomputed)
+
+    def test_us06_concurrent_submissions_fold_without_lost_updates(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        base_service = BaseProfileService(self.stores.pii)
+        users = []
+        for index in range(40):
+            user = self.auth.verify_email(self.auth.register(f"samtidig{index}@example.com").verification_token)
+            base_service.ensure_base_profile(user, "Lund")
+            users.append(user)
+        self.responses.submit_response(users[0], survey.id, {"q1": 1})
+        live = self.stores.responses.get_aggregation(survey.id)
+        kommuner = live.metrics["kommuner"]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda user: self.responses.submit_response(user, survey.id, {"q1": 3}), users[1:]))
+        live = self.stores.responses.get_aggregation(survey.id)
+        self.assertEqual(kommuner["Lund"]["total"], 1)
+        self.assertEqual((live.metrics["total"], live.metrics["kommuner"]["Lund"]["total"]), (40, 40))
+        self.assertTrue(self.aggregations.verify_snapshot(survey.id))
+
+    def test_us06_held_snapshot_does_not_change_when_a_response_is_folded(self):
+        survey = self.surveys.create_survey(
+            {"questions": [{"type": "scale"}, {"type": "scale"}], "crosstabs": [["q1", "q2"]]}
+        )
+        held = self.aggregations.build_snapshot(survey.id, min_responses=1)
+        before = json.loads(json.dumps(held.metrics))
+        self.assertEqual((held.data_version_hash, before["total"]), (EMPTY_DATA_VERSION_HASH, 0))
+        user = self.auth.verify_email(self.auth.register("kvar@example.com").verification_token)
+        BaseProfileService(self.stores.pii).ensure_base_profile(user, "Lund")
+        self.responses.submit_response(user, survey.id, {"q1": 2, "q2": 4})
+        self.assertEqual(held.metrics, before)
+        self.assertEqual(
+            self.stores.responses.get_aggregation_version(survey.id, EMPTY_DATA_VERSION_HASH).metrics, before
+        )
+        live = self.stores.responses.get_aggregation(survey.id)
+        self.assertEqual((live.metrics["total"], live.metrics["kommuner"]["Lund"]["total"]), (1, 1))
+
+    def test_us06_question_histograms_with_bucket_masking(self):
+        survey = self.surveys.create_survey(
+            {
+                "questions": [
+                    {"type": "scale"},
+                    {"type": "singlechoice", "options": ["ja", "nej"]},
+                    {"type": "multichoice", "options": ["sömn", "skola", "mat"]},
+                    {"type": "long_text"},
+                ]
+            }
+        )
+        answers = [
+            {"q1": 5, "q2": "ja", "q3": ["sömn", "skola"]},
+            {"q1": 5, "q2": "ja", "q3": ["sömn"]},
+            {"q1": 2, "q2": "nej", "q3": ["sömn", "okänd"]},
+        ]
+        for index, answer in enumerate(answers):
+            user = self.auth.verify_email(self.auth.register(f"hist{index}@example.com").verification_token)
+            self.responses.submit_response(user, survey.id, answer)
+        live = self.stores.responses.get_aggregation(survey.id)
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
+        self.assertEqual(live.metrics, snapshot.metrics)
+        questions = snapshot.metrics["questions"]
+        self.assertEqual(questions["q1"]["counts"], [0, 1, 0, 0, 2])
+        self.assertEqual(questions["q2"]["counts"], [2, 1])
+        self.assertEqual(questions["q3"]["counts"], [3, 1, 0])
+        self.assertNotIn("q4", questions)
+        small_n = self.reports.apply_small_n(snapshot)
+        self.assertEqual(small_n["questions"]["q2"]["counts"], ["X", "X"])
+        self.assertEqual(small_n["questions"]["q3"]["counts"], [3, "X", "X"])
+        masked = self.reports.apply_small_n(self.aggregations.build_snapshot(survey.id, min_responses=5))
+        self.assertEqual(masked["questions"]["q1"]["counts"], ["X"] * 5)
+
+    def test_us06_masked_buckets_cannot_be_derived_from_answered(self):
+        self.assertEqual(mask_counts([3, 10], 5), ["X", "X"])
+        self.assertEqual(mask_counts([3, 10, 7], 5), ["X", 10, "X"])
+        for counts in product(range(4), repeat=3):
+            masked = mask_counts(counts, 2)
+            hidden = [count for count, shown in zip(counts, masked) if shown == MASKED_VALUE]
+            self.assertNotEqual(len(hidden), 1, (counts, masked))
+
+    def test_us06_kommun_cube_slices_without_profile_lookup(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "singlechoice", "options": ["ja", "nej"]}]})
+        base_service = BaseProfileService(self.stores.pii)
+        for index, (kommun, answer) in enumerate([("Lund", "ja"), ("Lund", "ja"), ("Lund", "nej"), ("Umeå", "ja")]):
+            user = self.auth.verify_email(self.auth.register(f"cube{index}@example.com").verification_token)
+            base_service.ensure_base_profile(user, kommun)
+            self.responses.submit_response(user, survey.id, {"q1": answer})
+        live = self.stores.responses.get_aggregation(survey.id)
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
+        self.assertEqual(live.metrics, snapshot.metrics)
+        self.assertEqual(snapshot.metrics["kommuner"]["Lund"]["questions"]["q1"]["counts"], [2, 1])
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej $kommun"}])
+        self.stores.pii._base_profiles.clear()
+        lund = self.reports.build_report_payload(template, snapshot, kommun="Lund")["kommun_metrics"]
+        self.assertEqual(lund["total"], 3)
+        self.assertEqual(lund["questions"]["q1"]["counts"], ["X", "X"])
+        umea = self.reports.build_report_payload(template, snapshot, kommun="Umeå")["kommun_metrics"]
+        self.assertTrue(umea["masked"])
+        self.assertEqual(umea["questions"]["q1"]["counts"], ["X", "X"])
+        missing = self.reports.kommun_metrics(snapshot, "Kiruna")
+        self.assertEqual(missing["total"], "X")
+
+    def test_us07_compiled_template_single_pass(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        template = self.reports.create_template(
+            survey.id,
+            [
+                {"type": "text", "content": "$kommun: $antal_respondenter svar ($kommun_namn)"},
+                {"type": "text", "content": "Dold", "condition": {"min_total": 5}},
+            ],
+        )
+        PLACEHOLDERS["$kommun_namn"] = lambda snapshot, kommun: kommun.upper()
+        self.addCleanup(PLACEHOLDERS.pop, "$kommun_namn")
+        compiled = compile_template(template)
+        self.assertEqual(
+            compiled.blocks[0].segments,
+            (
+                Placeholder("$kommun"),
+                ": ",
+                Placeholder("$antal_respondenter"),
+                " svar (",
+                Placeholder("$kommun_namn"),
+                ")",
+            ),
+        )
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=1)
+        rendered = self.reports.render(template, snapshot, kommun="Lund")
+        self.assertEqual(rendered["blocks"], [{"type": "text", "content": "Lund: 0 svar (LUND)"}])
+        self.reports.render(template, snapshot, kommun="Umeå")
+        self.assertGreaterEqual(caches_for(self.stores.responses).templates.stats()["hits"], 1)
+        reloaded = ReportTemplate(id=template.id, survey_id=survey.id, blocks=json.loads(json.dumps(template.blocks)))
+        self.assertIs(self.reports.compiled(reloaded), self.reports.compiled(template))
+
+    def test_us07_expression_conditions(self):
+        survey = self.surveys.create_survey(
+            {"questions": [{"type": "singlechoice", "options": ["ja", "nej", "vet ej"]}, {"type": "scale"}]}
+        )
+        base_service = BaseProfileService(self.stores.pii)
+        for index, (kommun, answer) in enumerate([("Lund", "ja"), ("Lund", "ja"), ("Lund", "nej"), ("Umeå", "nej")]):
+            user = self.auth.verify_email(self.auth.register(f"cond{index}@example.com").verification_token)
+            base_service.ensure_base_profile(user, kommun)
+            self.responses.submit_response(user, survey.id, {"q1": answer, "q2": 5})
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
+        template = self.reports.create_template(
+            survey.id,
+            [
+                {"type": "text", "content": "Majoritet ja", "condition": "kommun_share(q1, 'ja') > 0.5"},
+                {"type": "text", "content": "Maskad", "condition": {"expr": "kommun_masked or total < 2"}},
+                {
+                    "type": "text",
+                    "content": "Alla femmor",
+                    "condition": "not kommun_masked and (count(q2, 5) == total and answered(q1) >= 4)",
+                },
+                {"type": "text", "content": "En nej", "condition": "kommun_count(q1, 'nej') == 1"},
+                {"type": "text", "content": "Inte en nej", "condition": "kommun_count(q1, 'nej') != 1"},
+                {"type": "text", "content": "Andel nej", "condition": "kommun_share(q1, 'nej') > 0"},
+            ],
+        )
+        lund = [block["content"] for block in self.reports.render(template, snapshot, kommun="Lund")["blocks"]]
+        umea = [block["content"] for block in self.reports.render(template, snapshot, kommun="Umeå")["blocks"]]
+        self.assertEqual(self.reports.kommun_metrics(snapshot, "Lund")["questions"]["q1"]["counts"], [2, "X", "X"])
+        self.assertEqual(lund, ["Majoritet ja", "Alla femmor"])
+        self.assertEqual(umea, ["Maskad"])
+        for condition in ["share(q9, 'ja') > 0", "share(q1, 'kanske') > 0", "total >", "__import__('os')"]:
+            with self.assertRaises(ValidationError):
+                self.reports.create_template(survey.id, [{"type": "text", "content": "x", "condition": condition}])
+
+    def test_us07_render_many_matches_single_renders(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "singlechoice", "options": ["ja", "nej"]}]})
+        base_service = BaseProfileService(self.stores.pii)
+        for index, kommun in enumerate(["Lund", "Lund", "Umeå"]):
+            user = self.auth.verify_email(self.auth.register(f"batch{index}@example.com").verification_token)
+            base_service.ensure_base_profile(user, kommun)
+            self.responses.submit_response(user, survey.id, {"q1": "ja"})
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
+        template = self.reports.create_template(
+            survey.id,
+            [
+                {"type": "text", "content": "$antal_respondenter svar totalt"},
+                {"type": "text", "content": "Hej $kommun", "condition": "not kommun_masked"},
+                {"type": "text", "content": "Dold", "condition": {"min_total": 10}},
+            ],
+        )
+        kommuner = ["Lund", "Umeå", "Kiruna", "Lund"]
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            batch = self.reports.render_many(template, snapshot, kommuner, executor=pool)
+        self.assertEqual(list(batch), ["Lund", "Umeå", "Kiruna"])
+        for kommun, rendered in batch.items():
+            self.assertEqual(rendered, self.reports.render(template, snapshot, kommun))
+        self.assertEqual([block["content"] for block in batch["Lund"]["blocks"]], ["3 svar totalt", "Hej Lund"])
+        self.assertIs(batch["Lund"]["blocks"][0], batch["Umeå"]["blocks"][0])
+        payloads = self.reports.build_report_payloads(template, snapshot, ["Lund", "Umeå"])
+        self.assertTrue(payloads["Umeå"]["kommun_metrics"]["masked"])
+        self.assertEqual(payloads["Lund"], self.reports.build_report_payload(template, snapshot, "Lund"))
+
+    def test_us07_chart_and_table_blocks_bind_to_series(self):
+        survey = self.surveys.create_survey(
+            {
+                "questions": [
+                    {"type": "singlechoice", "options": ["ja", "nej", "vet ej"]},
+                    {"type": "scale", "min": 1, "max": 2},
+                ],
+                "crosstabs": [["q1", "q2"]],
+            }
+        )
+        base_service = BaseProfileService(self.stores.pii)
+        for index, (kommun, answer) in enumerate([("Lund", "ja"), ("Lund", "ja"), ("Umeå", "ja"), ("Umeå", "nej")]):
+            user = self.auth.verify_email(self.auth.register(f"chart{index}@example.com").verification_token)
+            base_service.ensure_base_profile(user, kommun)
+            self.responses.submit_response(user, survey.id, {"q1": answer, "q2": 1})
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
+        template = self.reports.create_template(
+            survey.id,
+            [
+                {"type": "chart", "question": "q1"},
+                {"type": "chart", "chart": "pie", "question": "q1", "scope": "kommun"},
+                {"type": "table", "crosstab": ["q1", "q2"]},
+            ],
+        )
+        batch = self.reports.render_many(template, snapshot, ["Lund", "Umeå"])
+        survey_chart, lund_chart, table = batch["Lund"]["blocks"]
+        self.assertEqual(survey_chart["labels"], ["ja", "nej", "vet ej"])
+        self.assertEqual(survey_chart["series"], [3, "X", "X"])
+        self.assertEqual(lund_chart["chart"], "pie")
+        self.assertEqual(lund_chart["series"], [2, "X", "X"])
+        self.assertEqual(batch["Umeå"]["blocks"][1]["series"], ["X", "X", "X"])
+        self.assertEqual(table["series"], [["X", "X"], ["X", "X"], ["X", "X"]])
+        self.assertIs(survey_chart["series"], batch["Umeå"]["blocks"][0]["series"])
+        stats = caches_for(self.stores.responses).series.stats()
+        self.reports.render(template, snapshot, "Lund")
+        self.assertEqual(caches_for(self.stores.responses).series.stats()["hits"], stats["hits"] + 3)
+        for block in [
+            {"type": "chart", "question": "q9"},
+            {"type": "table", "crosstab": ["q2", "q1"]},
+            {"type": "table", "crosstab": ["q1", "q2"], "scope": "kommun"},
+        ]:
+            with self.assertRaises(ValidationError):
+                self.reports.create_template(survey.id, [block])
+
+    def test_us06_trend_rollups_by_day_week_month(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        days = ["2026-09-28"] * 2 + ["2026-09-30"] * 2 + ["2026-10-01"] + ["2026-10-05"] * 2 + ["2026-10-06"] * 2
+        for index, submitted_on in enumerate(days):
+            response = SurveyResponse(
+                id=self.stores.responses.next_id("response"),
+                survey_id=survey.id,
+                respondent_pseudonym=f"trend{index}",
+                answers={"q1": 3},
+                submitted_on=submitted_on,
+            )
+            self.stores.responses.add_response(response)
+            self.responses.aggregations.apply_response(response)
+        live = self.stores.responses.get_aggregation(survey.id)
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
+        self.assertEqual(live.metrics["trend"], snapshot.metrics["trend"])
+        self.assertEqual(snapshot.metrics["trend"]["month"], {"2026-09": 4, "2026-10": 5})
+        self.assertEqual(
+            self.reports.trend(snapshot, "week"),
+            [{"bucket": "2026-W40", "count": 5}, {"bucket": "2026-W41", "count": 4}],
+        )
+        self.assertEqual([point["count"] for point in self.reports.trend(snapshot, "month")], [4, 5])
+        template = self.reports.create_template(survey.id, [{"type": "trend", "granularity": "day"}])
+        block = self.reports.render(template, snapshot, kommun="Lund")["blocks"][0]
+        self.assertEqual([point["count"] for point in block["series"]], ["X"] * 5)
+        with self.assertRaises(ValidationError):
+            self.reports.create_template(survey.id, [{"type": "trend", "granularity": "hour"}])
+
+    def test_us06_cross_tabs_declared_and_adhoc(self):
+        survey = self.surveys.create_survey(
+            {
+                "questions": [
+                    {"type": "singlechoice", "options": ["ja", "nej"]},
+                    {"type": "scale", "min": 1, "max": 3},
+                    {"type": "multichoice", "options": ["sömn", "skola"]},
+                ],
+                "crosstabs": [["q1", "q2"]],
+            }
+        )
+        answers = [
+            {"q1": "ja", "q2": 1, "q3": ["sömn", "skola"]},
+            {"q1": "ja", "q2": 1, "q3": ["sömn"]},
+            {"q1": "ja", "q2": 1, "q3": ["sömn"]},
+            {"q1": "nej", "q2": 3},
+        ]
+        for index, answer in enumerate(answers):
+            user = self.auth.verify_email(self.auth.register(f"xtab{index}@example.com").verification_token)
+            self.responses.submit_response(user, survey.id, answer)
+        live = self.stores.responses.get_aggregation(survey.id)
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
+        self.assertEqual(live.metrics["crosstabs"], snapshot.metrics["crosstabs"])
+        declared = self.aggregations.cross_tab(survey.id, ["q1", "q2"])
+        self.assertEqual(declared["cells"], [[*position, "X"] for position in product(range(2), range(3))])
+        adhoc = self.aggregations.cross_tab(survey.id, ["q3", "q1"])
+        self.assertEqual(adhoc["cells"], [[*position, "X"] for position in product(range(2), range(2))])
+        self.assertEqual(adhoc["options"], [["sömn", "skola"], ["ja", "nej"]])
+        self.stores.responses._responses.clear()
+        self.assertEqual(self.aggregations.cross_tab(survey.id, ["q3", "q1"]), adhoc)
+        with self.assertRaises(ValidationError):
+            self.aggregations.cross_tab(survey.id, ["q1"])
+        with self.assertRaises(ValidationError):
+            self.surveys.create_survey({"questions": [{"type": "scale"}], "crosstabs": [["q1", "q9"]]})
+
+    def test_us06_masked_cross_tab_cells_cannot_be_derived_from_margins(self):
+        members = tuple(
+            QuestionLayout(key, "singlechoice", options, {option: index for index, option in enumerate(options)})
+            for key, options in (("q1", ("a", "b", "c")), ("q2", ("x", "y", "z")))
+        )
+        entry = {"cells": {"0:0": 9, "0:1": 1, "0:2": 7, "1:0": 6, "1:1": 8, "1:2": 5, "2:0": 4, "2:1": 6, "2:2": 9}}
+        matrix = crosstab_matrix(entry, members, min_responses=2)
+        self.assertEqual(matrix, [[9, "X", "X"], ["X", 8, "X"], ["X", "X", 9]])
+        for line in [*matrix, *zip(*matrix)]:
+            self.assertNotEqual(list(line).count(MASKED_VALUE), 1)
+        sparse = mask_crosstab(entry, members, min_responses=2)["cells"]
+        expected = [[row, column, matrix[row][column]] for row, column in product(range(3), range(3))]
+        self.assertEqual(sparse, expected)
+
     def test_us20_data_version_hash_deterministic(self):
         result = self.auth.register("hash@example.com")
         user = self.auth.verify_email(result.verification_token)
@@ -130,6 +485,23 @@ class ServiceTests(unittest.TestCase):
         snapshot_b = self.aggregations.build_snapshot(survey.id, min_responses=1)
         self.assertEqual(snapshot_a.data_version_hash, snapshot_b.data_version_hash)
 
+    def test_us20_data_version_hash_is_order_independent(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        empty = self.aggregations.build_snapshot(survey.id, min_responses=1)
+        self.assertEqual(empty.data_version_hash, EMPTY_DATA_VERSION_HASH)
+        for index in range(4):
+            user = self.auth.verify_email(self.auth.register(f"order{index}@example.com").verification_token)
+            self.responses.submit_response(user, survey.id, {"q1": 1})
+        response_ids = [response.id for response in self.stores.responses.list_responses_for_survey(survey.id)]
+        shuffled = EMPTY_DATA_VERSION_HASH
+        for response_id in reversed(response_ids):
+            shuffled = add_to_data_version(shuffled, response_id)
+        live = self.stores.responses.get_aggregation(survey.id)
+        rebuilt = self.aggregations.build_snapshot(survey.id, min_responses=1)
+        self.assertEqual(live.data_version_hash, rebuilt.data_version_hash)
+        self.assertEqual(shuffled, rebuilt.data_version_hash)
+        self.assertNotEqual(empty.data_version_hash, rebuilt.data_version_hash)
+
     def test_us07_feedback_mode_and_masking(self):
         survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
         snapshot = self.aggregations.build_snapshot(survey.id, min_responses=2)
@@ -193,6 +565,74 @@ class ServiceTests(unittest.TestCase):
         with self.assertRaises(ConflictError):
             publishing.set_public_url(analyst, new_version.id, "rapport-3")
 
+    def test_us22_replacement_chain_redirects_in_one_hop(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        self.aggregations.build_snapshot(survey.id, min_responses=0)
+        analyst = self.auth.verify_email(self.auth.register("chain-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        publishing = PublishingService(self.stores.responses)
+        versions = [publishing.publish(analyst, template_id=template.id, visibility="public") for _ in range(4)]
+        for index, version in enumerate(versions[:3]):
+            publishing.set_public_url(analyst, version.id, f"kedja-{index}")
+        publishing.replace(analyst, versions[0].id, versions[1].id)
+        publishing.replace(analyst, versions[1].id, versions[2].id)
+        publishing.replace(analyst, versions[2].id, versions[3].id)
+        self.assertEqual(self.stores.responses.get_report_redirect("/reports/kedja-0"), "/reports/kedja-2")
+        publishing.set_public_url(analyst, versions[3].id, "kedja-3")
+        for index in range(3):
+            self.assertEqual(self.stores.responses.get_report_redirect(f"/reports/kedja-{index}"), "/reports/kedja-3")
+            self.assertEqual(publishing.resolve_public_url(versions[index].id), "/reports/kedja-3")
+        with self.assertRaises(ConflictError):
+            publishing.replace(analyst, versions[3].id, versions[0].id)
+        self.stores.responses.get_report_version = None
+        self.assertEqual(self.public_site.read_report("/reports/kedja-0"), {"redirect": "/reports/kedja-3"})
+
+    def test_us22_published_version_pins_snapshot_history(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "$antal_respondenter svar"}])
+        self.aggregations.build_snapshot(survey.id, min_responses=0)
+        analyst = self.auth.verify_email(self.auth.register("pin-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        publishing = PublishingService(self.stores.responses)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public", pin_snapshot=True)
+        publishing.set_public_url(analyst, version.id, "pinned")
+        aggregations = AggregationService(self.stores.responses, history_limit=1)
+        for index in range(3):
+            parent = self.auth.verify_email(self.auth.register(f"pin{index}@example.com").verification_token)
+            self.responses.submit_response(parent, survey.id, {"q1": 3})
+            if index:
+                aggregations.build_snapshot(survey.id, min_responses=0)
+        history = [snapshot.data_version_hash for snapshot in aggregations.list_history(survey.id)]
+        self.assertEqual(len(history), 3)
+        aggregations.prune_history([survey.id])
+        history = [snapshot.data_version_hash for snapshot in aggregations.list_history(survey.id)]
+        live = self.stores.responses.get_aggregation(survey.id)
+        self.assertEqual(history, [version.data_version_hash, live.data_version_hash])
+        payload = self.public_site.read_report("/reports/pinned", kommun="Lund")["payload"]
+        self.assertEqual(payload["data_version_hash"], version.data_version_hash)
+        self.assertEqual(payload["blocks"][0]["content"], "0 svar")
+
+    def test_pinned_history_is_not_overwritten_by_a_new_min_responses(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "chart", "question": "q1"}])
+        for index, answer in enumerate([1, 2]):
+            parent = self.auth.verify_email(self.auth.register(f"immutable{index}@example.com").verification_token)
+            self.responses.submit_response(parent, survey.id, {"q1": answer})
+        self.aggregations.build_snapshot(survey.id, min_responses=2)
+        analyst = self.auth.verify_email(self.auth.register("immutable-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        publishing = PublishingService(self.stores.responses)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public", pin_snapshot=True)
+        publishing.set_public_url(analyst, version.id, "immutabel")
+        before = self.public_site.read_report("/reports/immutabel", kommun="Lund")["payload"]
+        self.aggregations.build_snapshot(survey.id, min_responses=1)
+        self.assertEqual(self.stores.responses.get_aggregation(survey.id).data_version_hash, version.data_version_hash)
+        pinned = self.stores.responses.get_aggregation_version(survey.id, version.data_version_hash)
+        self.assertEqual(pinned.min_responses, 2)
+        self.assertEqual(self.public_site.read_report("/reports/immutabel", kommun="Lund")["payload"], before)
+        self.assertIn(MASKED_VALUE, before["blocks"][0]["series"])
+
     def test_public_site_news_and_library(self):
         item = self.public_site.add_news_item("Nyhet", "Innehåll")
         self.assertEqual(item.title, "Nyhet")
@@ -209,6 +649,84 @@ class ServiceTests(unittest.TestCase):
         library = self.public_site.list_public_reports()
         self.assertEqual(library[0]["canonical_url"], "/reports/publik-1")
 
+    def test_public_site_library_search_filters_and_pages(self):
+        survey = self.surveys.create_survey({"title": "Skolenkät", "questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        self.aggregations.build_snapshot(survey.id, min_responses=0)
+        analyst = self.auth.verify_email(self.auth.register("search-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        publishing = PublishingService(self.stores.responses)
+        versions = []
+        for index, title in enumerate(["Frånvaro", "Sömn och vila", "Frånvaro i skolan"]):
+            version = publishing.publish(analyst, template_id=template.id, visibility="public", title=title)
+            versions.append(publishing.set_public_url(analyst, version.id, f"bibliotek-{index}"))
+        found = self.public_site.search_public_reports("frånv", limit=1)
+        self.assertEqual([entry["title"] for entry in found["reports"]], ["Frånvaro i skolan"])
+        found = self.public_site.search_public_reports("frånv", cursor=found["next_cursor"], limit=1)
+        self.assertEqual(([entry["title"] for entry in found["reports"]], found["next_cursor"]), (["Frånvaro"], None))
+        self.assertEqual(len(self.public_site.search_public_reports("skolenkät")["reports"]), 3)
+        self.assertEqual(self.public_site.search_public_reports(kommun="Lund")["reports"], [])
+        parent = self.auth.verify_email(self.auth.register("search-parent@example.com").verification_token)
+        BaseProfileService(self.stores.pii).ensure_base_profile(parent, "Lund")
+        self.responses.submit_response(parent, survey.id, {"q1": 3})
+        self.assertEqual(len(self.public_site.search_public_reports("lund")["reports"]), 3)
+        publishing.replace(analyst, versions[0].id, versions[2].id)
+        self.assertEqual(
+            [entry["canonical_url"] for entry in self.public_site.search_public_reports("frånvaro")["reports"]],
+            ["/reports/bibliotek-2"],
+        )
+        with self.assertRaises(ValidationError):
+            self.public_site.search_public_reports(cursor="inte-en-cursor")
+
+    def test_public_site_library_sees_changes_made_by_other_processes(self):
+        survey = self.surveys.create_survey({"title": "Trivselenkät", "questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        self.aggregations.build_snapshot(survey.id, min_responses=0)
+        self.assertEqual(self.public_site.search_public_reports("trivsel")["reports"], [])
+        index = ReportLibraryService(self.stores.responses).index()
+        self.assertIs(ReportLibraryService(self.stores.responses).index(), index)
+        store = self.stores.responses
+        version = store.add_report_version(
+            ReportVersion(
+                id=store.next_id("report_version"),
+                template_id=template.id,
+                visibility="public",
+                published_state="published",
+                canonical_url="/reports/trivsel",
+                title="Trivsel",
+            )
+        )
+        found = self.public_site.search_public_reports("trivsel")["reports"]
+        self.assertEqual([(entry["canonical_url"], entry["kommuner"]) for entry in found], [("/reports/trivsel", [])])
+        store.upsert_aggregation(
+            AggregationSnapshot(survey.id, "annan-process", {"kommuner": {"Lund": {"total": 1}}}, 0)
+        )
+        self.assertEqual(self.public_site.search_public_reports(kommun="Lund")["reports"][0]["title"], "Trivsel")
+        store.update_report_version(version.id, replaced_by=version.id + 1)
+        self.assertEqual(self.public_site.search_public_reports("trivsel")["reports"], [])
+
+    def test_public_site_library_hides_kommuner_below_min_responses(self):
+        survey = self.surveys.create_survey({"title": "Fritidsenkät", "questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        for index, kommun in enumerate(["Lund", "Lund", "Umeå"]):
+            parent = self.auth.verify_email(self.auth.register(f"kommuner{index}@example.com").verification_token)
+            BaseProfileService(self.stores.pii).ensure_base_profile(parent, kommun)
+            self.responses.submit_response(parent, survey.id, {"q1": 3})
+        self.aggregations.build_snapshot(survey.id, min_responses=2)
+        analyst = self.auth.verify_email(self.auth.register("kommuner-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        publishing = PublishingService(self.stores.responses)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, version.id, "fritid")
+        found = self.public_site.search_public_reports("fritid")["reports"]
+        self.assertEqual([entry["kommuner"] for entry in found], [["Lund"]])
+        self.assertEqual(self.public_site.search_public_reports(kommun="Umeå")["reports"], [])
+        parent = self.auth.verify_email(self.auth.register("kommuner3@example.com").verification_token)
+        BaseProfileService(self.stores.pii).ensure_base_profile(parent, "Umeå")
+        self.responses.submit_response(parent, survey.id, {"q1": 3})
+        found = self.public_site.search_public_reports(kommun="Umeå")["reports"]
+        self.assertEqual([entry["kommuner"] for entry in found], [["Lund", "Umeå"]])
+
     def test_public_site_report_reader_uses_kommun_fallback(self):
         survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
         template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej $kommun"}])
@@ -222,6 +740,68 @@ class ServiceTests(unittest.TestCase):
         BaseProfileService(self.stores.pii).ensure_base_profile(parent, "Kommun X", ["skola"])
         response = self.public_site.read_report("/reports/publik-2", viewer=parent)
         self.assertIn("Kommun X", json.dumps(response["payload"]))
+
+    def test_public_site_report_payload_cache(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "$antal_respondenter svar"}])
+        self.aggregations.build_snapshot(survey.id, min_responses=1)
+        analyst = self.auth.verify_email(self.auth.register("cache-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        publishing = PublishingService(self.stores.responses)
+        version = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, version.id, "cachad")
+        first = self.public_site.read_report("/reports/cachad", kommun="Lund")["payload"]
+        self.assertIs(self.public_site.read_report("/reports/cachad", kommun="Lund")["payload"], first)
+        self.assertEqual(self.public_site.report_cache_stats()["hits"], 1)
+        response = self.responses.submit_response(analyst, survey.id, {"q1": 2}, {"free": "Trött"})
+        self.assertEqual(self.public_site.report_cache_stats()["size"], 0)
+        updated = self.public_site.read_report("/reports/cachad", kommun="Lund")["payload"]
+        self.assertEqual(updated["blocks"][0]["content"], "1 svar")
+        self.assertEqual(updated["curated_texts_url"], "/reports/cachad/texts")
+        self.assertEqual(self.public_site.read_report_texts("/reports/cachad")["texts"], ["Trött"])
+        ModerationService(self.stores.responses, self.stores.pii).review_text(response.id, analyst, "hide")
+        self.assertIs(self.public_site.read_report("/reports/cachad", kommun="Lund")["payload"], updated)
+        hidden = self.public_site.read_report_texts("/reports/cachad")
+        self.assertEqual(hidden["texts"], [])
+        unchanged = self.public_site.read_report_texts("/reports/cachad", if_none_match=hidden["etag"])
+        self.assertIn("not_modified", unchanged)
+        review = self.stores.responses.get_text_review_for_response(response.id)
+        self.stores.responses.update_text_review(review.id, status="reviewed")
+        self.stores.responses.bump_text_revision(survey.id)
+        shown = self.public_site.read_report_texts("/reports/cachad", if_none_match=hidden["etag"])
+        self.assertEqual(shown["texts"], ["Trött"])
+        etag = self.public_site.read_report("/reports/cachad", kommun="Lund")["etag"]
+        self.aggregations.build_snapshot(survey.id, min_responses=10)
+        masked = self.public_site.read_report("/reports/cachad", kommun="Lund", if_none_match=etag)
+        self.assertNotIn("not_modified", masked)
+        self.assertEqual(masked["payload"]["metrics"]["total"], "X")
+
+    def test_public_site_resolves_report_in_one_lookup(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej $kommun"}])
+        snapshot = self.aggregations.build_snapshot(survey.id, min_responses=1)
+        analyst = self.auth.verify_email(self.auth.register("resolve-analyst@example.com").verification_token)
+        analyst = self.stores.pii.update_user(analyst.id, role="analyst")
+        publishing = PublishingService(self.stores.responses)
+        old = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, old.id, "gammal")
+        new = publishing.publish(analyst, template_id=template.id, visibility="public")
+        publishing.set_public_url(analyst, new.id, "ny")
+        publishing.replace(analyst, old.id, new.id)
+        resolved = self.stores.responses.resolve_report("/reports/ny")
+        self.assertEqual((resolved.version.id, resolved.template, resolved.snapshot), (new.id, template, snapshot))
+        self.assertIsNone(self.stores.responses.resolve_report("/reports/ny", with_snapshot=False).snapshot)
+        self.assertEqual(self.stores.responses.resolve_report("/reports/gammal").replacement_url, "/reports/ny")
+        self.assertIsNone(self.stores.responses.resolve_report("/reports/saknas"))
+        for name in ("get_report_version_by_url", "get_report_version", "get_report_template", "get_aggregation"):
+            setattr(self.stores.responses, name, None)
+        redirect = self.public_site.read_report("/reports/gammal", kommun="Lund")
+        self.assertEqual(redirect, {"redirect": "/reports/ny?kommun=Lund"})
+        redirect = self.public_site.read_report("/reports/gammal", kommun="Lund\r\nSet-Cookie: x=1")
+        self.assertEqual(redirect, {"redirect": "/reports/ny?kommun=Lund%0D%0ASet-Cookie%3A+x%3D1"})
+        payload = self.public_site.read_report("/reports/ny", kommun="Lund")["payload"]
+        self.assertEqual(payload["blocks"][0]["content"], "Hej Lund")
+
     def test_us08_offer_text_and_matching(self):
         text = self.network.offer_text(3, "kommun A")
         self.assertIn("3", text)
@@ -289,11 +869,71 @@ class ServiceTests(unittest.TestCase):
         response_hidden = self.responses.submit_response(other, survey.id, {"q": 2}, {"free": "dold"})
         moderation_service.review_text(response_id=response.id, curator=curator, status="reviewed")
         moderation_service.review_text(response_id=response_hidden.id, curator=curator, status="hide")
-        curated_texts = self.stores.responses.list_public_texts(["reviewed", "unreviewed", "highlight"])
-        payload = self.reports.build_report_payload(template, snapshot, kommun="Test", text_entries=curated_texts)
-        self.assertNotIn("raw_text_fields", json.dumps(payload))
-        self.assertIn("raw", json.dumps(payload))
-        self.assertNotIn("dold", json.dumps(payload))
+        payload = self.reports.build_report_payload(template, snapshot, kommun="Test", texts_url="/reports/t/texts")
+        self.assertNotIn("raw", json.dumps(payload))
+        texts = CuratedTextService(self.stores.responses).page(survey.id)
+        self.assertEqual(texts["texts"], ["raw"])
+        self.assertNotIn("dold", json.dumps(texts))
+
+    def test_us15_top_terms_follow_review_status(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        result = self.auth.register("terms@example.com")
+        curator = self.stores.pii.update_user(result.user.id, verified=True, role="analyst")
+        moderation_service = ModerationService(self.stores.responses, self.stores.pii)
+        terms = TextTermService(self.stores.responses)
+        first = self.responses.submit_response(curator, survey.id, {"q1": 1}, {"free": "Läxor och läxor igen"})
+        self.assertEqual(terms.top_terms(survey.id, k=1), [{"term": "läxor", "count": 2}])
+        other = self.auth.verify_email(self.auth.register("terms2@example.com").verification_token)
+        self.responses.submit_response(other, survey.id, {"q1": 2}, {"free": "Skolmat, läxor och skolmat"})
+        self.assertEqual(
+            terms.top_terms(survey.id, k=2),
+            [{"term": "läxor", "count": 3}, {"term": "skolmat", "count": 2}],
+        )
+        moderation_service.review_text(first.id, curator, "hide")
+        self.assertEqual(terms.top_terms(survey.id, k=1), [{"term": "skolmat", "count": 2}])
+        moderation_service.review_text(first.id, curator, "highlight")
+        self.assertEqual(terms.top_terms(survey.id, k=1), [{"term": "läxor", "count": 3}])
+
+    def test_us15_curated_texts_scoped_and_paginated(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        other_survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        template = self.reports.create_template(survey.id, [{"type": "text", "content": "Hej"}])
+        result = self.auth.register("feed-curator@example.com")
+        curator = self.stores.pii.update_user(result.user.id, verified=True, role="analyst")
+        moderation_service = ModerationService(self.stores.responses, self.stores.pii)
+        responses = []
+        for index in range(4):
+            user = self.auth.verify_email(self.auth.register(f"feed{index}@example.com").verification_token)
+            fields = {"a": f"svar {index}a", "b": f"svar {index}b"} if index == 0 else {"a": f"svar {index}"}
+            responses.append(self.responses.submit_response(user, survey.id, {"q1": 1}, fields))
+        outsider = self.auth.verify_email(self.auth.register("feed-other@example.com").verification_token)
+        self.responses.submit_response(outsider, other_survey.id, {"q1": 1}, {"a": "annan enkät"})
+        moderation_service.review_text(responses[2].id, curator, "highlight")
+        moderation_service.review_text(responses[1].id, curator, "hide")
+        self.aggregations.build_snapshot(survey.id, min_responses=1)
+        publishing = PublishingService(self.stores.responses)
+        version = publishing.publish(curator, template_id=template.id, visibility="public")
+        publishing.set_public_url(curator, version.id, "flode")
+        payload = self.public_site.read_report("/reports/flode", kommun="Lund")["payload"]
+        self.assertEqual(payload["curated_texts_url"], "/reports/flode/texts")
+        everything = self.public_site.read_report_texts("/reports/flode")
+        self.assertEqual((len(everything["texts"]), everything["next_cursor"]), (4, None))
+        pages = []
+        cursor = None
+        while True:
+            page = self.public_site.read_report_texts("/reports/flode", cursor=cursor, limit=2)
+            pages.append(page["texts"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(pages, [["svar 2", "svar 0a"], ["svar 0b", "svar 3"]])
+        moderation_service.review_text(responses[3].id, curator, "highlight")
+        first = self.public_site.read_report_texts("/reports/flode", limit=2)
+        self.assertEqual(first["texts"], ["svar 2", "svar 3"])
+        with self.assertRaises(ValidationError):
+            self.public_site.read_report_texts("/reports/flode", cursor="inte-en-cursor")
+        with self.assertRaises(ValidationError):
+            self.public_site.read_report_texts("/reports/flode", limit=500)
 
     def test_us19_role_change_audit(self):
         admin = self.auth.verify_email(self.auth.register("admin@example.com").verification_token)
@@ -0,0 +1,73 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.security import RateLimiter
+from backend.services import AggregationService, AuthService, BaseProfileService, ResponseService, SurveyService
+from backend.storage import InMemoryStores
+from backend.workers import AggregationRecomputeWorker
+
+
+class AggregationRecomputeWorkerTests(unittest.TestCase):
+    def setUp(self):
+        self.stores = InMemoryStores()
+        self.auth = AuthService(self.stores.pii, RateLimiter())
+        self.surveys = SurveyService(self.stores.responses)
+        self.responses = ResponseService(self.stores.responses, self.stores.pii)
+        self.aggregations = AggregationService(self.stores.responses)
+
+    def _seed(self, survey, count, prefix):
+        base_service = BaseProfileService(self.stores.pii)
+        for index in range(count):
+            user = self.auth.verify_email(self.auth.register(f"{prefix}{index}@example.com").verification_token)
+            base_service.ensure_base_profile(user, ["Lund", "Umeå", "Malmö"][index % 3])
+            answers = {"q1": index % 5 + 1, "q2": ["a", "b"][: index % 3]}
+            self.responses.submit_response(user, survey.id, answers)
+
+    def test_chunked_recompute_matches_inline_snapshot(self):
+        schema = {
+            "questions": [{"type": "scale"}, {"type": "multichoice", "options": ["a", "b"]}],
+            "crosstabs": [["q1", "q2"]],
+        }
+        first = self.surveys.create_survey(schema)
+        second = self.surveys.create_survey(schema)
+        self._seed(first, 23, "first")
+        self._seed(second, 7, "second")
+        expected = {
+            survey.id: self.aggregations.compute_snapshot(survey.id, survey.min_responses_default)
+            for survey in (first, second)
+        }
+        self.stores.responses._aggregations.clear()
+        worker = AggregationRecomputeWorker(self.stores.responses, chunk_size=4)
+        with ThreadPoolExecutor(max_workers=2, **worker.pool_options()) as pool:
+            snapshots = worker.recompute_with(pool, [first, second])
+        for snapshot in snapshots:
+            self.assertEqual(snapshot, expected[snapshot.survey_id])
+            self.assertEqual(self.stores.responses.get_aggregation(snapshot.survey_id), snapshot)
+
+    def test_process_pool_recompute(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        self._seed(survey, 5, "process")
+        expected = self.aggregations.compute_snapshot(survey.id, survey.min_responses_default)
+        snapshots = AggregationRecomputeWorker(self.stores.responses, max_workers=2, chunk_size=2).recompute_all()
+        self.assertEqual(snapshots, [expected])
+
+    def test_recompute_keeps_submissions_made_while_chunks_aggregate(self):
+        survey = self.surveys.create_survey({"questions": [{"type": "scale"}]})
+        self._seed(survey, 5, "before")
+        worker = AggregationRecomputeWorker(self.stores.responses, chunk_size=2)
+        chunk_bounds = self.stores.responses.response_chunk_bounds
+
+        def bounds_then_submit(survey_id, chunk_size):
+            bounds = chunk_bounds(survey_id, chunk_size)
+            self._seed(survey, 1, "during")
+            return bounds
+
+        self.stores.responses.response_chunk_bounds = bounds_then_submit
+        with ThreadPoolExecutor(max_workers=2, **worker.pool_options()) as pool:
+            (snapshot,) = worker.recompute_with(pool, [survey])
+        self.assertEqual(snapshot.metrics["total"], 6)
+        self.assertEqual(snapshot, self.aggregations.compute_snapshot(survey.id, survey.min_responses_default))
+
+
+if __name__ == "__main__":
+    unittest.main()